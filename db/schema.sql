@@ -77,4 +77,14 @@ CREATE TABLE industry_rules (
   qualification_questions TEXT,
   scoring_rules TEXT,
   enrichment_notes TEXT
-);
\ No newline at end of file
+);
+
+CREATE UNIQUE INDEX uq_qualified_leads_raw_lead_id ON qualified_leads (raw_lead_id);
+CREATE INDEX ix_qualified_leads_industry_category ON qualified_leads (industry, score_category);
+CREATE INDEX ix_qualified_leads_email ON qualified_leads (email);
+CREATE INDEX ix_qualified_leads_phone ON qualified_leads (phone);
+
+CREATE INDEX ix_delivered_leads_client_delivered_at ON delivered_leads (business_client_id, delivered_at);
+CREATE UNIQUE INDEX uq_delivered_leads_lead_client_method ON delivered_leads (qualified_lead_id, business_client_id, delivery_method);
+
+CREATE INDEX ix_payments_client_status ON payments (business_client_id, payment_status);
@@ -1,24 +1,24 @@
 import json
 import sys
-from datetime import datetime, timedelta
+from datetime import datetime
 from sqlalchemy import select, func
 from lead_generation_app.database.database import get_session
-from lead_generation_app.database.models import BusinessClient, Payment, DeliveredLead, QualifiedLead, OptOut
+from lead_generation_app.database.models import BusinessClient, Payment, OptOut, ScheduleState
+from lead_generation_app.database.usage import month_usage, rebuild_usage
 from lead_generation_app.payments import update_subscription
 from lead_generation_app.metrics import get_metrics
+from lead_generation_app.delivery.suppression import note_opt_out
 
 
 def _clients_list():
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start = datetime(now.year, now.month, 1)
-        end = start + timedelta(days=31)
         rows = s.execute(select(BusinessClient)).scalars().all()
+        usage = month_usage(s)
         out = []
         for c in rows:
             paid = s.execute(select(func.count(Payment.id)).where(Payment.business_client_id == c.id).where(Payment.payment_status.in_( ["paid","success"] ))).scalar_one()
-            delivered = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == c.id).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
+            delivered = usage.get(c.id, (0, 0))[0]
             out.append({"id": c.id, "name": c.business_name, "plan": c.subscription_plan, "cap_used": int(delivered), "next_billing_date": (c.next_billing_date.isoformat() if c.next_billing_date else None), "payments": int(paid)})
         print(json.dumps(out))
     finally:
@@ -49,11 +49,30 @@ def _optout_add(kind, value):
         row = OptOut(method=kind, value=value, created_at=datetime.utcnow())
         s.add(row)
         s.commit()
+        note_opt_out(kind, value)
         print(json.dumps({"added": True}))
     finally:
         s.close()
 
 
+def _usage_rebuild(month=None):
+    m = datetime.strptime(month, "%Y-%m") if month else None
+    print(json.dumps({"rows": rebuild_usage(month=m)}))
+
+
+def _iso(dt):
+    return dt.isoformat() if dt else None
+
+
+def _schedules_list():
+    s = get_session()
+    try:
+        rows = s.execute(select(ScheduleState).order_by(ScheduleState.name)).scalars().all()
+        print(json.dumps([{"name": r.name, "last_run_at": _iso(r.last_run_at), "next_run_at": _iso(r.next_run_at), "inflight_since": _iso(r.inflight_since), "pending": bool(r.pending), "last_finished_at": _iso(r.last_finished_at), "last_status": r.last_status, "last_error": r.last_error} for r in rows]))
+    finally:
+        s.close()
+
+
 def main():
     try:
         import click
@@ -69,6 +88,18 @@ def main():
                 print("usage: admin_cli.py clients list | clients update <client_id> <plan>")
         elif cmd == "metrics":
             _metrics_show()
+        elif cmd == "usage":
+            sub = (sys.argv[2:] + [""])[:1][0]
+            if sub == "rebuild":
+                _usage_rebuild((sys.argv[3:] + [None])[0])
+            else:
+                print("usage: admin_cli.py usage rebuild [YYYY-MM]")
+        elif cmd == "schedules":
+            sub = (sys.argv[2:] + [""])[:1][0]
+            if sub == "list":
+                _schedules_list()
+            else:
+                print("usage: admin_cli.py schedules list")
         elif cmd == "optout":
             sub = (sys.argv[2:] + [""])[:1][0]
             if sub == "list":
@@ -78,7 +109,7 @@ def main():
             else:
                 print("usage: admin_cli.py optout list <type> | optout add <type> <value>")
         else:
-            print("usage: admin_cli.py clients|metrics|optout ...")
+            print("usage: admin_cli.py clients|metrics|optout|schedules|usage ...")
         return
 
     @click.group()
@@ -107,6 +138,23 @@ def main():
     def metrics_show():
         _metrics_show()
 
+    @cli.group()
+    def usage():
+        pass
+
+    @usage.command("rebuild")
+    @click.argument("month", required=False)
+    def usage_rebuild(month):
+        _usage_rebuild(month)
+
+    @cli.group()
+    def schedules():
+        pass
+
+    @schedules.command("list")
+    def schedules_list():
+        _schedules_list()
+
     @cli.group()
     def optout():
         pass
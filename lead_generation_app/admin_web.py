@@ -1,5 +1,7 @@
 import os
 import logging
+import io
+import csv
 import json
 import base64
 import hmac
@@ -14,11 +16,10 @@ from lead_generation_app.database.database import get_session, init_db
 from lead_generation_app.database.models import BusinessClient, Payment, DeliveredLead, QualifiedLead, OptOut, Bounce, LeadSource, LoginUser
 from lead_generation_app.payments import update_subscription
 from lead_generation_app.payments import is_client_active
-from lead_generation_app.analytics import (
-    lead_to_qualified_rate_by_platform,
-    qualified_to_delivered_rate_by_client_platform,
-    delivered_opened_bounced_rates_by_client_platform,
-)
+from lead_generation_app.entitlements import get_entitlements, invalidate as invalidate_entitlements
+from lead_generation_app.database.usage import month_usage
+from lead_generation_app.delivery.suppression import note_opt_out
+from lead_generation_app.analytics import get_analytics
 from lead_generation_app.config.pricing import BASE_PLANS
 
 app = Flask(__name__, template_folder=os.path.join(os.path.dirname(__file__), 'templates'))
@@ -75,11 +76,6 @@ def _init():
     with app.app_context():
         init_db()
 
-def _month_window(now):
-    start = datetime(now.year, now.month, 1)
-    end = start + timedelta(days=31)
-    return start, end
-
 @app.route('/')
 def home():
     return redirect(url_for('dashboard'))
@@ -110,50 +106,59 @@ def login():
 def dashboard():
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start, end = _month_window(now)
         clients = s.execute(select(BusinessClient)).scalars().all()
+        usage = month_usage(s)
+        bounces = int(s.execute(select(func.count(Bounce.id))).scalar_one())
         rows = []
         for c in clients:
-            delivered = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == c.id).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
-            opens = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == c.id).where(DeliveredLead.opened_status.is_(True)).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
-            bounces = s.execute(select(func.count(Bounce.id))).scalar_one()
-            rows.append({'id': c.id, 'name': c.business_name, 'plan': c.subscription_plan, 'cap_used': int(delivered), 'opens': int(opens), 'bounces': int(bounces)})
+            delivered, opens = usage.get(c.id, (0, 0))
+            rows.append({'id': c.id, 'name': c.business_name, 'plan': c.subscription_plan, 'cap_used': delivered, 'opens': opens, 'bounces': bounces})
         return render_template('index.html', clients=rows)
     finally:
         s.close()
 
+def _client_filters(q='', plan=''):
+    """WHERE clauses for the client list: not deleted, name contains q, plan equals plan."""
+    filters = [BusinessClient.is_deleted.is_(False)]
+    if q:
+        pattern = '%' + q.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+        filters.append(BusinessClient.business_name.ilike(pattern, escape='\\'))
+    if plan:
+        filters.append(func.lower(BusinessClient.subscription_plan) == plan)
+    return filters
+
 @app.route('/admin/clients')
 @login_required
 def clients():
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start, end = _month_window(now)
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 25, type=int)
+        after_id = request.args.get('after_id', type=int)
         page = max(1, page)
         per_page = max(1, min(100, per_page))
-        offset = (page - 1) * per_page
-
-        total_query = select(func.count(BusinessClient.id)).where(BusinessClient.is_deleted.is_(False))
-        total_clients = s.execute(total_query).scalar_one()
-        clients_query = select(BusinessClient).where(BusinessClient.is_deleted.is_(False))
-        clients_query = clients_query.offset(offset).limit(per_page)
-        rows = s.execute(clients_query).scalars().all()
         q = (request.args.get('q') or '').strip().lower()
         plan = (request.args.get('plan') or '').strip().lower()
+
+        filters = _client_filters(q, plan)
+        total_clients = s.execute(select(func.count(BusinessClient.id)).where(*filters)).scalar_one()
+        clients_query = select(BusinessClient).where(*filters).order_by(BusinessClient.id).limit(per_page)
+        if after_id is not None:
+            # Keyset pages seek past the last id seen instead of counting
+            # through every earlier row with OFFSET.
+            clients_query = clients_query.where(BusinessClient.id > after_id)
+        else:
+            clients_query = clients_query.offset((page - 1) * per_page)
+        rows = s.execute(clients_query).scalars().all()
+        usage = month_usage(s, [c.id for c in rows])
         data = []
         for c in rows:
-            if q and q not in (c.business_name or '').lower():
-                continue
-            if plan and (c.subscription_plan or '').lower() != plan:
-                continue
-            delivered = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == c.id).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
+            delivered = usage.get(c.id, (0, 0))[0]
             data.append({'id': c.id, 'name': c.business_name, 'plan': c.subscription_plan, 'cap_used': int(delivered), 'next_billing_date': (c.next_billing_date.isoformat() if c.next_billing_date else None)})
+        next_after_id = rows[-1].id if len(rows) == per_page else None
         if request.headers.get('HX-Request'):
             return render_template('clients_body.html', clients=data)
-        return render_template('clients.html', clients=data, q=q, plan=plan, page=page, per_page=per_page, total_clients=total_clients, total_pages=(total_clients + per_page - 1) // per_page)
+        return render_template('clients.html', clients=data, q=q, plan=plan, page=page, per_page=per_page, after_id=after_id, next_after_id=next_after_id, total_clients=total_clients, total_pages=(total_clients + per_page - 1) // per_page)
     finally:
         s.close()
 
@@ -162,13 +167,10 @@ def clients():
 def client_detail(client_id):
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start, end = _month_window(now)
         c = s.execute(select(BusinessClient).where(BusinessClient.id == client_id)).scalars().first()
         if not c:
             return redirect(url_for('clients'))
-        delivered = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == client_id).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
-        opens = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == client_id).where(DeliveredLead.opened_status.is_(True)).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
+        delivered, opens = month_usage(s, [client_id]).get(client_id, (0, 0))
         bounces = s.execute(select(func.count(Bounce.id))).scalar_one()
         optouts_email = s.execute(select(func.count(OptOut.id)).where(OptOut.method == 'email')).scalar_one()
         optouts_wa = s.execute(select(func.count(OptOut.id)).where(OptOut.method == 'whatsapp')).scalar_one()
@@ -193,6 +195,7 @@ def add_optout():
         row = OptOut(method=method, value=value, created_at=datetime.utcnow())
         s.add(row)
         s.commit()
+        note_opt_out(method, value)
         return redirect(url_for('clients'))
     finally:
         s.close()
@@ -208,9 +211,8 @@ def analytics():
         s.close()
     client_id = request.args.get('client_id')
     platform = (request.args.get('platform') or '').strip().lower()
-    ltq = lead_to_qualified_rate_by_platform()
-    qtd = qualified_to_delivered_rate_by_client_platform()
-    dob = delivered_opened_bounced_rates_by_client_platform()
+    aggregates, computed_at = get_analytics()
+    ltq, qtd, dob = aggregates['ltq'], aggregates['qtd'], aggregates['dob']
     client_id_int = int(client_id) if client_id and client_id.isdigit() else None
     data = {
         'ltq': ltq,
@@ -238,6 +240,7 @@ def analytics():
         'clients': clients,
         'platforms': platforms,
         'metrics': data,
+        'computed_at': computed_at,
     }
     if request.headers.get('HX-Request'):
         return render_template('analytics_body.html', **ctx)
@@ -247,13 +250,12 @@ def analytics():
 def api_clients_list():
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start, end = _month_window(now)
         rows = s.execute(select(BusinessClient).where(BusinessClient.is_deleted.is_(False))).scalars().all()
+        ents = get_entitlements([c.id for c in rows])
         out = []
+        usage = month_usage(s)
         for c in rows:
-            delivered = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == c.id).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
-            opens = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == c.id).where(DeliveredLead.opened_status.is_(True)).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
+            delivered, opens = usage.get(c.id, (0, 0))
             plan = BASE_PLANS.get(c.subscription_plan) if c.subscription_plan else None
             out.append({
                 'id': c.id,
@@ -267,7 +269,7 @@ def api_clients_list():
                 'plan_discount': (float(plan.get('discount')) if plan else None),
                 'number_of_users': c.number_of_users,
                 'next_billing_date': (c.next_billing_date.isoformat() if c.next_billing_date else None),
-                'active': bool(is_client_active(c.id)),
+                'active': bool(ents.get(c.id, {}).get('active')),
                 'delivered_this_month': int(delivered),
                 'opens_this_month': int(opens),
             })
@@ -280,13 +282,10 @@ def api_clients_list():
 def api_client_detail(client_id):
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start, end = _month_window(now)
         c = s.execute(select(BusinessClient).where(BusinessClient.id == client_id)).scalars().first()
         if not c:
             return Response(json.dumps({'error': 'not_found'}).encode('utf-8'), 404, {'Content-Type': 'application/json'})
-        delivered = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == client_id).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
-        opens = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == client_id).where(DeliveredLead.opened_status.is_(True)).where(DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)).scalar_one()
+        delivered, opens = month_usage(s, [client_id]).get(client_id, (0, 0))
         bounces = s.execute(select(func.count(Bounce.id))).scalar_one()
         optouts_email = s.execute(select(func.count(OptOut.id)).where(OptOut.method == 'email')).scalar_one()
         optouts_wa = s.execute(select(func.count(OptOut.id)).where(OptOut.method == 'whatsapp')).scalar_one()
@@ -314,47 +313,85 @@ def api_client_detail(client_id):
     finally:
         s.close()
 
-@app.route('/admin/api/leads', methods=['GET'])
-def api_leads_list():
+_LEAD_EXPORT_COLUMNS = ('id', 'raw_lead_id', 'name', 'company_name', 'email', 'phone', 'industry', 'score_category', 'qualification_score', 'verified_status', 'summary')
+_LEAD_EXPORT_TYPES = {'json': 'application/json', 'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def _lead_export_dict(row):
+    d = dict(zip(_LEAD_EXPORT_COLUMNS, row))
+    d['verified_status'] = bool(d['verified_status'])
+    d['summary'] = d['summary'] or ''
+    return d
+
+
+def _stream_leads(q, fmt, chunk):
+    """
+    Yield q's rows encoded as a JSON array, NDJSON or CSV, one piece per
+    chunk of rows fetched with yield_per, so memory does not grow with the
+    export. The generator owns its session and closes it when done.
+    """
     s = get_session()
     try:
-        industry = (request.args.get('industry') or '').strip()
-        category = (request.args.get('category') or '').strip().lower()
-        min_score = request.args.get('min_score')
-        limit = request.args.get('limit')
-        offset = request.args.get('offset')
-        q = select(QualifiedLead)
-        if industry:
-            q = q.where(QualifiedLead.industry == industry)
-        if category:
-            q = q.where(QualifiedLead.score_category == category)
-        if min_score and str(min_score).isdigit():
-            q = q.where(QualifiedLead.qualification_score >= int(min_score))
-        if offset and str(offset).isdigit():
-            q = q.offset(int(offset))
-        if limit and str(limit).isdigit():
-            q = q.limit(int(limit))
-        rows = s.execute(q).scalars().all()
-        out = []
-        for r in rows:
-            out.append({
-                'id': r.id,
-                'raw_lead_id': r.raw_lead_id,
-                'name': r.name,
-                'company_name': r.company_name,
-                'email': r.email,
-                'phone': r.phone,
-                'industry': r.industry,
-                'score_category': r.score_category,
-                'qualification_score': r.qualification_score,
-                'verified_status': bool(r.verified_status),
-                'summary': r.summary or '',
-            })
-        body = json.dumps(out).encode('utf-8')
-        return Response(body, 200, {'Content-Type': 'application/json'})
+        result = s.execute(q.execution_options(yield_per=chunk))
+        if fmt == 'csv':
+            buf = io.StringIO()
+            w = csv.writer(buf)
+            w.writerow(_LEAD_EXPORT_COLUMNS)
+            for part in result.partitions():
+                for row in part:
+                    d = _lead_export_dict(row)
+                    w.writerow([d[c] if d[c] is not None else '' for c in _LEAD_EXPORT_COLUMNS])
+                yield buf.getvalue()
+                buf.seek(0)
+                buf.truncate()
+            yield buf.getvalue()
+        elif fmt == 'ndjson':
+            for part in result.partitions():
+                yield ''.join(json.dumps(_lead_export_dict(row)) + '\n' for row in part)
+        else:
+            yield '['
+            sep = ''
+            for part in result.partitions():
+                yield sep + ','.join(json.dumps(_lead_export_dict(row)) for row in part)
+                sep = ','
+            yield ']'
+    except Exception as e:
+        # Headers are already sent; the truncated body is all the client gets.
+        logging.error("{\"event\":\"lead_export_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+        raise
     finally:
         s.close()
 
+
+@app.route('/admin/api/leads', methods=['GET'])
+def api_leads_list():
+    industry = (request.args.get('industry') or '').strip()
+    category = (request.args.get('category') or '').strip().lower()
+    min_score = request.args.get('min_score')
+    limit = request.args.get('limit')
+    offset = request.args.get('offset')
+    after_id = request.args.get('after_id')
+    fmt = (request.args.get('format') or 'json').strip().lower()
+    if fmt not in _LEAD_EXPORT_TYPES:
+        return Response(json.dumps({'error': 'invalid_format'}).encode('utf-8'), 400, {'Content-Type': 'application/json'})
+    default_limit = int(os.getenv('LEADS_API_DEFAULT_LIMIT', '1000'))
+    max_limit = int(os.getenv('LEADS_API_MAX_LIMIT', '100000'))
+    q = select(*(getattr(QualifiedLead, c) for c in _LEAD_EXPORT_COLUMNS)).order_by(QualifiedLead.id)
+    if industry:
+        q = q.where(QualifiedLead.industry == industry)
+    if category:
+        q = q.where(QualifiedLead.score_category == category)
+    if min_score and str(min_score).isdigit():
+        q = q.where(QualifiedLead.qualification_score >= int(min_score))
+    if after_id and str(after_id).isdigit():
+        # Keyset cursor: the next page starts after the last id returned.
+        q = q.where(QualifiedLead.id > int(after_id))
+    elif offset and str(offset).isdigit():
+        q = q.offset(int(offset))
+    q = q.limit(min(int(limit), max_limit) if limit and str(limit).isdigit() else default_limit)
+    chunk = int(os.getenv('LEADS_API_CHUNK', '1000'))
+    return Response(_stream_leads(q, fmt, chunk), 200, {'Content-Type': _LEAD_EXPORT_TYPES[fmt]})
+
 @app.route('/admin/api/clients', methods=['POST'])
 def api_client_create():
     s = get_session()
@@ -424,6 +461,7 @@ def soft_delete_client(client_id):
             except Exception:
                 pass
             s.commit()
+            invalidate_entitlements([client_id])
         return redirect(url_for('clients'))
     finally:
         s.close()
@@ -450,6 +488,7 @@ def api_soft_delete_client(client_id):
         except Exception:
             pass
         s.commit()
+        invalidate_entitlements([client_id])
         
         return jsonify({
             "status": "success",
@@ -488,6 +527,7 @@ def restore_client(client_id):
             c.is_deleted = False
             c.deleted_at = None
             s.commit()
+            invalidate_entitlements([client_id])
         return redirect(url_for('deleted_clients'))
     finally:
         s.close()
@@ -501,6 +541,7 @@ def permanent_delete_client(client_id):
         if c:
             s.delete(c)
             s.commit()
+            invalidate_entitlements([client_id])
         return redirect(url_for('deleted_clients'))
     finally:
         s.close()
@@ -522,6 +563,7 @@ def bulk_soft_delete():
                     c.is_deleted = True
                     c.deleted_at = datetime.utcnow()
             s.commit()
+            invalidate_entitlements([int(i) for i in ids if str(i).isdigit()])
         return redirect(url_for('clients'))
     finally:
         s.close()
@@ -543,6 +585,7 @@ def bulk_restore():
                     c.is_deleted = False
                     c.deleted_at = None
             s.commit()
+            invalidate_entitlements([int(i) for i in ids if str(i).isdigit()])
         return redirect(url_for('deleted_clients'))
     finally:
         s.close()
@@ -563,6 +606,7 @@ def bulk_permanent_delete():
                 if c:
                     s.delete(c)
             s.commit()
+            invalidate_entitlements([int(i) for i in ids if str(i).isdigit()])
         return redirect(url_for('deleted_clients'))
     finally:
         s.close()
@@ -1,25 +1,39 @@
-from collections import defaultdict
+import os
+import json
+import logging
+from datetime import datetime, timedelta
 from lead_generation_app.database.database import get_session
-from lead_generation_app.database.models import RawLead, QualifiedLead, DeliveredLead, LeadSource, BusinessClient, Bounce
-from sqlalchemy import select
+from lead_generation_app.database.models import RawLead, QualifiedLead, DeliveredLead, LeadSource, Bounce, AnalyticsSnapshot
+from sqlalchemy import select, update, insert, func, case, and_
+
+SNAPSHOTS = ("ltq", "qtd", "dob")
+
+
+def _platform():
+    return func.coalesce(LeadSource.platform_type, "")
+
+
+def _qualified_by_platform(s):
+    pf = _platform()
+    return dict(s.execute(
+        select(pf, func.count(QualifiedLead.id))
+        .join(RawLead, QualifiedLead.raw_lead_id == RawLead.id)
+        .join(LeadSource, RawLead.source_id == LeadSource.id)
+        .group_by(pf)
+    ).all())
 
 
 def lead_to_qualified_rate_by_platform():
     s = get_session()
     try:
-        raw = s.execute(select(RawLead.id, LeadSource.platform_type).join(LeadSource, RawLead.source_id == LeadSource.id)).all()
-        q = s.execute(select(QualifiedLead.id, RawLead.id, LeadSource.platform_type).join(RawLead, QualifiedLead.raw_lead_id == RawLead.id).join(LeadSource, RawLead.source_id == LeadSource.id)).all()
-        raw_counts = defaultdict(int)
-        qual_counts = defaultdict(int)
-        for _, pf in raw:
-            raw_counts[pf or ""] += 1
-        for _, _, pf in q:
-            qual_counts[pf or ""] += 1
+        pf = _platform()
+        raw_counts = s.execute(select(pf, func.count(RawLead.id)).join(LeadSource, RawLead.source_id == LeadSource.id).group_by(pf)).all()
+        qual_counts = _qualified_by_platform(s)
         out = {}
-        for pf, rc in raw_counts.items():
-            qc = qual_counts.get(pf, 0)
+        for pf, rc in raw_counts:
+            qc = int(qual_counts.get(pf, 0))
             rate = (qc / rc) if rc else 0.0
-            out[pf] = {"raw": rc, "qualified": qc, "rate": rate}
+            out[pf] = {"raw": int(rc), "qualified": qc, "rate": rate}
         return out
     finally:
         s.close()
@@ -28,20 +42,20 @@ def lead_to_qualified_rate_by_platform():
 def qualified_to_delivered_rate_by_client_platform():
     s = get_session()
     try:
-        qual = s.execute(select(QualifiedLead.id, RawLead.id, LeadSource.platform_type).join(RawLead, QualifiedLead.raw_lead_id == RawLead.id).join(LeadSource, RawLead.source_id == LeadSource.id)).all()
-        qual_by_pf = defaultdict(int)
-        for _, _, pf in qual:
-            qual_by_pf[pf or ""] += 1
-        dl = s.execute(select(DeliveredLead.business_client_id, DeliveredLead.qualified_lead_id, LeadSource.platform_type).join(QualifiedLead, DeliveredLead.qualified_lead_id == QualifiedLead.id).join(RawLead, QualifiedLead.raw_lead_id == RawLead.id).join(LeadSource, RawLead.source_id == LeadSource.id)).all()
-        delivered_by_client_pf = defaultdict(int)
-        for bc_id, _, pf in dl:
-            key = (int(bc_id), pf or "")
-            delivered_by_client_pf[key] += 1
+        qual_by_pf = _qualified_by_platform(s)
+        pf = _platform()
+        dl = s.execute(
+            select(DeliveredLead.business_client_id, pf, func.count(DeliveredLead.id))
+            .join(QualifiedLead, DeliveredLead.qualified_lead_id == QualifiedLead.id)
+            .join(RawLead, QualifiedLead.raw_lead_id == RawLead.id)
+            .join(LeadSource, RawLead.source_id == LeadSource.id)
+            .group_by(DeliveredLead.business_client_id, pf)
+        ).all()
         out = {}
-        for (bc_id, pf), delivered in delivered_by_client_pf.items():
-            denom = qual_by_pf.get(pf, 0)
+        for bc_id, pf, delivered in dl:
+            denom = int(qual_by_pf.get(pf, 0))
             rate = (delivered / denom) if denom else 0.0
-            out.setdefault(bc_id, {})[pf] = {"qualified": denom, "delivered": delivered, "rate": rate}
+            out.setdefault(int(bc_id), {})[pf] = {"qualified": denom, "delivered": int(delivered), "rate": rate}
         return out
     finally:
         s.close()
@@ -50,33 +64,159 @@ def qualified_to_delivered_rate_by_client_platform():
 def delivered_opened_bounced_rates_by_client_platform():
     s = get_session()
     try:
-        rows = s.execute(select(DeliveredLead.id, DeliveredLead.business_client_id, DeliveredLead.opened_status, QualifiedLead.id, QualifiedLead.email, QualifiedLead.phone, DeliveredLead.delivery_method, LeadSource.platform_type).join(QualifiedLead, DeliveredLead.qualified_lead_id == QualifiedLead.id).join(RawLead, QualifiedLead.raw_lead_id == RawLead.id).join(LeadSource, RawLead.source_id == LeadSource.id)).all()
-        delivered = defaultdict(int)
-        opened = defaultdict(int)
-        targets_by_group = defaultdict(set)
-        for dl_id, bc_id, opened_status, qid, email, phone, method, pf in rows:
-            key = (int(bc_id), method or "", pf or "")
-            delivered[key] += 1
-            if opened_status:
-                opened[key] += 1
-            if (method or "") == "email" and email:
-                targets_by_group[key].add(("email", email.lower()))
-            if (method or "") == "whatsapp" and phone:
-                targets_by_group[key].add(("whatsapp", (phone or "").lower()))
-        bounces = s.execute(select(Bounce.method, Bounce.target)).all()
-        bounce_map = defaultdict(int)
-        for method, target in bounces:
-            bounce_map[(method or "", (target or "").lower())] += 1
+        pf = _platform()
+        method = func.coalesce(DeliveredLead.delivery_method, "")
+        joined = lambda q: (
+            q.join(QualifiedLead, DeliveredLead.qualified_lead_id == QualifiedLead.id)
+            .join(RawLead, QualifiedLead.raw_lead_id == RawLead.id)
+            .join(LeadSource, RawLead.source_id == LeadSource.id)
+        )
+        counts = s.execute(joined(
+            select(DeliveredLead.business_client_id, method, pf, func.count(DeliveredLead.id), func.sum(case((DeliveredLead.opened_status.is_(True), 1), else_=0)))
+        ).group_by(DeliveredLead.business_client_id, method, pf)).all()
+        # A group's bounces are the bounces recorded against each distinct
+        # address it delivered to, matched case-insensitively on the method.
+        # Only addresses that ever bounced are collected.
+        target = case(
+            (method == "email", func.lower(QualifiedLead.email)),
+            (method == "whatsapp", func.lower(QualifiedLead.phone)),
+        )
+        targets = joined(
+            select(DeliveredLead.business_client_id.label("bc_id"), method.label("method"), pf.label("pf"), target.label("target"))
+        ).where(target != "").where(target.in_(select(func.lower(Bounce.target)))).distinct().subquery()
+        bounce_counts = (
+            select(func.coalesce(Bounce.method, "").label("method"), func.lower(Bounce.target).label("target"), func.count(Bounce.id).label("n"))
+            .group_by(func.coalesce(Bounce.method, ""), func.lower(Bounce.target))
+            .subquery()
+        )
+        bounced = {
+            (int(bc_id), m, p): int(n)
+            for bc_id, m, p, n in s.execute(
+                select(targets.c.bc_id, targets.c.method, targets.c.pf, func.sum(bounce_counts.c.n))
+                .join(bounce_counts, and_(bounce_counts.c.method == targets.c.method, bounce_counts.c.target == targets.c.target))
+                .group_by(targets.c.bc_id, targets.c.method, targets.c.pf)
+            ).all()
+        }
         out = {}
-        for key, dcount in delivered.items():
-            bc_id, method, pf = key
-            oc = opened.get(key, 0)
-            bc = 0
-            for t in targets_by_group.get(key, set()):
-                bc += bounce_map.get(t, 0)
+        for bc_id, method, pf, dcount, oc in counts:
+            oc = int(oc or 0)
+            bc = bounced.get((int(bc_id), method, pf), 0)
             rate_open = (oc / dcount) if dcount else 0.0
             rate_bounce = (bc / dcount) if dcount else 0.0
-            out.setdefault(bc_id, {}).setdefault(pf, {})[method] = {"delivered": dcount, "opened": oc, "bounced": bc, "open_rate": rate_open, "bounce_rate": rate_bounce}
+            out.setdefault(int(bc_id), {}).setdefault(pf, {})[method] = {"delivered": int(dcount), "opened": oc, "bounced": bc, "open_rate": rate_open, "bounce_rate": rate_bounce}
         return out
     finally:
         s.close()
+
+
+def snapshot_enabled():
+    return os.getenv("ANALYTICS_SNAPSHOT", "0").lower() in ("1", "true", "yes")
+
+
+def mark_stale():
+    """
+    Note that counted data changed. Only the first event after a refresh
+    writes; later ones match no rows.
+    """
+    if not snapshot_enabled():
+        return
+    s = get_session()
+    try:
+        s.execute(update(AnalyticsSnapshot).where(AnalyticsSnapshot.stale_since.is_(None)).values(stale_since=datetime.utcnow()))
+        s.commit()
+    except Exception as e:
+        s.rollback()
+        logging.warning("{\"event\":\"analytics_mark_stale_failed\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+    finally:
+        s.close()
+
+
+def refresh_snapshot():
+    """Recompute all aggregates and store them with their computation time."""
+    started = datetime.utcnow()
+    payloads = {
+        "ltq": lead_to_qualified_rate_by_platform(),
+        "qtd": qualified_to_delivered_rate_by_client_platform(),
+        "dob": delivered_opened_bounced_rates_by_client_platform(),
+    }
+    s = get_session()
+    try:
+        have = set(s.execute(select(AnalyticsSnapshot.name)).scalars().all())
+        missing = [{"name": n} for n in SNAPSHOTS if n not in have]
+        if missing:
+            s.execute(insert(AnalyticsSnapshot), missing)
+        for name, payload in payloads.items():
+            # An event that landed while the aggregates were computed keeps
+            # the snapshot stale.
+            s.execute(
+                update(AnalyticsSnapshot)
+                .where(AnalyticsSnapshot.name == name)
+                .values(
+                    payload_json=json.dumps(payload),
+                    computed_at=started,
+                    stale_since=case((AnalyticsSnapshot.stale_since > started, AnalyticsSnapshot.stale_since), else_=None),
+                )
+            )
+        s.commit()
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
+    logging.info("{\"event\":\"analytics_snapshot_refreshed\",\"ms\":%d}" % int((datetime.utcnow() - started).total_seconds() * 1000))
+    return payloads, started
+
+
+def _decode(name, payload):
+    data = json.loads(payload or "{}")
+    if name == "ltq":
+        return data
+    # JSON object keys are strings; client ids are ints everywhere else.
+    return {int(k): v for k, v in data.items()}
+
+
+def load_snapshot():
+    """Return ({name: aggregates}, computed_at, stale) or None before the first refresh."""
+    s = get_session()
+    try:
+        rows = s.execute(select(AnalyticsSnapshot).where(AnalyticsSnapshot.name.in_(SNAPSHOTS))).scalars().all()
+    finally:
+        s.close()
+    if len(rows) < len(SNAPSHOTS) or any(r.computed_at is None for r in rows):
+        return None
+    return {r.name: _decode(r.name, r.payload_json) for r in rows}, min(r.computed_at for r in rows), any(r.stale_since for r in rows)
+
+
+def refresh_if_stale(min_interval=None):
+    """
+    Refresh when events arrived since the last refresh and that refresh is
+    at least min_interval seconds old. Returns True when it refreshed.
+    """
+    if min_interval is None:
+        min_interval = int(os.getenv("ANALYTICS_REFRESH_SECONDS", "60"))
+    snap = load_snapshot()
+    if snap is not None:
+        _, computed_at, stale = snap
+        if not stale or datetime.utcnow() - computed_at < timedelta(seconds=int(min_interval)):
+            return False
+    refresh_snapshot()
+    return True
+
+
+def get_analytics():
+    """
+    Return ({"ltq", "qtd", "dob"}, computed_at). With ANALYTICS_SNAPSHOT on
+    the aggregates come from the stored snapshot, refreshed here only when
+    stale and older than ANALYTICS_REFRESH_SECONDS; otherwise they are
+    computed now.
+    """
+    if not snapshot_enabled():
+        now = datetime.utcnow()
+        return {
+            "ltq": lead_to_qualified_rate_by_platform(),
+            "qtd": qualified_to_delivered_rate_by_client_platform(),
+            "dob": delivered_opened_bounced_rates_by_client_platform(),
+        }, now
+    refresh_if_stale()
+    data, computed_at, _ = load_snapshot()
+    return data, computed_at
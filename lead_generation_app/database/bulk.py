@@ -0,0 +1,102 @@
+import logging
+from sqlalchemy import select, insert, update
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import QualifiedLead
+
+_CHUNK = 500
+
+
+def _qualified_row(qd):
+    return {
+        "raw_lead_id": qd.get("raw_lead_id"),
+        "name": qd.get("name"),
+        "company_name": qd.get("company_name"),
+        "phone": qd.get("phone"),
+        "whatsapp": None,
+        "email": qd.get("email"),
+        "qualification_score": int(qd.get("qualification_score", 70)),
+        "score_category": qd.get("score_category", "warm"),
+        "industry": qd.get("industry"),
+        "summary": qd.get("summary") or "",
+        "enriched_data_json": qd.get("enriched_data_json") or "{}",
+        "verified_status": bool(qd.get("verified_status", True)),
+    }
+
+
+def _existing_ids(s, raw_ids):
+    out = {}
+    for i in range(0, len(raw_ids), _CHUNK):
+        chunk = raw_ids[i:i + _CHUNK]
+        for rl_id, q_id in s.execute(select(QualifiedLead.raw_lead_id, QualifiedLead.id).where(QualifiedLead.raw_lead_id.in_(chunk))).all():
+            out.setdefault(rl_id, q_id)
+    return out
+
+
+def _insert_stmt(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(QualifiedLead).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(QualifiedLead).on_conflict_do_nothing()
+    return insert(QualifiedLead)
+
+
+def upsert_qualified_leads(qualified_data, session=None, update_existing=False, update_columns=None):
+    """
+    Insert qualified leads whose raw_lead_id is not stored yet and return the
+    qualified lead id for every input row, in input order (None when the row
+    has no raw_lead_id). With update_existing=True rows that already exist
+    are overwritten with the new values in one bulk UPDATE, limited to
+    update_columns when given.
+    """
+    rows = list(qualified_data or [])
+    if not rows:
+        return []
+    s = session or get_session()
+    try:
+        raw_ids = list(dict.fromkeys(qd.get("raw_lead_id") for qd in rows if qd.get("raw_lead_id") is not None))
+        ids = _existing_ids(s, raw_ids)
+        updated = 0
+        if update_existing and ids:
+            changes = {}
+            for qd in rows:
+                rl_id = qd.get("raw_lead_id")
+                if rl_id in ids:
+                    row = _qualified_row(qd)
+                    row.pop("raw_lead_id")
+                    if update_columns is not None:
+                        row = {c: row[c] for c in update_columns}
+                    row["id"] = ids[rl_id]
+                    changes[rl_id] = row
+            if changes:
+                s.execute(update(QualifiedLead), list(changes.values()))
+                updated = len(changes)
+        pending = {}
+        for qd in rows:
+            rl_id = qd.get("raw_lead_id")
+            if rl_id is not None and rl_id not in ids and rl_id not in pending:
+                pending[rl_id] = _qualified_row(qd)
+        if pending:
+            stmt = _insert_stmt(s.get_bind().dialect.name)
+            values = list(pending.values())
+            if s.get_bind().dialect.insert_executemany_returning:
+                res = s.execute(stmt.returning(QualifiedLead.raw_lead_id, QualifiedLead.id), values)
+                for rl_id, q_id in res.all():
+                    ids.setdefault(rl_id, q_id)
+            else:
+                s.execute(stmt, values)
+            missing = [rl_id for rl_id in pending if rl_id not in ids]
+            if missing:
+                ids.update(_existing_ids(s, missing))
+        if session is None:
+            s.commit()
+        logging.info("{\"event\":\"qualified_upsert\",\"input\":%d,\"inserted\":%d,\"updated\":%d}" % (len(rows), len(pending), updated))
+        return [ids.get(qd.get("raw_lead_id")) for qd in rows]
+    except Exception:
+        if session is None:
+            s.rollback()
+        raise
+    finally:
+        if session is None:
+            s.close()
@@ -1,7 +1,7 @@
 ﻿import os
 import logging
 from dotenv import load_dotenv
-from sqlalchemy import create_engine, text
+from sqlalchemy import create_engine, text, inspect
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy.engine import URL
 
@@ -57,12 +57,57 @@ def _ensure_soft_delete_columns(conn):
         conn.execute(text("alter table business_clients add column deleted_at timestamp null"))
 
 
+def _ensure_indexes(eng, metadata):
+    # create_all only adds indexes for new tables; existing tables get them here.
+    # Postgres builds them CONCURRENTLY, which must run outside a transaction.
+    pg = eng.dialect.name == "postgresql"
+    with eng.connect() as conn:
+        if pg:
+            conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        for table in metadata.sorted_tables:
+            for idx in table.indexes:
+                cols = ", ".join(c.name for c in idx.columns)
+                sql = "create %sindex %sif not exists %s on %s (%s)" % ("unique " if idx.unique else "", "concurrently " if pg else "", idx.name, table.name, cols)
+                try:
+                    conn.execute(text(sql))
+                    conn.commit()
+                except Exception as e:
+                    conn.rollback()
+                    if pg:
+                        conn.execute(text("drop index concurrently if exists %s" % idx.name))
+                    logging.warning("{\"event\":\"index_create_failed\",\"index\":\"%s\",\"error\":\"%s\"}" % (idx.name, str(e).splitlines()[0].replace("\"", "'")))
+    logging.info("{\"event\":\"indexes_ensured\"}")
+
+
+def _ensure_trgm_index(eng):
+    # Opt-in GIN trigram index so the admin client search (ILIKE '%q%')
+    # uses an index on Postgres instead of scanning business_clients.
+    if eng.dialect.name != "postgresql" or os.getenv("PG_TRGM_INDEX", "0").lower() not in ("1", "true", "yes"):
+        return
+    with eng.connect() as conn:
+        conn = conn.execution_options(isolation_level="AUTOCOMMIT")
+        try:
+            conn.execute(text("create extension if not exists pg_trgm"))
+            conn.execute(text("create index concurrently if not exists ix_business_clients_name_trgm on business_clients using gin (business_name gin_trgm_ops)"))
+            logging.info("{\"event\":\"trgm_index_ensured\"}")
+        except Exception as e:
+            conn.execute(text("drop index concurrently if exists ix_business_clients_name_trgm"))
+            logging.warning("{\"event\":\"index_create_failed\",\"index\":\"ix_business_clients_name_trgm\",\"error\":\"%s\"}" % str(e).splitlines()[0].replace("\"", "'"))
+
+
 def init_db():
     from .models import Base
 
     eng = get_engine()
     with eng.begin() as conn:
         logging.info("{\"event\":\"db_connection_ok\"}")
+        usage_new = not inspect(conn).has_table("client_usage_monthly")
         Base.metadata.create_all(bind=conn)
         _ensure_soft_delete_columns(conn)
         logging.info("{\"event\":\"tables_ensured\"}")
+    _ensure_indexes(eng, Base.metadata)
+    _ensure_trgm_index(eng)
+    if usage_new:
+        # A fresh rollup starts from whatever delivered_leads already holds.
+        from .usage import rebuild_usage
+        rebuild_usage()
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, Text, Boolean, DateTime, Numeric, ForeignKey
+from sqlalchemy import Column, Integer, Text, Boolean, Date, DateTime, Numeric, ForeignKey, Index
 from sqlalchemy.orm import declarative_base, relationship
 import os
 from flask_login import UserMixin
@@ -45,6 +45,12 @@ class RawLead(Base):
 
 class QualifiedLead(Base):
     __tablename__ = "qualified_leads"
+    __table_args__ = (
+        Index("uq_qualified_leads_raw_lead_id", "raw_lead_id", unique=True),
+        Index("ix_qualified_leads_industry_category", "industry", "score_category"),
+        Index("ix_qualified_leads_email", "email"),
+        Index("ix_qualified_leads_phone", "phone"),
+    )
 
     id = Column(Integer, primary_key=True)
     raw_lead_id = Column(Integer, ForeignKey("raw_leads.id"), nullable=False)
@@ -85,6 +91,10 @@ class BusinessClient(Base):
 
 class DeliveredLead(Base):
     __tablename__ = "delivered_leads"
+    __table_args__ = (
+        Index("ix_delivered_leads_client_delivered_at", "business_client_id", "delivered_at"),
+        Index("uq_delivered_leads_lead_client_method", "qualified_lead_id", "business_client_id", "delivery_method", unique=True),
+    )
 
     id = Column(Integer, primary_key=True)
     qualified_lead_id = Column(Integer, ForeignKey("qualified_leads.id"), nullable=False)
@@ -97,8 +107,36 @@ class DeliveredLead(Base):
     business_client = relationship("BusinessClient", back_populates="delivered_leads")
 
 
+class ClientUsageMonthly(Base):
+    __tablename__ = "client_usage_monthly"
+    __table_args__ = (
+        Index("uq_client_usage_monthly_client_month_industry", "business_client_id", "month", "industry", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    business_client_id = Column(Integer, ForeignKey("business_clients.id"), nullable=False)
+    month = Column(Date, nullable=False)
+    industry = Column(Text, nullable=False, default="")
+    delivered = Column(Integer, nullable=False, default=0)
+    opened = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime)
+
+
+class AnalyticsSnapshot(Base):
+    __tablename__ = "analytics_snapshots"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False, unique=True)
+    payload_json = Column(Text)
+    computed_at = Column(DateTime)
+    stale_since = Column(DateTime)
+
+
 class Payment(Base):
     __tablename__ = "payments"
+    __table_args__ = (
+        Index("ix_payments_client_status", "business_client_id", "payment_status"),
+    )
 
     id = Column(Integer, primary_key=True)
     business_client_id = Column(Integer, ForeignKey("business_clients.id"), nullable=False)
@@ -122,6 +160,10 @@ class IndustryRule(Base):
 
 class OptOut(Base):
     __tablename__ = "opt_outs"
+    __table_args__ = (
+        Index("ix_opt_outs_method_value", "method", "value"),
+        Index("ix_opt_outs_method_created_at", "method", "created_at"),
+    )
 
     id = Column(Integer, primary_key=True)
     method = Column(Text)
@@ -139,6 +181,94 @@ class Bounce(Base):
     created_at = Column(DateTime)
 
 
+class EnrichmentCache(Base):
+    __tablename__ = "enrichment_cache"
+
+    id = Column(Integer, primary_key=True)
+    cache_key = Column(Text, unique=True)
+    site_ok = Column(Boolean)
+    content_len = Column(Integer)
+    keywords = Column(JSON)
+    fetched_at = Column(DateTime)
+
+
+class JobCheckpoint(Base):
+    __tablename__ = "job_checkpoints"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, unique=True)
+    last_id = Column(Integer)
+    updated_at = Column(DateTime)
+
+
+class DeliveryOutbox(Base):
+    __tablename__ = "delivery_outbox"
+    __table_args__ = (
+        Index("ix_delivery_outbox_status_lease", "status", "lease_until"),
+    )
+
+    id = Column(Integer, primary_key=True)
+    business_client_id = Column(Integer, ForeignKey("business_clients.id"), nullable=False)
+    delivery_method = Column(Text)
+    lead_ids = Column(Text)
+    status = Column(Text, default="pending")
+    attempts = Column(Integer, default=0)
+    lease_token = Column(Text)
+    lease_until = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+
+class JobRecord(Base):
+    __tablename__ = "job_queue"
+    __table_args__ = (
+        Index("ix_job_queue_claim", "status", "priority", "id"),
+        Index("uq_job_queue_idempotency_key", "idempotency_key", unique=True),
+    )
+
+    id = Column(Integer, primary_key=True)
+    job_type = Column(Text, nullable=False)
+    payload_json = Column(Text)
+    priority = Column(Integer, nullable=False, default=0)
+    status = Column(Text, nullable=False, default="pending")
+    attempts = Column(Integer, nullable=False, default=0)
+    max_attempts = Column(Integer, nullable=False, default=4)
+    idempotency_key = Column(Text)
+    lease_token = Column(Text)
+    lease_until = Column(DateTime)
+    run_after = Column(DateTime)
+    last_error = Column(Text)
+    created_at = Column(DateTime)
+    updated_at = Column(DateTime)
+
+
+class DeadLetterJob(Base):
+    __tablename__ = "job_dead_letter"
+
+    id = Column(Integer, primary_key=True)
+    job_id = Column(Integer)
+    job_type = Column(Text)
+    payload_json = Column(Text)
+    attempts = Column(Integer)
+    error = Column(Text)
+    failed_at = Column(DateTime)
+
+
+class ScheduleState(Base):
+    __tablename__ = "schedule_state"
+
+    id = Column(Integer, primary_key=True)
+    name = Column(Text, nullable=False, unique=True)
+    last_run_at = Column(DateTime)
+    next_run_at = Column(DateTime)
+    inflight_since = Column(DateTime)
+    pending = Column(Boolean, nullable=False, default=False)
+    last_finished_at = Column(DateTime)
+    last_status = Column(Text)
+    last_error = Column(Text)
+
+
 class SourceAttribution(Base):
     __tablename__ = "source_attributions"
 
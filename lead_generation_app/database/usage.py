@@ -0,0 +1,160 @@
+import logging
+from datetime import date, datetime
+from sqlalchemy import select, delete, insert, update, func, case
+from sqlalchemy.exc import IntegrityError
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import ClientUsageMonthly, DeliveredLead, QualifiedLead
+
+_CHUNK = 500
+
+
+def month_key(dt=None):
+    dt = dt or datetime.utcnow()
+    return date(dt.year, dt.month, 1)
+
+
+def _upsert_stmt(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(ClientUsageMonthly)
+    return stmt.on_conflict_do_update(
+        index_elements=["business_client_id", "month", "industry"],
+        set_={
+            "delivered": ClientUsageMonthly.delivered + stmt.excluded.delivered,
+            "opened": ClientUsageMonthly.opened + stmt.excluded.opened,
+            "updated_at": stmt.excluded.updated_at,
+        },
+    )
+
+
+def add_usage(session, events):
+    """
+    Add (client_id, delivered_at, industry, delivered, opened) increments to
+    the monthly rollup on the caller's session, one upsert per distinct
+    client/month/industry. The caller commits together with the rows the
+    increments describe.
+    """
+    totals = {}
+    for client_id, delivered_at, industry, delivered, opened in events:
+        key = (int(client_id), month_key(delivered_at), industry or "")
+        d, o = totals.get(key, (0, 0))
+        totals[key] = (d + int(delivered), o + int(opened))
+    if not totals:
+        return 0
+    now = datetime.utcnow()
+    values = [
+        {"business_client_id": c, "month": m, "industry": ind, "delivered": d, "opened": o, "updated_at": now}
+        for (c, m, ind), (d, o) in totals.items()
+    ]
+    stmt = _upsert_stmt(session.get_bind().dialect.name)
+    if stmt is not None:
+        session.execute(stmt, values)
+    else:
+        for v in values:
+            _add_portable(session, v)
+    return len(values)
+
+
+def _add_portable(session, v):
+    # Update then insert for dialects without ON CONFLICT. The insert runs in
+    # a savepoint; losing the race to another writer falls back to the update.
+    inc = (
+        update(ClientUsageMonthly)
+        .where(ClientUsageMonthly.business_client_id == v["business_client_id"])
+        .where(ClientUsageMonthly.month == v["month"])
+        .where(ClientUsageMonthly.industry == v["industry"])
+        .values(delivered=ClientUsageMonthly.delivered + v["delivered"], opened=ClientUsageMonthly.opened + v["opened"], updated_at=v["updated_at"])
+    )
+    if session.execute(inc).rowcount:
+        return
+    try:
+        with session.begin_nested():
+            session.execute(insert(ClientUsageMonthly), [v])
+    except IntegrityError:
+        session.execute(inc)
+
+
+def _rollup(session, client_ids, month, *cols):
+    q = select(ClientUsageMonthly.business_client_id, *cols).where(ClientUsageMonthly.month == month)
+    if client_ids is None:
+        yield from session.execute(q).all()
+        return
+    ids = list(dict.fromkeys(int(c) for c in client_ids))
+    for i in range(0, len(ids), _CHUNK):
+        yield from session.execute(q.where(ClientUsageMonthly.business_client_id.in_(ids[i:i + _CHUNK]))).all()
+
+
+def month_usage(session, client_ids=None, month=None):
+    """Return {client_id: (delivered, opened)} for month (default: current)."""
+    month = month or month_key()
+    out = {}
+    for cid, d, o in _rollup(session, client_ids, month, ClientUsageMonthly.delivered, ClientUsageMonthly.opened):
+        pd, po = out.get(cid, (0, 0))
+        out[cid] = (pd + int(d or 0), po + int(o or 0))
+    return out
+
+
+def month_usage_by_industry(session, client_ids, month=None):
+    """Return {client_id: {industry: delivered}}; a missing industry is None."""
+    month = month or month_key()
+    out = {}
+    for cid, industry, d in _rollup(session, client_ids, month, ClientUsageMonthly.industry, ClientUsageMonthly.delivered):
+        if d:
+            out.setdefault(cid, {})[industry or None] = int(d)
+    return out
+
+
+def _month_expr(dialect):
+    if dialect == "postgresql":
+        return func.date_trunc("month", DeliveredLead.delivered_at)
+    return func.strftime("%Y-%m-01", DeliveredLead.delivered_at)
+
+
+def rebuild_usage(month=None):
+    """
+    Recompute client_usage_monthly from delivered_leads, for one month or
+    for all of them, in a single transaction. Returns the rows written.
+    """
+    s = get_session()
+    try:
+        bucket = _month_expr(s.get_bind().dialect.name).label("month")
+        q = (
+            select(
+                DeliveredLead.business_client_id,
+                bucket,
+                func.coalesce(QualifiedLead.industry, ""),
+                func.count(DeliveredLead.id),
+                func.sum(case((DeliveredLead.opened_status.is_(True), 1), else_=0)),
+            )
+            .select_from(DeliveredLead)
+            .outerjoin(QualifiedLead, QualifiedLead.id == DeliveredLead.qualified_lead_id)
+            .where(DeliveredLead.delivered_at.is_not(None))
+            .group_by(DeliveredLead.business_client_id, bucket, func.coalesce(QualifiedLead.industry, ""))
+        )
+        wipe = delete(ClientUsageMonthly)
+        if month is not None:
+            m = month_key(month)
+            q = q.where(DeliveredLead.delivered_at >= datetime(m.year, m.month, 1))
+            q = q.where(DeliveredLead.delivered_at < datetime(m.year + m.month // 12, m.month % 12 + 1, 1))
+            wipe = wipe.where(ClientUsageMonthly.month == m)
+        now = datetime.utcnow()
+        values = []
+        for cid, bucket_value, industry, d, o in s.execute(q).all():
+            if isinstance(bucket_value, str):
+                bucket_value = datetime.strptime(bucket_value, "%Y-%m-%d")
+            values.append({"business_client_id": cid, "month": month_key(bucket_value), "industry": industry, "delivered": int(d), "opened": int(o or 0), "updated_at": now})
+        s.execute(wipe)
+        if values:
+            s.execute(insert(ClientUsageMonthly), values)
+        s.commit()
+        logging.info("{\"event\":\"usage_rebuilt\",\"month\":\"%s\",\"rows\":%d}" % (month_key(month).isoformat() if month else "all", len(values)))
+        return len(values)
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
@@ -2,7 +2,18 @@ import logging
 from datetime import datetime
 from lead_generation_app.database.database import get_session
 from lead_generation_app.database.models import DeliveredLead, QualifiedLead, BusinessClient
-from sqlalchemy import select
+from lead_generation_app.database.usage import add_usage
+from sqlalchemy import select, insert
+
+
+def _insert_delivered_stmt(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as pg_insert
+        return pg_insert(DeliveredLead).on_conflict_do_nothing()
+    if dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+        return sqlite_insert(DeliveredLead).on_conflict_do_nothing()
+    return insert(DeliveredLead)
 
 
 def record_delivery(qualified_lead_id, business_client_id, delivery_method, delivered_at=None, opened_status=False):
@@ -13,26 +24,37 @@ def record_delivery(qualified_lead_id, business_client_id, delivery_method, deli
         if not ql or not bc:
             logging.info("{\"event\":\"record_delivery_skip\",\"reason\":\"fk_missing\"}")
             return None
-        existing = s.execute(
-            select(DeliveredLead)
-            .where(DeliveredLead.qualified_lead_id == qualified_lead_id)
-            .where(DeliveredLead.business_client_id == business_client_id)
-            .where(DeliveredLead.delivery_method == delivery_method)
-        ).scalars().first()
-        if existing:
-            logging.info("{\"event\":\"record_delivery_skip\",\"reason\":\"duplicate\"}")
-            return existing.id
-        row = DeliveredLead(
-            qualified_lead_id=qualified_lead_id,
-            business_client_id=business_client_id,
-            delivery_method=delivery_method,
-            delivered_at=delivered_at or datetime.utcnow(),
-            opened_status=opened_status,
-        )
-        s.add(row)
+        values = {
+            "qualified_lead_id": qualified_lead_id,
+            "business_client_id": business_client_id,
+            "delivery_method": delivery_method,
+            "delivered_at": delivered_at or datetime.utcnow(),
+            "opened_status": opened_status,
+        }
+        bind = s.get_bind()
+        stmt = _insert_delivered_stmt(bind.dialect.name)
+        row_id = None
+        if bind.dialect.insert_returning:
+            row_id = s.execute(stmt.returning(DeliveredLead.id), values).scalar()
+            inserted = row_id is not None
+        else:
+            inserted = s.connection().execute(stmt, values).rowcount != 0
+        if inserted:
+            add_usage(s, [(business_client_id, values["delivered_at"], ql.industry, 1, 1 if opened_status else 0)])
         s.commit()
+        if row_id is None:
+            existing = s.execute(
+                select(DeliveredLead.id)
+                .where(DeliveredLead.qualified_lead_id == qualified_lead_id)
+                .where(DeliveredLead.business_client_id == business_client_id)
+                .where(DeliveredLead.delivery_method == delivery_method)
+            ).scalars().first()
+            if bind.dialect.insert_returning:
+                logging.info("{\"event\":\"record_delivery_skip\",\"reason\":\"duplicate\"}")
+                return existing
+            row_id = existing
         logging.info("{\"event\":\"record_delivery_ok\",\"qualified_lead_id\":%d,\"business_client_id\":%d,\"method\":\"%s\"}" % (qualified_lead_id, business_client_id, delivery_method))
-        return row.id
+        return row_id
     except Exception as e:
         s.rollback()
         logging.error("{\"event\":\"record_delivery_error\",\"error\":\"%s\"}" % str(e).replace("\"","'"))
@@ -41,5 +63,43 @@ def record_delivery(qualified_lead_id, business_client_id, delivery_method, deli
         s.close()
 
 
+def record_deliveries(session, qualified_lead_ids, business_client_id, delivery_method, delivered_at=None, industries=None):
+    """
+    Insert DeliveredLead rows for many leads of one client in a single
+    statement on the caller's session, skipping pairs that are already
+    recorded, and add the new rows to the monthly usage rollup. industries
+    maps lead id to industry and saves a lookup when the caller has it. The
+    caller commits. Returns the number of rows written.
+    """
+    ids = list(dict.fromkeys(int(i) for i in qualified_lead_ids or []))
+    if not ids:
+        return 0
+    when = delivered_at or datetime.utcnow()
+    values = [
+        {"qualified_lead_id": i, "business_client_id": business_client_id, "delivery_method": delivery_method, "delivered_at": when, "opened_status": False}
+        for i in ids
+    ]
+    bind = session.get_bind()
+    stmt = _insert_delivered_stmt(bind.dialect.name)
+    if bind.dialect.insert_executemany_returning:
+        written_ids = session.connection().execute(stmt.returning(DeliveredLead.qualified_lead_id), values).scalars().all()
+    else:
+        # No RETURNING: skip pairs already on file, then read back the rows
+        # this statement wrote so duplicates are not counted as deliveries.
+        pair = (DeliveredLead.business_client_id == business_client_id, DeliveredLead.delivery_method == delivery_method)
+        existing = set(session.execute(select(DeliveredLead.qualified_lead_id).where(*pair, DeliveredLead.qualified_lead_id.in_(ids))).scalars())
+        values = [v for v in values if v["qualified_lead_id"] not in existing]
+        if values:
+            session.connection().execute(stmt, values)
+        fresh = [v["qualified_lead_id"] for v in values]
+        inserted = set(session.execute(select(DeliveredLead.qualified_lead_id).where(*pair, DeliveredLead.delivered_at == when, DeliveredLead.qualified_lead_id.in_(fresh))).scalars()) if fresh else set()
+        written_ids = [i for i in fresh if i in inserted]
+    if industries is None:
+        industries = dict(session.execute(select(QualifiedLead.id, QualifiedLead.industry).where(QualifiedLead.id.in_(written_ids))).all()) if written_ids else {}
+    add_usage(session, [(business_client_id, when, industries.get(i), 1, 0) for i in written_ids])
+    logging.info("{\"event\":\"record_deliveries_ok\",\"business_client_id\":%d,\"method\":\"%s\",\"leads\":%d,\"written\":%d}" % (business_client_id, delivery_method, len(ids), len(written_ids)))
+    return len(written_ids)
+
+
 def mark_dashboard_delivery(qualified_lead_id, business_client_id):
     return record_delivery(qualified_lead_id, business_client_id, "dashboard")
@@ -1,28 +1,15 @@
 import os
 import json
 import logging
-from urllib.request import Request, urlopen
-from datetime import datetime, timedelta
-from calendar import monthrange
-from sqlalchemy import select, func
-
-from lead_generation_app.delivery import record_delivery
-from lead_generation_app.metrics import inc_success, inc_skip_cap, inc_skip_inactive, inc_trial_used
-from lead_generation_app.payments import is_client_active
-from lead_generation_app.database.database import get_session
-from lead_generation_app.database.models import QualifiedLead, DeliveredLead, BusinessClient, Payment, OptOut, Bounce
-from lead_generation_app.config.pricing import BASE_PLANS, LEAD_PRICING, PAY_PER_LEAD_CAP, INDUSTRY_TIERS, TRIAL_CONFIG
-
-
-def _month_window(dt):
-    start = datetime(dt.year, dt.month, 1)
-    end = datetime(dt.year, dt.month, monthrange(dt.year, dt.month)[1]) + timedelta(days=1)
-    return start, end
+from datetime import datetime
+from sqlalchemy import select
 
-
-def _tier_for(industry):
-    key = (industry or "").lower().replace(" ", "_")
-    return INDUSTRY_TIERS.get(key, "basic")
+from lead_generation_app.delivery.plan import DeliveryPlan
+from lead_generation_app.delivery.suppression import load_suppressed
+from lead_generation_app.delivery.http_client import get_transport
+from lead_generation_app.metrics import inc_success
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import QualifiedLead, BusinessClient, Bounce
 
 
 def _send_email_via_sendgrid(to_email, subject, content):
@@ -35,48 +22,129 @@ def _send_email_via_sendgrid(to_email, subject, content):
         "subject": subject,
         "content": [{"type": "text/plain", "value": content or ""}],
     }
-    req = Request(
-        "https://api.sendgrid.com/v3/mail/send",
-        data=json.dumps(body).encode("utf-8"),
-        headers={
-            "Authorization": f"Bearer {key}",
-            "Content-Type": "application/json",
-        },
-        method="POST",
-    )
+    base = os.getenv("SENDGRID_API_BASE", "https://api.sendgrid.com")
+    headers = {
+        "Authorization": f"Bearer {key}",
+        "Content-Type": "application/json",
+    }
     try:
-        with urlopen(req) as resp:
-            return {"status": str(resp.getcode())}
+        code, _ = get_transport().request("POST", f"{base}/v3/mail/send", body=json.dumps(body).encode("utf-8"), headers=headers)
+        if code >= 400:
+            return {"status": f"error:HTTP {code}"}
+        return {"status": str(code)}
     except Exception as e:
         return {"status": f"error:{e}"}
 
 
-def send_email_leads(qualified_lead_ids=None, business_client_id=None, template=None):
+def _send_email_batch(personalizations, subject, content):
+    """
+    Send one mail/send request carrying several personalizations. Each
+    personalization sets its own recipient and a -summary- substitution that
+    is placed into content.
+    """
+    key = os.getenv("SENDGRID_API_KEY")
+    if not key:
+        return {"status": "simulated"}
+    body = {
+        "personalizations": personalizations,
+        "from": {"email": os.getenv("SENDGRID_FROM_EMAIL", "noreply@example.com")},
+        "subject": subject,
+        "content": [{"type": "text/plain", "value": content}],
+    }
+    base = os.getenv("SENDGRID_API_BASE", "https://api.sendgrid.com")
+    headers = {
+        "Authorization": f"Bearer {key}",
+        "Content-Type": "application/json",
+    }
+    try:
+        code, _ = get_transport().request("POST", f"{base}/v3/mail/send", body=json.dumps(body).encode("utf-8"), headers=headers)
+        if code >= 400:
+            return {"status": f"error:HTTP {code}"}
+        return {"status": str(code)}
+    except Exception as e:
+        return {"status": f"error:{e}"}
+
+
+def _delivery_mode():
+    mode = os.getenv("EMAIL_DELIVERY_MODE", "single").lower()
+    return mode if mode in ("single", "batch", "digest") else "single"
+
+
+def _digest_parts(pending, max_leads, max_bytes):
+    """
+    Split each recipient's leads into digest parts of at most max_leads
+    summaries and max_bytes of summary text. A summary larger than
+    max_bytes gets a part of its own. Yields (to, items) per part.
+    """
+    by_to = {}
+    for item in pending:
+        by_to.setdefault(item["to"], []).append(item)
+    for to, items in by_to.items():
+        part = []
+        used = 0
+        for it in items:
+            n = len((it["summary"] or "").encode("utf-8"))
+            if part and (len(part) >= max_leads or used + 2 + n > max_bytes):
+                yield to, part
+                part = []
+                used = 0
+            used += (2 if part else 0) + n
+            part.append(it)
+        if part:
+            yield to, part
+
+
+def _email_requests(pending, mode, max_personalizations, max_leads=100, max_bytes=10000, max_request_bytes=20000000):
+    """
+    Group pending deliveries into mail/send requests. In batch mode every lead
+    gets its own personalization; in digest mode each recipient gets
+    personalizations listing its leads, split into parts of at most
+    max_leads summaries and max_bytes of text. A request carries at most
+    max_personalizations personalizations and about max_request_bytes of
+    them, and a recipient appears at most once per request. Yields
+    (items, personalizations) per request.
+
+    Batch mode only saves requests when leads go to different addresses.
+    When the client has an email every lead goes to that one address, so
+    it still makes a request per lead; send_email_leads uses digest mode
+    for those clients instead.
+    """
+    size = max(1, min(1000, int(max_personalizations)))
+    if mode == "digest":
+        units = [(to, items, "\n\n".join(it["summary"] for it in items)) for to, items in _digest_parts(pending, max(1, int(max_leads)), int(max_bytes))]
+    else:
+        units = [(item["to"], [item], item["summary"]) for item in pending]
+    batches = []
+    # next_batch[to] is the first batch that can still take to; batches
+    # before first_open are full.
+    next_batch = {}
+    first_open = 0
+    for to, items, text in units:
+        pers = {"to": [{"email": to}], "substitutions": {"-summary-": text}}
+        n = len(json.dumps(pers).encode("utf-8")) + 1
+        while first_open < len(batches) and len(batches[first_open]["pers"]) >= size:
+            first_open += 1
+        j = max(first_open, next_batch.get(to, 0))
+        while j < len(batches) and (len(batches[j]["pers"]) >= size or batches[j]["bytes"] + n > max_request_bytes):
+            j += 1
+        if j == len(batches):
+            batches.append({"items": [], "pers": [], "bytes": 0})
+        batches[j]["items"].extend(items)
+        batches[j]["pers"].append(pers)
+        batches[j]["bytes"] += n
+        next_batch[to] = j + 1
+    for b in batches:
+        yield b["items"], b["pers"]
+
+
+def send_email_leads(qualified_lead_ids=None, business_client_id=None, template=None, quota=None):
     s = get_session()
     try:
-        now = datetime.utcnow()
-        start, end = _month_window(now)
         bc = s.execute(select(BusinessClient).where(BusinessClient.id == business_client_id)).scalars().first()
         if not bc:
             logging.info("{\"event\":\"email_skip\",\"reason\":\"client_missing\"}")
             return []
-        active = is_client_active(business_client_id)
-        plan = BASE_PLANS.get(bc.subscription_plan) if bc.subscription_plan else None
-        trial_pay = s.execute(
-            select(Payment).where(Payment.business_client_id == business_client_id).where(Payment.plan_name == "trial").where(
-                Payment.payment_status.in_(["paid", "success"]))
-        ).scalars().first()
-        trial_active = False
-        trial_deadline = None
-        trial_used = 0
-        if trial_pay:
-            trial_deadline = trial_pay.payment_date + timedelta(days=int(TRIAL_CONFIG.get("days_valid", 7)))
-            if now <= trial_deadline:
-                trial_active = True
-                trial_used = s.execute(
-                    select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == business_client_id).where(
-                        DeliveredLead.delivered_at >= trial_pay.payment_date).where(DeliveredLead.delivered_at <= trial_deadline)
-                ).scalar_one()
+        dp = DeliveryPlan(s, bc, "email", quota=quota)
 
         ids = list(qualified_lead_ids or [])
         if not ids:
@@ -85,89 +153,87 @@ def send_email_leads(qualified_lead_ids=None, business_client_id=None, template=
         else:
             rows = s.execute(select(QualifiedLead).where(QualifiedLead.id.in_(ids))).scalars().all()
 
-        delivered_count_month = s.execute(
-            select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == business_client_id).where(
-                DeliveredLead.delivered_at >= start).where(DeliveredLead.delivered_at < end)
-        ).scalar_one()
-
-        tier_counts = {}
+        suppressed = load_suppressed(s, "email", [(bc.email or r.email or "").lower() for r in rows])
+        mode = _delivery_mode()
+        if mode == "batch" and bc.email:
+            # Every lead goes to the client's own address, so batching
+            # would still send one request per lead.
+            mode = "digest"
+        pending = []
         out = []
-        for r in rows:
-            candidate_email = (bc.email or r.email or "").lower()
-            if candidate_email:
-                o = s.execute(select(OptOut).where(OptOut.method == "email").where(OptOut.value == candidate_email)).scalars().first()
-                if o:
+        # Deliveries already sent are recorded even if the run stops early,
+        # so they are not re-sent and still count against the caps.
+        try:
+            for r in rows:
+                candidate_email = (bc.email or r.email or "").lower()
+                if candidate_email and candidate_email in suppressed:
                     out.append({"lead_id": r.id, "status": "skipped", "reason": "opt_out", "price": None, "template_used": template or "default"})
                     continue
-            tier = _tier_for(r.industry)
-            base_price = LEAD_PRICING.get(tier, 0)
-            price = base_price
-            reason = None
-            status = "skipped"
-
-            if not active and not trial_active and not plan:
-                reason = "inactive"
-                out.append({"lead_id": r.id, "status": status, "reason": reason, "price": None})
-                inc_skip_inactive(business_client_id, "email", r.industry)
-                continue
-
-            if plan:
-                cap = int(plan.get("lead_cap", 0))
-                if delivered_count_month >= cap:
-                    reason = "cap_reached_subscription"
-                    out.append({"lead_id": r.id, "status": status, "reason": reason, "price": None})
-                    inc_skip_cap(business_client_id, "email", r.industry)
+                reason, price = dp.decide(r)
+                if reason:
+                    out.append({"lead_id": r.id, "status": "skipped", "reason": reason, "price": None})
                     continue
-                discount = float(plan.get("discount", 0))
-                price = max(0, round(base_price * (1 - discount), 2))
-            else:
-                cap = int(PAY_PER_LEAD_CAP.get(tier, 0))
-                if tier not in tier_counts:
-                    tier_counts[tier] = s.execute(
-                        select(func.count(DeliveredLead.id))
-                        .join(QualifiedLead, QualifiedLead.id == DeliveredLead.qualified_lead_id)
-                        .where(DeliveredLead.business_client_id == business_client_id)
-                        .where(DeliveredLead.delivered_at >= start)
-                        .where(DeliveredLead.delivered_at < end)
-                        .where(QualifiedLead.industry == r.industry)
-                    ).scalar_one()
-                if tier_counts[tier] >= cap:
-                    reason = "cap_reached_ppl"
-                    out.append({"lead_id": r.id, "status": status, "reason": reason, "price": None})
-                    inc_skip_cap(business_client_id, "email", r.industry)
+
+                if mode != "single":
+                    pending.append({"lead": r, "to": bc.email or r.email, "target": candidate_email, "summary": r.summary or "", "price": price})
+                    dp.reserve(r)
                     continue
 
-            if trial_active and trial_used < int(TRIAL_CONFIG.get("leads", 0)):
-                price = 0
-                trial_used += 1
-                inc_trial_used(business_client_id, "email", r.industry)
-
-            try:
-                send_status = _send_email_via_sendgrid(bc.email or r.email, "Lead", r.summary or "")
-                if str(send_status.get("status", "")).startswith("error"):
-                    raise RuntimeError(send_status.get("status"))
-                record_delivery(r.id, business_client_id, "email")
-                delivered_count_month += 1
-                if not plan:
-                    tier_counts[tier] = tier_counts.get(tier, 0) + 1
-                status = "delivered"
-                out.append({"lead_id": r.id, "status": status, "reason": None, "price": price, "template_used": template or "default"})
-                inc_success(business_client_id, "email", r.industry)
-            except Exception as e:
                 try:
-                    b = Bounce(method="email", target=candidate_email or "", reason=str(e), created_at=datetime.utcnow())
-                    s.add(b)
-                    s.commit()
-                except Exception:
-                    s.rollback()
-                reason = f"error:{e}"
-                out.append({"lead_id": r.id, "status": "failed", "reason": reason, "price": None, "template_used": template or "default"})
+                    send_status = _send_email_via_sendgrid(bc.email or r.email, "Lead", r.summary or "")
+                    if str(send_status.get("status", "")).startswith("error"):
+                        raise RuntimeError(send_status.get("status"))
+                    dp.reserve(r)
+                    dp.record(r)
+                    out.append({"lead_id": r.id, "status": "delivered", "reason": None, "price": price, "template_used": template or "default"})
+                    inc_success(business_client_id, "email", r.industry)
+                except Exception as e:
+                    try:
+                        b = Bounce(method="email", target=candidate_email or "", reason=str(e), created_at=datetime.utcnow())
+                        s.add(b)
+                        s.commit()
+                    except Exception:
+                        s.rollback()
+                    reason = f"error:{e}"
+                    out.append({"lead_id": r.id, "status": "failed", "reason": reason, "price": None, "template_used": template or "default"})
+
+            calls = 0
+            requests = _email_requests(
+                pending,
+                mode,
+                int(os.getenv("EMAIL_BATCH_SIZE", "1000")),
+                max_leads=int(os.getenv("EMAIL_DIGEST_MAX_LEADS", "100")),
+                max_bytes=int(os.getenv("EMAIL_DIGEST_MAX_BYTES", "10000")),
+                max_request_bytes=int(os.getenv("EMAIL_MAX_REQUEST_BYTES", "20000000")),
+            )
+            for items, personalizations in requests:
+                calls += 1
+                send_status = _send_email_batch(personalizations, "Leads" if mode == "digest" else "Lead", "-summary-")
+                reason = str(send_status.get("status", ""))
+                for item in items:
+                    r = item["lead"]
+                    if reason.startswith("error"):
+                        dp.release(r)
+                        try:
+                            s.add(Bounce(method="email", target=item["target"] or "", reason=reason, created_at=datetime.utcnow()))
+                            s.commit()
+                        except Exception:
+                            s.rollback()
+                        out.append({"lead_id": r.id, "status": "failed", "reason": reason, "price": None, "template_used": template or "default"})
+                        continue
+                    dp.record(r)
+                    out.append({"lead_id": r.id, "status": "delivered", "reason": None, "price": item["price"], "template_used": template or "default"})
+                    inc_success(business_client_id, "email", r.industry)
+            if pending:
+                logging.info("{\"event\":\"email_batches_sent\",\"mode\":\"%s\",\"leads\":%d,\"requests\":%d}" % (mode, len(pending), calls))
+        finally:
+            dp.flush()
 
         total = len(rows)
         delivered = len([x for x in out if x["status"] == "delivered"])
         skipped_cap = len([x for x in out if (x["reason"] or "").startswith("cap_reached")])
         skipped_inactive = len([x for x in out if x["reason"] == "inactive"])
-        logging.info("{\"event\":\"email_summary\",\"processed\":%d,\"delivered\":%d,\"skipped_cap\":%d,\"skipped_inactive\":%d,\"trial_used\":%d}" % (total, delivered, skipped_cap, skipped_inactive, trial_used))
+        logging.info("{\"event\":\"email_summary\",\"processed\":%d,\"delivered\":%d,\"skipped_cap\":%d,\"skipped_inactive\":%d,\"trial_used\":%d}" % (total, delivered, skipped_cap, skipped_inactive, dp.trial_used))
         return out
     finally:
         s.close()
@@ -0,0 +1,89 @@
+import os
+import logging
+from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import QualifiedLead, BusinessClient
+from lead_generation_app.entitlements import client_active
+from lead_generation_app.delivery.plan import load_payments, load_quotas
+from lead_generation_app.delivery.whatsapp_sender import send_whatsapp_leads
+from lead_generation_app.delivery.email_sender import send_email_leads
+
+_CHUNK = 500
+
+
+def match_leads(leads, clients):
+    """
+    Return {client_id: [lead ids]} for leads given as (id, industry) pairs.
+    A client with an industry receives the leads of that industry; a client
+    without one receives every lead.
+    """
+    all_ids = [lid for lid, _ in leads]
+    by_industry = {}
+    for lid, industry in leads:
+        by_industry.setdefault(industry, []).append(lid)
+    out = {}
+    for bc in clients:
+        ids = by_industry.get(bc.industry, []) if bc.industry else all_ids
+        if ids:
+            out[bc.id] = ids
+    return out
+
+
+def match_active_clients(s, q_ids, now=None):
+    """
+    Load the active clients, their payments and the industries of q_ids in
+    a handful of grouped queries. Returns ({client_id: [lead ids]}, payments).
+    """
+    now = now or datetime.utcnow()
+    ids = list(dict.fromkeys(int(i) for i in q_ids or [] if i))
+    if not ids:
+        return {}, {}
+    leads = []
+    for i in range(0, len(ids), _CHUNK):
+        leads.extend(s.execute(select(QualifiedLead.id, QualifiedLead.industry).where(QualifiedLead.id.in_(ids[i:i + _CHUNK]))).all())
+    clients = s.execute(select(BusinessClient)).scalars().all()
+    payments = load_payments(s, [bc.id for bc in clients])
+    active = [bc for bc in clients if client_active(bc, bool(payments[bc.id]), now)]
+    matches = match_leads(leads, active)
+    logging.info("{\"event\":\"fanout_matched\",\"leads\":%d,\"clients\":%d,\"active\":%d,\"matched\":%d}" % (len(ids), len(clients), len(active), len(matches)))
+    return matches, payments
+
+
+def _deliver_client(client_id, lead_ids, quota):
+    # WhatsApp runs first and hands its reservations to email through the
+    # shared quota, as the senders did when each re-read delivered_leads.
+    out = send_whatsapp_leads(qualified_lead_ids=lead_ids, business_client_id=client_id, quota=quota)
+    out += send_email_leads(qualified_lead_ids=lead_ids, business_client_id=client_id, quota=quota)
+    return out
+
+
+def fan_out(q_ids, workers=None):
+    """
+    Deliver q_ids to every matching active client, one client per worker.
+    Returns {client_id: per-lead results}.
+    """
+    now = datetime.utcnow()
+    s = get_session()
+    try:
+        matches, payments = match_active_clients(s, q_ids, now)
+        quotas = load_quotas(s, list(matches), now, payments) if matches else {}
+    finally:
+        s.close()
+    if not matches:
+        return {}
+    if workers is None:
+        workers = int(os.getenv("DELIVERY_FANOUT_WORKERS", "8"))
+    results = {}
+    with ThreadPoolExecutor(max_workers=max(1, min(int(workers), len(matches))), thread_name_prefix="fanout") as pool:
+        futures = {pool.submit(_deliver_client, cid, lead_ids, quotas[cid]): cid for cid, lead_ids in matches.items()}
+        for f, cid in futures.items():
+            try:
+                results[cid] = f.result()
+            except Exception as e:
+                logging.error("{\"event\":\"fanout_client_error\",\"business_client_id\":%d,\"error\":\"%s\"}" % (cid, str(e).replace("\"", "'")))
+                results[cid] = []
+    delivered = sum(1 for out in results.values() for x in out if x.get("status") == "delivered")
+    logging.info("{\"event\":\"fanout_done\",\"clients\":%d,\"delivered\":%d}" % (len(results), delivered))
+    return results
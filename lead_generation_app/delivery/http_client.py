@@ -0,0 +1,145 @@
+import os
+import time
+import random
+import logging
+import threading
+import http.client
+from urllib.parse import urlsplit
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+# A 500/502/504 to a POST may arrive after the provider accepted the
+# message, so non-idempotent requests only retry responses that mean it was
+# not processed.
+UNPROCESSED_STATUSES = (429, 503)
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+
+class HttpTransport:
+    """
+    Keep-alive HTTP(S) client shared by the delivery senders. Idle
+    connections are pooled per host, connect and read timeouts are separate,
+    in-flight requests are bounded, and 429/5xx responses are retried with
+    jittered exponential backoff (honouring a numeric Retry-After). POSTs
+    without an idempotency key are only retried on 429/503 and on errors
+    raised before the request was sent.
+    """
+
+    def __init__(self, pool_size=10, connect_timeout=5.0, read_timeout=15.0, max_concurrency=20, retries=3, backoff=0.5, max_backoff=8.0):
+        self.pool_size = int(pool_size)
+        self.connect_timeout = float(connect_timeout)
+        self.read_timeout = float(read_timeout)
+        self.retries = int(retries)
+        self.backoff = float(backoff)
+        self.max_backoff = float(max_backoff)
+        self.sem = threading.BoundedSemaphore(max(1, int(max_concurrency)))
+        self.lock = threading.Lock()
+        self.idle = {}
+        self.opened = 0
+
+    def _acquire(self, key):
+        with self.lock:
+            conns = self.idle.get(key)
+            if conns:
+                return conns.pop()
+            self.opened += 1
+        scheme, host, port = key
+        cls = http.client.HTTPSConnection if scheme == "https" else http.client.HTTPConnection
+        return cls(host, port, timeout=self.connect_timeout)
+
+    def _release(self, key, conn, reusable):
+        if reusable:
+            with self.lock:
+                conns = self.idle.setdefault(key, [])
+                if len(conns) < self.pool_size:
+                    conns.append(conn)
+                    return
+        conn.close()
+
+    def _delay(self, attempt, retry_after=None):
+        if retry_after:
+            try:
+                return min(self.max_backoff, float(retry_after))
+            except ValueError:
+                pass
+        cap = min(self.max_backoff, self.backoff * (2 ** attempt))
+        return random.uniform(cap / 2, cap)
+
+    def _once(self, key, method, path, body, headers):
+        conn = self._acquire(key)
+        sent = False
+        try:
+            if conn.sock is None:
+                conn.connect()
+                conn.sock.settimeout(self.read_timeout)
+            conn.request(method, path, body=body, headers=headers or {})
+            sent = True
+            resp = conn.getresponse()
+            data = resp.read()
+            self._release(key, conn, not resp.will_close)
+            return resp.status, resp.getheader("Retry-After"), data
+        except Exception as e:
+            conn.close()
+            e.after_send = sent
+            raise
+
+    def request(self, method, url, body=None, headers=None, idempotency_key=None):
+        """
+        Return (status, body bytes). Raises the last connection error when
+        every attempt failed before a response was received. An
+        idempotency_key is sent as the Idempotency-Key header and makes the
+        request safe to retry like a GET.
+        """
+        idempotent = method.upper() in IDEMPOTENT_METHODS or idempotency_key is not None
+        if idempotency_key is not None:
+            headers = dict(headers or {}, **{"Idempotency-Key": str(idempotency_key)})
+        retry_statuses = RETRY_STATUSES if idempotent else UNPROCESSED_STATUSES
+        u = urlsplit(url)
+        port = u.port or (443 if u.scheme == "https" else 80)
+        key = (u.scheme, u.hostname, port)
+        path = (u.path or "/") + (("?" + u.query) if u.query else "")
+        last_exc = None
+        status, data = None, b""
+        for attempt in range(self.retries + 1):
+            retry_after = None
+            with self.sem:
+                try:
+                    status, retry_after, data = self._once(key, method, path, body, headers)
+                    last_exc = None
+                except Exception as e:
+                    status, last_exc = None, e
+                    if getattr(e, "after_send", False) and not idempotent:
+                        # The request may have been processed; do not send it twice.
+                        break
+            if status is not None and status not in retry_statuses:
+                return status, data
+            if attempt < self.retries:
+                logging.info("{\"event\":\"http_retry\",\"host\":\"%s\",\"status\":%s,\"attempt\":%d}" % (u.hostname, status if status is not None else "null", attempt + 1))
+                time.sleep(self._delay(attempt, retry_after))
+        if status is not None:
+            return status, data
+        raise last_exc
+
+    def close(self):
+        with self.lock:
+            for conns in self.idle.values():
+                for c in conns:
+                    c.close()
+            self.idle = {}
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_transport():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = HttpTransport(
+                pool_size=int(os.getenv("HTTP_POOL_SIZE", "10")),
+                connect_timeout=float(os.getenv("HTTP_CONNECT_TIMEOUT", "5")),
+                read_timeout=float(os.getenv("HTTP_READ_TIMEOUT", "15")),
+                max_concurrency=int(os.getenv("HTTP_MAX_CONCURRENCY", "20")),
+                retries=int(os.getenv("HTTP_RETRIES", "3")),
+            )
+        return _default
@@ -0,0 +1,239 @@
+import os
+import json
+import uuid
+import logging
+import threading
+from datetime import datetime, timedelta
+from concurrent.futures import ThreadPoolExecutor
+from sqlalchemy import select, update, or_, and_
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import DeliveryOutbox, DeliveredLead
+from lead_generation_app.delivery.plan import load_payments, load_quotas
+from lead_generation_app.delivery.whatsapp_sender import send_whatsapp_leads
+from lead_generation_app.delivery.email_sender import send_email_leads
+from lead_generation_app.analytics import mark_stale
+
+METHODS = ("whatsapp", "email")
+
+
+def outbox_enabled():
+    return os.getenv("DELIVERY_OUTBOX", "0").lower() in ("1", "true", "yes")
+
+
+def enqueue_deliveries(q_ids, client_ids, methods=METHODS):
+    """
+    Store one outbox row per client for the given qualified lead ids; the
+    row lists the methods to send, in order. The rows are sent later by the
+    dispatcher, so the caller does not wait on the providers.
+    """
+    ids = [int(i) for i in (q_ids or []) if i]
+    if not ids or not client_ids:
+        return 0
+    now = datetime.utcnow()
+    payload = json.dumps(ids)
+    method = ",".join(methods)
+    rows = [
+        {"business_client_id": int(c), "delivery_method": method, "lead_ids": payload, "status": "pending", "attempts": 0, "created_at": now, "updated_at": now}
+        for c in dict.fromkeys(client_ids)
+    ]
+    s = get_session()
+    try:
+        s.execute(DeliveryOutbox.__table__.insert(), rows)
+        s.commit()
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
+    logging.info("{\"event\":\"outbox_enqueued\",\"rows\":%d,\"leads\":%d}" % (len(rows), len(ids)))
+    return len(rows)
+
+
+def _claimable(now):
+    return and_(
+        DeliveryOutbox.status.in_(["pending", "sending"]),
+        or_(DeliveryOutbox.lease_until.is_(None), DeliveryOutbox.lease_until < now),
+    )
+
+
+def claim_batch(limit=50, lease_seconds=300):
+    """
+    Lease up to limit rows that are pending, or whose previous lease expired,
+    and return them as dicts. Postgres locks candidates with FOR UPDATE SKIP
+    LOCKED so concurrent dispatchers never wait on each other; elsewhere the
+    lease token is written by a single UPDATE and read back.
+    """
+    now = datetime.utcnow()
+    token = uuid.uuid4().hex
+    lease = {"status": "sending", "lease_token": token, "lease_until": now + timedelta(seconds=int(lease_seconds)), "attempts": DeliveryOutbox.attempts + 1, "updated_at": now}
+    s = get_session()
+    try:
+        candidates = select(DeliveryOutbox.id).where(_claimable(now)).order_by(DeliveryOutbox.id).limit(int(limit))
+        if s.get_bind().dialect.name == "postgresql":
+            ids = s.execute(candidates.with_for_update(skip_locked=True)).scalars().all()
+            if ids:
+                s.execute(update(DeliveryOutbox).where(DeliveryOutbox.id.in_(ids)).values(**lease))
+        else:
+            s.execute(update(DeliveryOutbox).where(DeliveryOutbox.id.in_(candidates.scalar_subquery())).where(_claimable(now)).values(**lease))
+        s.commit()
+        rows = s.execute(
+            select(DeliveryOutbox.id, DeliveryOutbox.business_client_id, DeliveryOutbox.delivery_method, DeliveryOutbox.lead_ids, DeliveryOutbox.attempts)
+            .where(DeliveryOutbox.lease_token == token)
+            .order_by(DeliveryOutbox.id)
+        ).all()
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
+    return [
+        {"id": r.id, "business_client_id": r.business_client_id, "method": r.delivery_method, "lead_ids": json.loads(r.lead_ids or "[]"), "attempts": r.attempts, "token": token}
+        for r in rows
+    ]
+
+
+def complete(item, error=None, max_attempts=5, retry_seconds=60):
+    """
+    Record the outcome of a claimed row. The update only applies while the
+    row still carries this claim's token, so a dispatcher whose lease expired
+    cannot overwrite a newer claim.
+    """
+    now = datetime.utcnow()
+    if error is None:
+        values = {"status": "done", "lease_token": None, "lease_until": None, "last_error": None}
+    elif int(item["attempts"]) >= int(max_attempts):
+        values = {"status": "failed", "lease_token": None, "lease_until": None, "last_error": str(error)}
+    else:
+        delay = int(retry_seconds) * (2 ** (int(item["attempts"]) - 1))
+        values = {"status": "pending", "lease_token": None, "lease_until": now + timedelta(seconds=delay), "last_error": str(error)}
+    values["updated_at"] = now
+    s = get_session()
+    try:
+        res = s.execute(update(DeliveryOutbox).where(DeliveryOutbox.id == item["id"]).where(DeliveryOutbox.lease_token == item["token"]).values(**values))
+        s.commit()
+        return res.rowcount == 1
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
+
+
+def _undelivered(item, method):
+    s = get_session()
+    try:
+        done = set(s.execute(
+            select(DeliveredLead.qualified_lead_id)
+            .where(DeliveredLead.business_client_id == item["business_client_id"])
+            .where(DeliveredLead.delivery_method == method)
+            .where(DeliveredLead.qualified_lead_id.in_(item["lead_ids"]))
+        ).scalars().all())
+    finally:
+        s.close()
+    return [i for i in item["lead_ids"] if i not in done]
+
+
+def _load_quota(client_id):
+    s = get_session()
+    try:
+        now = datetime.utcnow()
+        return load_quotas(s, [client_id], now, load_payments(s, [client_id]))[client_id]
+    finally:
+        s.close()
+
+
+def dispatch(item):
+    senders = {"whatsapp": send_whatsapp_leads, "email": send_email_leads}
+    methods = [m for m in (item["method"] or "").split(",") if m]
+    for m in methods:
+        if m not in senders:
+            raise ValueError(f"unknown delivery method {m}")
+    # The methods share one quota, as in fan_out, so caps and the trial
+    # allowance are spent once per client rather than once per method.
+    quota = _load_quota(item["business_client_id"])
+    out = []
+    for m in methods:
+        # A retried row skips leads an earlier attempt already delivered. An
+        # empty list must not reach the senders, which treat it as "all
+        # matching leads".
+        ids = _undelivered(item, m)
+        if ids:
+            out += senders[m](qualified_lead_ids=ids, business_client_id=item["business_client_id"], quota=quota)
+    return out
+
+
+class OutboxDispatcher(threading.Thread):
+    """
+    Claims outbox rows in batches and sends them on a pool of workers, so one
+    slow provider call only holds one worker. Rows of the same client run
+    one after another on one worker so they never spend its quota at once.
+    """
+
+    def __init__(self, workers=4, batch_size=50, lease_seconds=300, poll_interval=1.0, max_attempts=5, retry_seconds=60):
+        super().__init__(daemon=True)
+        self.workers = max(1, int(workers))
+        self.batch_size = max(1, int(batch_size))
+        self.lease_seconds = int(lease_seconds)
+        self.poll_interval = float(poll_interval)
+        self.max_attempts = int(max_attempts)
+        self.retry_seconds = int(retry_seconds)
+        self.stop_evt = threading.Event()
+        self.pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="outbox")
+
+    def _run_one(self, item):
+        try:
+            results = dispatch(item) or []
+            failed = [x for x in results if x.get("status") == "failed"]
+            if failed:
+                # Sends that failed at the provider are retried with backoff;
+                # leads that did go out are skipped by _undelivered next time.
+                raise RuntimeError("%d of %d sends failed: %s" % (len(failed), len(results), failed[0].get("reason")))
+            complete(item, max_attempts=self.max_attempts, retry_seconds=self.retry_seconds)
+            return True
+        except Exception as e:
+            logging.error("{\"event\":\"outbox_send_error\",\"id\":%d,\"error\":\"%s\"}" % (item["id"], str(e).replace("\"", "'")))
+            complete(item, error=e, max_attempts=self.max_attempts, retry_seconds=self.retry_seconds)
+            return False
+
+    def _run_client(self, items):
+        return sum(1 for item in items if self._run_one(item))
+
+    def run_once(self):
+        items = claim_batch(limit=self.batch_size, lease_seconds=self.lease_seconds)
+        if not items:
+            return 0
+        by_client = {}
+        for item in items:
+            by_client.setdefault(item["business_client_id"], []).append(item)
+        ok = sum(self.pool.map(self._run_client, by_client.values()))
+        if ok:
+            mark_stale()
+        logging.info("{\"event\":\"outbox_batch\",\"claimed\":%d,\"sent\":%d}" % (len(items), ok))
+        return len(items)
+
+    def run(self):
+        while not self.stop_evt.is_set():
+            try:
+                claimed = self.run_once()
+            except Exception as e:
+                logging.error("{\"event\":\"outbox_claim_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+                claimed = 0
+            if not claimed:
+                self.stop_evt.wait(self.poll_interval)
+
+    def stop(self):
+        self.stop_evt.set()
+        self.pool.shutdown(wait=True)
+
+
+def start_dispatcher():
+    d = OutboxDispatcher(
+        workers=int(os.getenv("DELIVERY_WORKERS", "4")),
+        batch_size=int(os.getenv("DELIVERY_CLAIM_BATCH", "50")),
+        lease_seconds=int(os.getenv("DELIVERY_LEASE_SECONDS", "300")),
+        poll_interval=float(os.getenv("DELIVERY_POLL_INTERVAL", "1")),
+        max_attempts=int(os.getenv("DELIVERY_MAX_ATTEMPTS", "5")),
+    )
+    d.start()
+    logging.info("{\"event\":\"outbox_dispatcher_started\",\"workers\":%d}" % d.workers)
+    return d
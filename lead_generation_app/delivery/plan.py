@@ -0,0 +1,168 @@
+from datetime import datetime, timedelta
+from sqlalchemy import select, func, case
+from lead_generation_app.delivery import record_deliveries
+from lead_generation_app.entitlements import client_active, trial_window
+from lead_generation_app.database.models import DeliveredLead, Payment
+from lead_generation_app.database.usage import month_key, month_usage_by_industry
+from lead_generation_app.config.pricing import BASE_PLANS, LEAD_PRICING, PAY_PER_LEAD_CAP, INDUSTRY_TIERS, TRIAL_CONFIG
+from lead_generation_app.metrics import inc_skip_cap, inc_skip_inactive, inc_trial_used
+
+
+def _tier_for(industry):
+    key = (industry or "").lower().replace(" ", "_")
+    return INDUSTRY_TIERS.get(key, "basic")
+
+
+_CHUNK = 500
+
+
+class ClientQuota:
+    """
+    Usage state for one client: paid payments as (plan_name, payment_date)
+    in id order, deliveries this month per industry, and deliveries inside
+    the trial window. Plans update it as they reserve leads, so it can be
+    handed from one sender to the next within a run.
+    """
+
+    def __init__(self, payments, month_by_industry=None, trial_delivered=0):
+        self.payments = list(payments or [])
+        self.month_by_industry = dict(month_by_industry or {})
+        self.trial_delivered = int(trial_delivered)
+
+
+def load_payments(s, client_ids):
+    out = {int(c): [] for c in client_ids}
+    ids = list(out)
+    for i in range(0, len(ids), _CHUNK):
+        for cid, name, when in s.execute(
+            select(Payment.business_client_id, Payment.plan_name, Payment.payment_date)
+            .where(Payment.business_client_id.in_(ids[i:i + _CHUNK]))
+            .where(Payment.payment_status.in_(["paid", "success"]))
+            .order_by(Payment.id)
+        ).all():
+            out[cid].append((name, when))
+    return out
+
+
+def load_quotas(s, client_ids, now=None, payments=None):
+    """
+    Return {client_id: ClientQuota}. Month-to-date counts per industry come
+    from the client_usage_monthly rollup; only clients inside a trial add
+    one grouped count over delivered_leads, with each client's trial window
+    supplied through a CASE on the client id.
+    """
+    now = now or datetime.utcnow()
+    ids = [int(c) for c in client_ids]
+    if payments is None:
+        payments = load_payments(s, ids)
+    out = {c: ClientQuota(payments.get(c, [])) for c in ids}
+    for cid, counts in month_usage_by_industry(s, ids, month_key(now)).items():
+        out[cid].month_by_industry = counts
+    trials = {c: w for c in ids for w in [trial_window(out[c].payments, now)] if w}
+    if trials:
+        trial_ids = list(trials)
+        starts = case({c: w[0] for c, w in trials.items()}, value=DeliveredLead.business_client_id)
+        ends = case({c: w[1] for c, w in trials.items()}, value=DeliveredLead.business_client_id)
+        for i in range(0, len(trial_ids), _CHUNK):
+            for cid, n in s.execute(
+                select(DeliveredLead.business_client_id, func.count(DeliveredLead.id))
+                .where(DeliveredLead.business_client_id.in_(trial_ids[i:i + _CHUNK]))
+                .where(DeliveredLead.delivered_at >= starts)
+                .where(DeliveredLead.delivered_at <= ends)
+                .group_by(DeliveredLead.business_client_id)
+            ).all():
+                out[cid].trial_delivered = int(n)
+    return out
+
+
+class DeliveryPlan:
+    """
+    Quota, trial and price decisions for one client and one delivery run.
+    State is loaded once (client payments plus the monthly usage rollup)
+    unless a ClientQuota is passed in; every lead is then decided in memory
+    and deliveries are written together by flush().
+    """
+
+    def __init__(self, s, bc, method, now=None, quota=None):
+        self.s = s
+        self.bc = bc
+        self.method = method
+        self.now = now or datetime.utcnow()
+        self.quota = quota if quota is not None else load_quotas(s, [bc.id], self.now)[bc.id]
+        self.active = client_active(bc, bool(self.quota.payments), self.now)
+        self.plan = BASE_PLANS.get(bc.subscription_plan) if bc.subscription_plan else None
+        self.trial_active = trial_window(self.quota.payments, self.now) is not None
+        self.trial_used = self.quota.trial_delivered if self.trial_active else 0
+        self.industry_counts = self.quota.month_by_industry
+        self.delivered_month = sum(self.industry_counts.values())
+        self.tier_counts = {}
+        self.pending = []
+
+    def decide(self, lead):
+        """
+        Return (reason, price) for lead. reason is None when the lead may be
+        sent; skips are counted in metrics here.
+        """
+        tier = _tier_for(lead.industry)
+        price = LEAD_PRICING.get(tier, 0)
+        if not self.active and not self.trial_active and not self.plan:
+            inc_skip_inactive(self.bc.id, self.method, lead.industry)
+            return "inactive", None
+        if self.plan:
+            if self.delivered_month >= int(self.plan.get("lead_cap", 0)):
+                inc_skip_cap(self.bc.id, self.method, lead.industry)
+                return "cap_reached_subscription", None
+            price = max(0, round(price * (1 - float(self.plan.get("discount", 0))), 2))
+        else:
+            # A tier's running count starts from the first industry seen in
+            # that tier, matching how per-tier caps were always enforced.
+            if tier not in self.tier_counts:
+                self.tier_counts[tier] = self.industry_counts.get(lead.industry, 0)
+            if self.tier_counts[tier] >= int(PAY_PER_LEAD_CAP.get(tier, 0)):
+                inc_skip_cap(self.bc.id, self.method, lead.industry)
+                return "cap_reached_ppl", None
+        if self.trial_active and self.trial_used < int(TRIAL_CONFIG.get("leads", 0)):
+            price = 0
+            self.trial_used += 1
+            inc_trial_used(self.bc.id, self.method, lead.industry)
+        return None, price
+
+    def reserve(self, lead):
+        """Count lead against the client's caps for the rest of this run."""
+        self.delivered_month += 1
+        self.industry_counts[lead.industry] = self.industry_counts.get(lead.industry, 0) + 1
+        if self.trial_active:
+            self.quota.trial_delivered += 1
+        if not self.plan:
+            tier = _tier_for(lead.industry)
+            self.tier_counts[tier] = self.tier_counts.get(tier, 0) + 1
+
+    def release(self, lead):
+        """Undo reserve() for a lead whose send failed."""
+        self.delivered_month -= 1
+        n = self.industry_counts.get(lead.industry, 0) - 1
+        if n > 0:
+            self.industry_counts[lead.industry] = n
+        else:
+            self.industry_counts.pop(lead.industry, None)
+        if self.trial_active:
+            self.quota.trial_delivered -= 1
+        if not self.plan:
+            tier = _tier_for(lead.industry)
+            self.tier_counts[tier] = self.tier_counts.get(tier, 0) - 1
+
+    def record(self, lead):
+        self.pending.append((lead.id, lead.industry))
+
+    def flush(self):
+        """Write every recorded delivery in one insert and commit."""
+        pending, self.pending = self.pending, []
+        if not pending:
+            return 0
+        try:
+            written = record_deliveries(self.s, [i for i, _ in pending], self.bc.id, self.method, delivered_at=self.now, industries=dict(pending))
+            self.s.commit()
+            return written
+        except Exception:
+            self.s.rollback()
+            raise
@@ -0,0 +1,151 @@
+import os
+import math
+import time
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from lead_generation_app.database.models import OptOut, Bounce
+
+_CHUNK = 500
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate=0.01):
+        capacity = max(1, int(capacity))
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, value):
+        d = hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+        h1 = int.from_bytes(d[:8], "little")
+        h2 = int.from_bytes(d[8:], "little") | 1
+        return [(h1 + i * h2) % self.size for i in range(self.hashes)]
+
+    def add(self, value):
+        for p in self._positions(value):
+            self.bits[p >> 3] |= 1 << (p & 7)
+        self.count += 1
+
+    def __contains__(self, value):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(value))
+
+
+class _OptOutIndex:
+    """
+    Bloom filter over opt-out values for one method. It is topped up from
+    rows with an id above the last one seen, so opt-outs recorded by other
+    processes are picked up on the next lookup. Ids are handed out before
+    commit, so a row can become visible after one with a higher id: each
+    top-up also re-reads rows created within the last window seconds, and
+    the filter is rebuilt from scratch every rebuild seconds for anything
+    older. A hit still goes to the database, so false positives never
+    suppress a delivery.
+    """
+
+    def __init__(self, method, capacity, window=600, rebuild=3600):
+        self.method = method
+        self.capacity = int(capacity)
+        self.window = timedelta(seconds=int(window))
+        self.rebuild = float(rebuild)
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.bloom = BloomFilter(self.capacity)
+        self.last_id = 0
+        self.loaded_at = None
+        self.built_at = time.monotonic()
+
+    def _add(self, value):
+        # Re-read rows are usually present already; skipping them keeps
+        # count close to the number of distinct values.
+        if value and value not in self.bloom:
+            self.bloom.add(value)
+
+    def _load(self, session):
+        started = datetime.utcnow()
+        base = select(OptOut.id, OptOut.value).where(OptOut.method == self.method)
+        if self.loaded_at is not None:
+            recent = base.where(OptOut.created_at >= self.loaded_at - self.window).where(OptOut.id <= self.last_id)
+            for _, value in session.execute(recent):
+                self._add(value)
+        q = base.where(OptOut.id > self.last_id).order_by(OptOut.id)
+        for oid, value in session.execute(q.execution_options(yield_per=5000)):
+            self._add(value)
+            self.last_id = oid
+        self.loaded_at = started
+
+    def refresh(self, session):
+        with self.lock:
+            if time.monotonic() - self.built_at > self.rebuild:
+                self._reset()
+            self._load(session)
+            if self.bloom.count > self.capacity:
+                self.capacity *= 2
+                self._reset()
+                self._load(session)
+
+    def add(self, value):
+        with self.lock:
+            self.bloom.add(value)
+
+    def might_contain(self, value):
+        return value in self.bloom
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def _bloom_enabled():
+    return os.getenv("SUPPRESSION_BLOOM", "0").lower() in ("1", "true", "yes")
+
+
+def _index_for(method):
+    with _indexes_lock:
+        idx = _indexes.get(method)
+        if idx is None:
+            idx = _OptOutIndex(
+                method,
+                int(os.getenv("SUPPRESSION_BLOOM_CAPACITY", "100000")),
+                window=int(os.getenv("SUPPRESSION_BLOOM_WINDOW", "600")),
+                rebuild=float(os.getenv("SUPPRESSION_BLOOM_REBUILD", "3600")),
+            )
+            _indexes[method] = idx
+        return idx
+
+
+def note_opt_out(method, value):
+    with _indexes_lock:
+        idx = _indexes.get(method)
+    if idx is not None and value:
+        idx.add(value)
+
+
+def load_suppressed(session, method, values):
+    """
+    Return the subset of values that must not receive a delivery for method,
+    using one IN query per 500 candidates instead of a query per lead.
+    """
+    candidates = list(dict.fromkeys(v for v in (values or []) if v))
+    if not candidates:
+        return set()
+    opt_candidates = candidates
+    if _bloom_enabled():
+        idx = _index_for(method)
+        idx.refresh(session)
+        opt_candidates = [v for v in candidates if idx.might_contain(v)]
+    out = set()
+    for i in range(0, len(opt_candidates), _CHUNK):
+        chunk = opt_candidates[i:i + _CHUNK]
+        out.update(session.execute(select(OptOut.value).where(OptOut.method == method).where(OptOut.value.in_(chunk))).scalars().all())
+    if os.getenv("SUPPRESS_BOUNCED", "0").lower() in ("1", "true", "yes"):
+        for i in range(0, len(candidates), _CHUNK):
+            chunk = candidates[i:i + _CHUNK]
+            out.update(session.execute(select(Bounce.target).where(Bounce.method == method).where(Bounce.target.in_(chunk))).scalars().all())
+    logging.info("{\"event\":\"suppression_loaded\",\"method\":\"%s\",\"candidates\":%d,\"suppressed\":%d}" % (method, len(candidates), len(out)))
+    return out
@@ -0,0 +1,151 @@
+import os
+import time
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select
+from lead_generation_app.config.pricing import BASE_PLANS, GRACE_PERIOD_DAYS, TRIAL_CONFIG
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import BusinessClient, Payment
+from lead_generation_app.metrics import inc_cache_hit, inc_cache_miss
+
+_CHUNK = 500
+
+
+def client_active(bc, has_paid, now):
+    if not bc.subscription_plan:
+        return has_paid
+    if not bc.next_billing_date:
+        return False
+    if bc.next_billing_date <= now and bc.next_billing_date + timedelta(days=GRACE_PERIOD_DAYS) <= now:
+        return False
+    return has_paid
+
+
+def trial_window(payments, now):
+    """
+    Return (start, deadline) of the client's trial when it is still running,
+    given paid payments as (plan_name, payment_date) in id order.
+    """
+    trial_date = next((d for name, d in payments if name == "trial"), None)
+    if trial_date is None:
+        return None
+    deadline = trial_date + timedelta(days=int(TRIAL_CONFIG.get("days_valid", 7)))
+    return (trial_date, deadline) if now <= deadline else None
+
+
+def _entitlement(bc, payments, now):
+    plan = BASE_PLANS.get(bc.subscription_plan) if bc.subscription_plan else None
+    trial = trial_window(payments, now)
+    return {
+        "client_id": bc.id,
+        "active": client_active(bc, bool(payments), now),
+        "plan": bc.subscription_plan,
+        "lead_cap": int(plan.get("lead_cap", 0)) if plan else None,
+        "discount": float(plan.get("discount", 0)) if plan else None,
+        "trial_start": trial[0] if trial else None,
+        "trial_end": trial[1] if trial else None,
+        "is_deleted": bool(bc.is_deleted),
+    }
+
+
+def _load(client_ids):
+    now = datetime.utcnow()
+    out = {}
+    s = get_session()
+    try:
+        for i in range(0, len(client_ids), _CHUNK):
+            chunk = client_ids[i:i + _CHUNK]
+            payments = {c: [] for c in chunk}
+            for cid, name, when in s.execute(
+                select(Payment.business_client_id, Payment.plan_name, Payment.payment_date)
+                .where(Payment.business_client_id.in_(chunk))
+                .where(Payment.payment_status.in_(["paid", "success"]))
+                .order_by(Payment.id)
+            ).all():
+                payments[cid].append((name, when))
+            for bc in s.execute(select(BusinessClient).where(BusinessClient.id.in_(chunk))).scalars().all():
+                out[bc.id] = _entitlement(bc, payments[bc.id], now)
+    finally:
+        s.close()
+    return out
+
+
+class EntitlementCache:
+    """
+    Per-client active status, plan limits and trial window, loaded in bulk
+    and kept for ttl seconds. Writers that change payments, plans or client
+    state call invalidate(), but that only clears the cache of the process
+    that made the change; workers and other web processes keep their copy
+    until it expires. The TTL is therefore the bound on how stale another
+    process's view can be, and defaults to a few seconds.
+    """
+
+    def __init__(self, ttl=5):
+        self.ttl = float(ttl)
+        self.lock = threading.Lock()
+        self.entries = {}
+        self.generation = 0
+
+    def get_many(self, client_ids):
+        ids = list(dict.fromkeys(int(c) for c in client_ids or []))
+        now = time.monotonic()
+        out = {}
+        missing = []
+        with self.lock:
+            generation = self.generation
+            for c in ids:
+                e = self.entries.get(c)
+                if e and now - e[0] <= self.ttl:
+                    out[c] = e[1]
+                else:
+                    missing.append(c)
+        for _ in out:
+            inc_cache_hit("entitlements")
+        for _ in missing:
+            inc_cache_miss("entitlements")
+        if missing:
+            loaded = _load(missing)
+            with self.lock:
+                # An invalidation that raced with the load wins; the rows are
+                # still returned to this caller but not kept.
+                if generation == self.generation:
+                    for c, ent in loaded.items():
+                        self.entries[c] = (now, ent)
+            out.update(loaded)
+        return out
+
+    def invalidate(self, client_ids=None):
+        with self.lock:
+            self.generation += 1
+            if client_ids is None:
+                self.entries.clear()
+            else:
+                for c in client_ids:
+                    self.entries.pop(int(c), None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def _get_cache():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = EntitlementCache(ttl=float(os.getenv("ENTITLEMENT_TTL", "5")))
+        return _cache
+
+
+def get_entitlements(client_ids):
+    """Return {client_id: entitlement dict}; unknown ids are left out."""
+    return _get_cache().get_many(client_ids)
+
+
+def get_entitlement(client_id):
+    return get_entitlements([client_id]).get(int(client_id))
+
+
+def invalidate(client_ids=None):
+    _get_cache().invalidate(client_ids)
+    logging.info("{\"event\":\"entitlements_invalidated\",\"clients\":\"%s\"}" % ("all" if client_ids is None else ",".join(str(int(c)) for c in client_ids)))
@@ -1,75 +1,845 @@
+import os
+import json
 import time
+import uuid
+import heapq
+import random
 import logging
+import inspect
+import importlib
+import itertools
 import threading
-from queue import Queue
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, delete, insert, func, case, or_, and_
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import JobRecord, DeadLetterJob
+from lead_generation_app.metrics import observe_job, set_queue_gauges
 
 
 class Job:
-    def __init__(self, fn, args=None, kwargs=None, retries=3, backoff=0.5):
+    def __init__(self, fn=None, args=None, kwargs=None, retries=3, backoff=0.5, job_type=None, priority=0, idempotency_key=None):
         self.fn = fn
         self.args = args or []
         self.kwargs = kwargs or {}
         self.retries = int(retries)
         self.backoff = float(backoff)
+        self.job_type = job_type
+        self.priority = int(priority)
+        self.idempotency_key = idempotency_key
+        self.id = None
+        self.attempts = 0
+        self.token = None
+        self.ready_at = None
+
+
+_handlers = {}
+_handlers_lock = threading.Lock()
+
+
+def register_handler(name, fn):
+    """
+    Make fn runnable by name. Jobs stored outside the process (the sql
+    backend) carry only the name, so every worker process registers the
+    same handlers at startup.
+    """
+    with _handlers_lock:
+        _handlers[name] = fn
+    return fn
+
+
+def handler(name):
+    def deco(fn):
+        return register_handler(name, fn)
+    return deco
+
+
+def handler_for(job_type):
+    with _handlers_lock:
+        fn = _handlers.get(job_type)
+    if fn is None:
+        raise LookupError(f"no handler registered for job type {job_type}")
+    return fn
+
+
+def _resolve(job):
+    return job.fn if job.fn is not None else handler_for(job.job_type)
+
+
+def _job_type_for(fn):
+    if isinstance(fn, str):
+        return fn
+    with _handlers_lock:
+        for name, h in _handlers.items():
+            if h is fn or h == fn:
+                return name
+    return None
+
+
+class RetryPolicy:
+    """
+    How often and how late a failed job is retried: attempt n waits
+    base * factor**(n-1) seconds, capped at max_delay, with up to jitter
+    (a fraction) of that delay randomised so failing jobs do not retry in
+    lockstep.
+    """
+
+    def __init__(self, max_retries=3, base=0.5, factor=2.0, max_delay=300.0, jitter=0.1):
+        self.max_retries = int(max_retries)
+        self.base = float(base)
+        self.factor = float(factor)
+        self.max_delay = float(max_delay)
+        self.jitter = min(1.0, max(0.0, float(jitter)))
+
+    def delay(self, attempt):
+        d = min(self.max_delay, self.base * (self.factor ** max(0, int(attempt) - 1)))
+        return d * (1 - self.jitter) + random.uniform(0, d * self.jitter)
+
+
+_policies = {}
+
+
+def set_retry_policy(job_type, policy):
+    """Use policy for every job of job_type instead of its own retries/backoff."""
+    with _handlers_lock:
+        _policies[job_type] = policy
+
+
+def policy_for(job):
+    with _handlers_lock:
+        policy = _policies.get(job.job_type)
+    if policy is not None:
+        return policy
+    return RetryPolicy(
+        max_retries=job.retries,
+        base=job.backoff,
+        max_delay=float(os.getenv("JOB_RETRY_MAX_DELAY", "300")),
+        jitter=float(os.getenv("JOB_RETRY_JITTER", "0.1")),
+    )
+
+
+class MemoryBackend:
+    """
+    Process-local queue for tests and single-process runs: jobs are lost on
+    restart. Higher priority runs first, FIFO within a priority. Retries
+    wait in a heap ordered by their not-before time and move to the ready
+    heap when due.
+    """
+
+    def __init__(self):
+        self.cond = threading.Condition()
+        self.heap = []
+        self.delayed = []
+        self.seq = itertools.count()
+        self.keys = set()
+        self.dead = []
+
+    def put(self, job):
+        with self.cond:
+            if job.idempotency_key is not None:
+                if job.idempotency_key in self.keys:
+                    return False
+                self.keys.add(job.idempotency_key)
+            job.id = next(self.seq)
+            job.ready_at = time.monotonic()
+            heapq.heappush(self.heap, (-job.priority, job.id, job))
+            self.cond.notify()
+        return True
+
+    def _promote(self, now):
+        while self.delayed and self.delayed[0][0] <= now:
+            due, _, job = heapq.heappop(self.delayed)
+            job.ready_at = due
+            heapq.heappush(self.heap, (-job.priority, job.id, job))
+
+    def _pop(self, skip_types):
+        skipped = []
+        job = None
+        while self.heap:
+            entry = heapq.heappop(self.heap)
+            if skip_types and entry[2].job_type in skip_types:
+                skipped.append(entry)
+                continue
+            job = entry[2]
+            break
+        for entry in skipped:
+            heapq.heappush(self.heap, entry)
+        return job
+
+    def claim(self, timeout=0.5, skip_types=None):
+        with self.cond:
+            self._promote(time.monotonic())
+            job = self._pop(skip_types)
+            if job is None:
+                wait = float(timeout)
+                if self.delayed:
+                    wait = min(wait, max(0.0, self.delayed[0][0] - time.monotonic()))
+                self.cond.wait(wait)
+                self._promote(time.monotonic())
+                job = self._pop(skip_types)
+            if job is None:
+                return None
+        job.attempts += 1
+        return job
+
+    def ack(self, job):
+        return True
+
+    def renew(self, job):
+        # Claimed jobs never expire here.
+        return True
+
+    def retry(self, job, error, delay):
+        with self.cond:
+            heapq.heappush(self.delayed, (time.monotonic() + float(delay), next(self.seq), job))
+            self.cond.notify()
+        return True
+
+    def fail(self, job, error):
+        with self.cond:
+            self.dead.append({"id": job.id, "job_type": job.job_type, "fn": str(job.fn), "args": job.args, "kwargs": job.kwargs, "attempts": job.attempts, "error": str(error)})
+        return True
+
+    def depth(self):
+        with self.cond:
+            return len(self.heap) + len(self.delayed)
+
+    def stats(self):
+        now = time.monotonic()
+        with self.cond:
+            self._promote(now)
+            oldest = min((j.ready_at for _, _, j in self.heap), default=now)
+            return {"ready": len(self.heap), "delayed": len(self.delayed), "oldest_age": now - oldest}
+
+    def dead_letter(self):
+        with self.cond:
+            return list(self.dead)
+
+
+class SqlBackend:
+    """
+    Durable queue in job_queue. A claim leases one job for lease_seconds
+    and the worker renews the lease while the job runs; a worker that dies
+    mid-job stops renewing, the lease expires and the job is claimed again
+    (at-least-once). Jobs claimed more than max_attempts times are moved to
+    job_dead_letter instead of running again.
+    """
+
+    def __init__(self, lease_seconds=300, poll_interval=1.0):
+        self.lease_seconds = int(lease_seconds)
+        self.poll_interval = float(poll_interval)
+        self.heartbeat_interval = max(0.1, self.lease_seconds / 3.0)
+
+    def put(self, job):
+        if job.job_type is None:
+            raise ValueError(f"{job.fn!r} is not a registered job handler; the sql job backend stores jobs by handler name")
+        now = datetime.utcnow()
+        row = {
+            "job_type": job.job_type,
+            "payload_json": json.dumps({"args": list(job.args), "kwargs": dict(job.kwargs), "retries": job.retries, "backoff": job.backoff}),
+            "priority": job.priority,
+            "status": "pending",
+            "attempts": 0,
+            "max_attempts": policy_for(job).max_retries + 1,
+            "idempotency_key": job.idempotency_key,
+            "run_after": now,
+            "created_at": now,
+            "updated_at": now,
+        }
+        s = get_session()
+        try:
+            dialect = s.get_bind().dialect.name
+            if job.idempotency_key is not None and dialect in ("postgresql", "sqlite"):
+                if dialect == "postgresql":
+                    from sqlalchemy.dialects.postgresql import insert as dialect_insert
+                else:
+                    from sqlalchemy.dialects.sqlite import insert as dialect_insert
+                stmt = dialect_insert(JobRecord).values(**row).on_conflict_do_nothing(index_elements=["idempotency_key"]).returning(JobRecord.id)
+            else:
+                stmt = insert(JobRecord).values(**row).returning(JobRecord.id)
+            job.id = s.execute(stmt).scalar()
+            s.commit()
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+        return job.id is not None
+
+    def _claimable(self, now):
+        return or_(
+            and_(JobRecord.status == "pending", or_(JobRecord.run_after.is_(None), JobRecord.run_after <= now)),
+            and_(JobRecord.status == "running", JobRecord.lease_until < now),
+        )
+
+    def _lease(self, skip_types=None):
+        now = datetime.utcnow()
+        token = uuid.uuid4().hex
+        lease = {"status": "running", "lease_token": token, "lease_until": now + timedelta(seconds=self.lease_seconds), "attempts": JobRecord.attempts + 1, "updated_at": now}
+        s = get_session()
+        try:
+            candidate = select(JobRecord.id).where(self._claimable(now)).order_by(JobRecord.priority.desc(), JobRecord.id).limit(1)
+            if skip_types:
+                candidate = candidate.where(JobRecord.job_type.not_in(list(skip_types)))
+            if s.get_bind().dialect.name == "postgresql":
+                ids = s.execute(candidate.with_for_update(skip_locked=True)).scalars().all()
+                if ids:
+                    s.execute(update(JobRecord).where(JobRecord.id.in_(ids)).values(**lease))
+            else:
+                s.execute(update(JobRecord).where(JobRecord.id.in_(candidate.scalar_subquery())).where(self._claimable(now)).values(**lease))
+            s.commit()
+            return s.execute(select(JobRecord).where(JobRecord.lease_token == token)).scalars().first()
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+
+    def claim(self, timeout=0.5, skip_types=None):
+        row = self._lease(skip_types)
+        while row is not None:
+            payload = json.loads(row.payload_json or "{}")
+            job = Job(args=payload.get("args"), kwargs=payload.get("kwargs"), retries=payload.get("retries", row.max_attempts - 1), backoff=payload.get("backoff", 0.5), job_type=row.job_type, priority=row.priority, idempotency_key=row.idempotency_key)
+            job.id, job.attempts, job.token = row.id, row.attempts, row.lease_token
+            if row.attempts <= row.max_attempts:
+                return job
+            # Leases kept expiring: the job keeps killing or hanging its worker.
+            self.fail(job, row.last_error or "lease expired %d times" % (row.attempts - 1))
+            row = self._lease(skip_types)
+        time.sleep(min(float(timeout), self.poll_interval))
+        return None
+
+    def _finish(self, s, job, values):
+        res = s.execute(update(JobRecord).where(JobRecord.id == job.id).where(JobRecord.lease_token == job.token).values(**values))
+        return res.rowcount == 1
+
+    def renew(self, job):
+        """Push a running job's lease forward; False once the lease is lost."""
+        now = datetime.utcnow()
+        s = get_session()
+        try:
+            ok = self._finish(s, job, {"lease_until": now + timedelta(seconds=self.lease_seconds), "updated_at": now})
+            s.commit()
+            return ok
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+
+    def ack(self, job):
+        s = get_session()
+        try:
+            if job.idempotency_key is None:
+                ok = s.execute(delete(JobRecord).where(JobRecord.id == job.id).where(JobRecord.lease_token == job.token)).rowcount == 1
+            else:
+                # Keyed jobs stay as "done" so the key keeps deduplicating.
+                ok = self._finish(s, job, {"status": "done", "lease_token": None, "lease_until": None, "updated_at": datetime.utcnow()})
+            s.commit()
+            return ok
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+
+    def retry(self, job, error, delay):
+        now = datetime.utcnow()
+        s = get_session()
+        try:
+            ok = self._finish(s, job, {"status": "pending", "lease_token": None, "lease_until": None, "run_after": now + timedelta(seconds=float(delay)), "last_error": str(error), "updated_at": now})
+            s.commit()
+            return ok
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+
+    def fail(self, job, error):
+        now = datetime.utcnow()
+        s = get_session()
+        try:
+            ok = self._finish(s, job, {"status": "dead", "lease_token": None, "lease_until": None, "last_error": str(error), "updated_at": now})
+            if ok:
+                s.add(DeadLetterJob(job_id=job.id, job_type=job.job_type, payload_json=json.dumps({"args": list(job.args), "kwargs": dict(job.kwargs)}), attempts=job.attempts, error=str(error), failed_at=now))
+            s.commit()
+            return ok
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+
+    def depth(self):
+        s = get_session()
+        try:
+            return s.execute(select(func.count(JobRecord.id)).where(JobRecord.status.in_(["pending", "running"]))).scalar_one()
+        finally:
+            s.close()
+
+    def stats(self):
+        now = datetime.utcnow()
+        due = or_(JobRecord.run_after.is_(None), JobRecord.run_after <= now)
+        s = get_session()
+        try:
+            ready, delayed, oldest = s.execute(
+                select(
+                    func.count(case((due, 1))),
+                    func.count(case((~due, 1))),
+                    func.min(case((due, JobRecord.run_after))),
+                ).where(JobRecord.status == "pending")
+            ).one()
+        finally:
+            s.close()
+        return {"ready": int(ready), "delayed": int(delayed), "oldest_age": (now - oldest).total_seconds() if oldest else 0.0}
+
+    def dead_letter(self):
+        s = get_session()
+        try:
+            rows = s.execute(select(DeadLetterJob).order_by(DeadLetterJob.id)).scalars().all()
+            out = []
+            for r in rows:
+                payload = json.loads(r.payload_json or "{}")
+                out.append({"id": r.job_id, "job_type": r.job_type, "fn": r.job_type, "args": payload.get("args", []), "kwargs": payload.get("kwargs", {}), "attempts": r.attempts, "error": r.error})
+            return out
+        finally:
+            s.close()
+
+
+class JobDescriptor:
+    """
+    Picklable form of a job for another process: its type, the import path
+    of its handler ("module:qualname") and its arguments.
+    """
+
+    def __init__(self, job_type, target, args=None, kwargs=None):
+        self.job_type = job_type
+        self.target = target
+        self.args = list(args or [])
+        self.kwargs = dict(kwargs or {})
+
+
+def describe(job):
+    fn = _resolve(job)
+    module, qualname = getattr(fn, "__module__", None), getattr(fn, "__qualname__", "")
+    if not module or "<" in qualname or inspect.ismethod(fn):
+        raise ValueError(f"{fn!r} cannot run in a process pool; register a module-level function for job type {job.job_type}")
+    return JobDescriptor(job.job_type, "%s:%s" % (module, qualname), job.args, job.kwargs)
+
+
+def run_descriptor(desc):
+    module, qualname = desc.target.split(":", 1)
+    fn = importlib.import_module(module)
+    for part in qualname.split("."):
+        fn = getattr(fn, part)
+    return fn(*desc.args, **desc.kwargs)
+
+
+class ProcessExecutor:
+    """
+    Runs CPU-bound jobs in a process pool so they do not contend for the
+    GIL. Each child is replaced after max_tasks_per_child jobs. Every
+    running job holds one of workers slots: a worker reserves a slot before
+    it claims a process-routed job, so it never holds a lease while waiting
+    for a process, and call() waits for a slot before it starts.
+    """
+
+    def __init__(self, workers=None, max_tasks_per_child=None, start_method="spawn"):
+        self.workers = max(1, int(workers or os.cpu_count() or 1))
+        # fork would copy the parent's threads and pooled DB connections.
+        self.pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context(start_method),
+            max_tasks_per_child=int(max_tasks_per_child) if max_tasks_per_child else None,
+        )
+        self.slots = threading.BoundedSemaphore(self.workers)
+
+    def reserve(self):
+        """Take a free slot without waiting; False when every slot is busy."""
+        return self.slots.acquire(blocking=False)
+
+    def release(self):
+        self.slots.release()
+
+    def submit(self, job, done, reserved=False):
+        """Start job and call done(error) when it finishes."""
+        if not reserved:
+            self.slots.acquire()
+        try:
+            fut = self.pool.submit(run_descriptor, describe(job))
+        except Exception:
+            self.slots.release()
+            raise
+
+        def _finished(f):
+            self.slots.release()
+            done(RuntimeError("cancelled") if f.cancelled() else f.exception())
+
+        fut.add_done_callback(_finished)
+
+    def call(self, job):
+        """Run job in the pool and return its result."""
+        desc = describe(job)
+        with self.slots:
+            return self.pool.submit(run_descriptor, desc).result()
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+
+_process_types = None
+_process_executor = None
+_executor_lock = threading.Lock()
+
+
+def set_process_job_types(job_types):
+    """
+    Route job_types to the process pool; everything else runs on worker
+    threads. None goes back to JOB_PROCESS_TYPES.
+    """
+    global _process_types
+    with _executor_lock:
+        _process_types = None if job_types is None else frozenset(job_types)
+
+
+def process_job_types():
+    global _process_types
+    with _executor_lock:
+        if _process_types is None:
+            _process_types = frozenset(t.strip() for t in os.getenv("JOB_PROCESS_TYPES", "").split(",") if t.strip())
+        return _process_types
+
+
+def routes_to_process(job_type):
+    return job_type in process_job_types()
+
+
+def call(job_type, *args, **kwargs):
+    """
+    Run job_type's handler now and return its result: in the process pool
+    when job_type is listed in JOB_PROCESS_TYPES, on this thread otherwise.
+    Pipelines use it to move CPU-bound stages off the GIL.
+    """
+    job = Job(args=list(args), kwargs=kwargs, job_type=job_type)
+    if routes_to_process(job_type):
+        return get_process_executor().call(job)
+    return _resolve(job)(*args, **kwargs)
+
+
+def get_process_executor():
+    global _process_executor
+    with _executor_lock:
+        if _process_executor is None:
+            _process_executor = ProcessExecutor(
+                workers=int(os.getenv("JOB_PROCESS_WORKERS", "0")) or None,
+                max_tasks_per_child=int(os.getenv("JOB_PROCESS_MAX_TASKS", "100")),
+                start_method=os.getenv("JOB_PROCESS_START_METHOD", "spawn"),
+            )
+            logging.info("{\"event\":\"process_pool_started\",\"workers\":%d}" % _process_executor.workers)
+        return _process_executor
+
+
+class LeaseHeartbeat(threading.Thread):
+    """
+    Renews a claimed job's lease every interval seconds until stopped, so a
+    job that outlives one lease is not claimed again while it still runs.
+    """
+
+    def __init__(self, backend, job, interval):
+        super().__init__(daemon=True)
+        self.backend = backend
+        self.job = job
+        self.interval = float(interval)
+        self.stop_evt = threading.Event()
+
+    def run(self):
+        while not self.stop_evt.wait(self.interval):
+            try:
+                if not self.backend.renew(self.job):
+                    logging.warning("{\"event\":\"job_lease_lost\",\"job_type\":\"%s\",\"id\":%s}" % (self.job.job_type or "", self.job.id))
+                    return
+            except Exception as e:
+                logging.error("{\"event\":\"job_lease_renew_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+
+    def stop(self):
+        self.stop_evt.set()
+
+
+def _heartbeat(backend, job):
+    interval = getattr(backend, "heartbeat_interval", None)
+    if not interval:
+        return None
+    hb = LeaseHeartbeat(backend, job, interval)
+    hb.start()
+    return hb
 
 
 class Worker(threading.Thread):
-    def __init__(self, q, dead_letter):
+    def __init__(self, backend):
         super().__init__(daemon=True)
-        self.q = q
-        self.dead = dead_letter
+        self.backend = backend
         self.stop_evt = threading.Event()
+        self.busy = False
+
+    def _claim(self):
+        """
+        Claim the next job. Process-routed types are only claimed with a
+        pool slot reserved for them; returns (job, reserved).
+        """
+        types = process_job_types()
+        reserved = bool(types) and get_process_executor().reserve()
+        try:
+            job = self.backend.claim(timeout=0.5, skip_types=types if types and not reserved else None)
+        except Exception:
+            if reserved:
+                get_process_executor().release()
+            raise
+        if reserved and (job is None or not routes_to_process(job.job_type)):
+            get_process_executor().release()
+            reserved = False
+        return job, reserved
 
     def run(self):
         while not self.stop_evt.is_set():
             try:
-                job = self.q.get(timeout=0.5)
-            except Exception:
+                job, reserved = self._claim()
+            except Exception as e:
+                logging.error("{\"event\":\"job_claim_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+                self.stop_evt.wait(1.0)
                 continue
-            tries = 0
-            while tries <= job.retries:
-                try:
-                    job.fn(*job.args, **job.kwargs)
-                    break
-                except Exception as e:
-                    tries += 1
-                    if tries > job.retries:
-                        self.dead.append({"fn": str(job.fn), "args": job.args, "kwargs": job.kwargs, "error": str(e)})
-                        logging.error("{\"event\":\"job_failed\"}")
-                        break
-                    time.sleep(job.backoff * (2 ** (tries - 1)))
-            self.q.task_done()
+            if job is None:
+                continue
+            self.busy = True
+            try:
+                self._execute(job, reserved)
+            finally:
+                self.busy = False
+
+    def _execute(self, job, reserved=False):
+        started = time.perf_counter()
+        hb = _heartbeat(self.backend, job)
+        if routes_to_process(job.job_type):
+            # The outcome is settled from the pool's callback; this thread
+            # goes back to claiming.
+            try:
+                get_process_executor().submit(job, lambda error: self._settle(job, error, started, hb), reserved=reserved)
+            except Exception as e:
+                self._settle(job, e, started, hb)
+            return
+        try:
+            _resolve(job)(*job.args, **job.kwargs)
+            error = None
+        except Exception as e:
+            error = e
+        self._settle(job, error, started, hb)
+
+    def _settle(self, job, error, started, hb=None):
+        if hb is not None:
+            hb.stop()
+        observe_job(job.job_type, time.perf_counter() - started, error is None)
+        try:
+            if error is None:
+                self.backend.ack(job)
+                return
+            policy = policy_for(job)
+            if job.attempts <= policy.max_retries:
+                # The retry waits in the backend, not on this thread.
+                delay = policy.delay(job.attempts)
+                self.backend.retry(job, error, delay)
+                logging.info("{\"event\":\"job_retry_scheduled\",\"job_type\":\"%s\",\"attempt\":%d,\"delay_ms\":%d}" % (job.job_type or "", job.attempts, int(delay * 1000)))
+                return
+            self.backend.fail(job, error)
+            logging.error("{\"event\":\"job_failed\",\"job_type\":\"%s\",\"error\":\"%s\"}" % (job.job_type or "", str(error).replace("\"", "'")))
+        except Exception as e:
+            # The job ran; if its outcome could not be stored the lease
+            # expires and it runs again.
+            logging.error("{\"event\":\"job_ack_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
 
     def stop(self):
         self.stop_evt.set()
 
 
-_queue = Queue()
-_dead_letter = []
+_backend = None
+_backend_lock = threading.Lock()
 _workers = []
+_workers_lock = threading.Lock()
+
+
+def make_backend(name=None):
+    name = (name or os.getenv("JOB_BACKEND", "memory")).lower()
+    if name == "memory":
+        return MemoryBackend()
+    if name == "sql":
+        return SqlBackend(lease_seconds=int(os.getenv("JOB_LEASE_SECONDS", "300")), poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "1")))
+    raise ValueError(f"unknown JOB_BACKEND {name}")
+
+
+def get_backend():
+    global _backend
+    with _backend_lock:
+        if _backend is None:
+            _backend = make_backend()
+        return _backend
+
+
+def set_backend(backend):
+    global _backend
+    with _backend_lock:
+        _backend = backend
 
 
 def start_workers(n=2):
-    global _workers
-    for _ in range(int(n)):
-        w = Worker(_queue, _dead_letter)
-        w.start()
-        _workers.append(w)
-    logging.info("{\"event\":\"workers_started\",\"count\":%d}" % int(n))
+    backend = get_backend()
+    with _workers_lock:
+        for _ in range(int(n)):
+            w = Worker(backend)
+            w.start()
+            _workers.append(w)
+    logging.info("{\"event\":\"workers_started\",\"count\":%d,\"backend\":\"%s\"}" % (int(n), type(backend).__name__))
 
 
-def stop_workers():
-    for w in _workers:
+def _drain(workers, timeout):
+    # Workers finish the job in hand before they see the flag.
+    for w in workers:
         w.stop()
-    logging.info("{\"event\":\"workers_stopped\"}")
+    deadline = time.monotonic() + float(timeout)
+    for w in workers:
+        w.join(max(0.0, deadline - time.monotonic()))
+    return [w for w in workers if w.is_alive()]
 
 
-def enqueue(fn, *args, **kwargs):
-    j = Job(fn=fn, args=list(args), kwargs=dict(kwargs))
-    _queue.put(j)
-    logging.info("{\"event\":\"job_enqueued\"}")
+def stop_workers(timeout=30):
+    """Stop every worker and wait up to timeout seconds for running jobs."""
+    with _workers_lock:
+        workers = list(_workers)
+        _workers.clear()
+    alive = _drain(workers, timeout)
+    logging.info("{\"event\":\"workers_stopped\",\"count\":%d,\"still_running\":%d}" % (len(workers), len(alive)))
+    return len(alive) == 0
+
+
+def worker_count():
+    with _workers_lock:
+        return len(_workers)
+
+
+def queue_stats():
+    """Return ready/delayed depth, oldest ready job age and worker usage."""
+    stats = get_backend().stats()
+    with _workers_lock:
+        stats["workers"] = len(_workers)
+        stats["busy"] = sum(1 for w in _workers if w.busy)
+    set_queue_gauges(stats["ready"], stats["delayed"], stats["oldest_age"], stats["workers"], stats["busy"])
+    return stats
+
+
+class Autoscaler(threading.Thread):
+    """
+    Samples queue_stats() every interval seconds and resizes the worker
+    pool between min_workers and max_workers. It grows when ready jobs
+    outnumber idle workers or the oldest ready job has waited target_latency
+    seconds, and drains one idle worker after idle_ticks samples with
+    nothing ready. With min_workers == max_workers it only publishes the
+    queue gauges.
+    """
+
+    def __init__(self, min_workers=1, max_workers=4, interval=5.0, target_latency=10.0, idle_ticks=3, drain_timeout=30.0):
+        super().__init__(daemon=True)
+        self.min_workers = max(0, int(min_workers))
+        self.max_workers = max(self.min_workers, int(max_workers))
+        self.interval = float(interval)
+        self.target_latency = float(target_latency)
+        self.idle_ticks = max(1, int(idle_ticks))
+        self.drain_timeout = float(drain_timeout)
+        self.quiet = 0
+        self.stop_evt = threading.Event()
+
+    def decide(self, stats):
+        """Return the worker count to move to for one sample."""
+        n, idle = stats["workers"], stats["workers"] - stats["busy"]
+        if n < self.min_workers:
+            return self.min_workers
+        if stats["ready"] > 0:
+            self.quiet = 0
+            if stats["ready"] > idle or stats["oldest_age"] >= self.target_latency:
+                return min(self.max_workers, n + max(1, stats["ready"] - idle))
+            return n
+        self.quiet += 1
+        if self.quiet >= self.idle_ticks and idle > 0 and n > self.min_workers:
+            self.quiet = 0
+            return n - 1
+        return n
+
+    def tick(self):
+        stats = queue_stats()
+        target = self.decide(stats)
+        if target > stats["workers"]:
+            start_workers(target - stats["workers"])
+        elif target < stats["workers"]:
+            with _workers_lock:
+                idle = [w for w in _workers if not w.busy]
+                victims = idle[-(stats["workers"] - target):] if idle else []
+                for w in victims:
+                    _workers.remove(w)
+            _drain(victims, self.drain_timeout)
+        if target != stats["workers"]:
+            logging.info("{\"event\":\"workers_scaled\",\"from\":%d,\"to\":%d,\"ready\":%d,\"oldest_age\":%.1f}" % (stats["workers"], target, stats["ready"], stats["oldest_age"]))
+        return target
+
+    def run(self):
+        while not self.stop_evt.wait(self.interval):
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error("{\"event\":\"autoscale_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+
+    def stop(self):
+        self.stop_evt.set()
+
+
+def start_autoscaler(workers=None):
+    """
+    Start the pool monitor. JOB_AUTOSCALE=1 lets it resize the pool between
+    JOB_MIN_WORKERS and JOB_MAX_WORKERS; otherwise it holds workers steady.
+    """
+    workers = int(workers if workers is not None else os.getenv("WORKER_COUNT", "2"))
+    if os.getenv("JOB_AUTOSCALE", "0").lower() in ("1", "true", "yes"):
+        lo, hi = int(os.getenv("JOB_MIN_WORKERS", "1")), int(os.getenv("JOB_MAX_WORKERS", str(max(workers, 8))))
+    else:
+        lo = hi = workers
+    a = Autoscaler(
+        min_workers=lo,
+        max_workers=hi,
+        interval=float(os.getenv("JOB_SCALE_INTERVAL", "5")),
+        target_latency=float(os.getenv("JOB_TARGET_LATENCY", "10")),
+        idle_ticks=int(os.getenv("JOB_SCALE_DOWN_TICKS", "3")),
+        drain_timeout=float(os.getenv("JOB_DRAIN_TIMEOUT", "30")),
+    )
+    a.start()
+    logging.info("{\"event\":\"autoscaler_started\",\"min\":%d,\"max\":%d}" % (a.min_workers, a.max_workers))
+    return a
+
+
+def submit(fn, args=None, kwargs=None, priority=0, idempotency_key=None, retries=3, backoff=0.5):
+    """
+    Queue fn, a registered handler name or callable, with its arguments.
+    Higher priority jobs are claimed first. Returns the Job, or None when a
+    job with the same idempotency_key was already queued.
+    """
+    job_type = _job_type_for(fn)
+    j = Job(fn=None if isinstance(fn, str) else fn, args=list(args or []), kwargs=dict(kwargs or {}), retries=retries, backoff=backoff, job_type=job_type, priority=priority, idempotency_key=idempotency_key)
+    if not get_backend().put(j):
+        logging.info("{\"event\":\"job_deduplicated\",\"job_type\":\"%s\"}" % (job_type or ""))
+        return None
+    logging.info("{\"event\":\"job_enqueued\",\"job_type\":\"%s\",\"priority\":%d}" % (job_type or "", j.priority))
     return j
 
 
+def enqueue(fn, *args, **kwargs):
+    return submit(fn, args=args, kwargs=kwargs)
+
+
 def dead_letter():
-    return list(_dead_letter)
+    return get_backend().dead_letter()
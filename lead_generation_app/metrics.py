@@ -6,6 +6,10 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 
 _lock = threading.Lock()
 _data = {}
+_cache = {}
+_stages = {}
+_jobs = {}
+_queue = {}
 
 
 def _get_bucket(client_id, method, industry):
@@ -45,6 +49,63 @@ def get_metrics():
         return copy.deepcopy(_data)
 
 
+def _cache_bucket(name):
+    return _cache.setdefault(name, {"hits": 0, "misses": 0})
+
+
+def inc_cache_hit(name):
+    with _lock:
+        _cache_bucket(name)["hits"] += 1
+
+
+def inc_cache_miss(name):
+    with _lock:
+        _cache_bucket(name)["misses"] += 1
+
+
+def get_cache_metrics():
+    with _lock:
+        return copy.deepcopy(_cache)
+
+
+def observe_stage(pipeline, stage, seconds, items):
+    with _lock:
+        b = _stages.setdefault(pipeline, {}).setdefault(stage, {"calls": 0, "items": 0, "seconds": 0.0})
+        b["calls"] += 1
+        b["items"] += int(items)
+        b["seconds"] += float(seconds)
+
+
+def get_stage_metrics():
+    with _lock:
+        return copy.deepcopy(_stages)
+
+
+def observe_job(job_type, seconds, ok):
+    with _lock:
+        b = _jobs.setdefault(job_type or "", {"runs": 0, "failures": 0, "seconds": 0.0, "max_seconds": 0.0})
+        b["runs"] += 1
+        if not ok:
+            b["failures"] += 1
+        b["seconds"] += float(seconds)
+        b["max_seconds"] = max(b["max_seconds"], float(seconds))
+
+
+def get_job_metrics():
+    with _lock:
+        return copy.deepcopy(_jobs)
+
+
+def set_queue_gauges(ready, delayed, oldest_age, workers, busy):
+    with _lock:
+        _queue.update({"ready": int(ready), "delayed": int(delayed), "oldest_age": float(oldest_age), "workers": int(workers), "busy": int(busy)})
+
+
+def get_queue_metrics():
+    with _lock:
+        return dict(_queue)
+
+
 class _Handler(BaseHTTPRequestHandler):
     def do_GET(self):
         if self.path == "/metrics":
@@ -62,6 +123,42 @@ class _Handler(BaseHTTPRequestHandler):
                         lines.append(f"leadgen_skipped_cap_total{{{labels}}} {int(vals.get('skipped_cap', 0))}")
                         lines.append(f"leadgen_skipped_inactive_total{{{labels}}} {int(vals.get('skipped_inactive', 0))}")
                         lines.append(f"leadgen_trial_used_total{{{labels}}} {int(vals.get('trial_used', 0))}")
+            lines.append("# TYPE leadgen_cache_hits_total counter")
+            lines.append("# TYPE leadgen_cache_misses_total counter")
+            for name, vals in get_cache_metrics().items():
+                lines.append(f"leadgen_cache_hits_total{{cache=\"{name}\"}} {int(vals.get('hits', 0))}")
+                lines.append(f"leadgen_cache_misses_total{{cache=\"{name}\"}} {int(vals.get('misses', 0))}")
+            lines.append("# TYPE leadgen_stage_calls_total counter")
+            lines.append("# TYPE leadgen_stage_items_total counter")
+            lines.append("# TYPE leadgen_stage_seconds_total counter")
+            for pipeline, stages in get_stage_metrics().items():
+                for stage, vals in stages.items():
+                    labels = f"pipeline=\"{pipeline}\",stage=\"{stage}\""
+                    lines.append(f"leadgen_stage_calls_total{{{labels}}} {int(vals.get('calls', 0))}")
+                    lines.append(f"leadgen_stage_items_total{{{labels}}} {int(vals.get('items', 0))}")
+                    lines.append(f"leadgen_stage_seconds_total{{{labels}}} {float(vals.get('seconds', 0.0)):.6f}")
+            lines.append("# TYPE leadgen_job_runs_total counter")
+            lines.append("# TYPE leadgen_job_failures_total counter")
+            lines.append("# TYPE leadgen_job_seconds_total counter")
+            lines.append("# TYPE leadgen_job_max_seconds gauge")
+            for job_type, vals in get_job_metrics().items():
+                labels = f"job_type=\"{job_type}\""
+                lines.append(f"leadgen_job_runs_total{{{labels}}} {int(vals.get('runs', 0))}")
+                lines.append(f"leadgen_job_failures_total{{{labels}}} {int(vals.get('failures', 0))}")
+                lines.append(f"leadgen_job_seconds_total{{{labels}}} {float(vals.get('seconds', 0.0)):.6f}")
+                lines.append(f"leadgen_job_max_seconds{{{labels}}} {float(vals.get('max_seconds', 0.0)):.6f}")
+            q = get_queue_metrics()
+            if q:
+                lines.append("# TYPE leadgen_queue_ready gauge")
+                lines.append("# TYPE leadgen_queue_delayed gauge")
+                lines.append("# TYPE leadgen_queue_oldest_age_seconds gauge")
+                lines.append("# TYPE leadgen_workers gauge")
+                lines.append("# TYPE leadgen_workers_busy gauge")
+                lines.append(f"leadgen_queue_ready {q['ready']}")
+                lines.append(f"leadgen_queue_delayed {q['delayed']}")
+                lines.append(f"leadgen_queue_oldest_age_seconds {q['oldest_age']:.3f}")
+                lines.append(f"leadgen_workers {q['workers']}")
+                lines.append(f"leadgen_workers_busy {q['busy']}")
             body = ("\n".join(lines) + "\n").encode("utf-8")
             self.send_response(200)
             self.send_header("Content-Type", "text/plain; version=0.0.4")
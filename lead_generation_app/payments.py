@@ -2,6 +2,7 @@ import logging
 from datetime import datetime, timedelta
 from sqlalchemy import select
 from lead_generation_app.config.pricing import BASE_PLANS, GRACE_PERIOD_DAYS, AUTO_DOWNGRADE
+from lead_generation_app.entitlements import get_entitlement, invalidate
 from lead_generation_app.database.database import get_session
 from lead_generation_app.database.models import Payment, BusinessClient
 
@@ -22,6 +23,7 @@ def record_payment(business_client_id, plan_name, amount, payment_date=None, pay
         )
         s.add(row)
         s.commit()
+        invalidate([business_client_id])
         logging.info("{\"event\":\"payment_recorded\",\"business_client_id\":%d,\"plan\":\"%s\",\"status\":\"%s\"}" % (business_client_id, plan_name or "", payment_status))
         return row.id
     except Exception as e:
@@ -59,11 +61,13 @@ def update_subscription(business_client_id, plan_name, number_of_users=None, pay
                 bc.number_of_users = number_of_users
             bc.next_billing_date = datetime.utcnow() + timedelta(days=int(plan.get("period_days", 30)))
             s.commit()
+            invalidate([business_client_id])
             logging.info("{\"event\":\"subscription_updated\",\"business_client_id\":%d,\"plan\":\"%s\"}" % (business_client_id, plan_name))
             return True
         else:
             bc.subscription_plan = None
             s.commit()
+            invalidate([business_client_id])
             logging.info("{\"event\":\"subscription_deactivated\",\"reason\":\"failed_payment\"}")
             return False
     except Exception as e:
@@ -75,26 +79,8 @@ def update_subscription(business_client_id, plan_name, number_of_users=None, pay
 
 
 def is_client_active(business_client_id):
-    s = get_session()
-    try:
-        bc = s.execute(select(BusinessClient).where(BusinessClient.id == business_client_id)).scalars().first()
-        if not bc:
-            return False
-        paid = s.execute(
-            select(Payment).where(Payment.business_client_id == business_client_id).where(
-                Payment.payment_status.in_(['paid', 'success'])
-            )
-        ).scalars().first()
-        if not bc.subscription_plan:
-            return paid is not None
-        if not bc.next_billing_date:
-            return False
-        now = datetime.utcnow()
-        if bc.next_billing_date <= now and bc.next_billing_date + timedelta(days=GRACE_PERIOD_DAYS) <= now:
-            return False
-        return paid is not None
-    finally:
-        s.close()
+    ent = get_entitlement(business_client_id)
+    return bool(ent and ent["active"])
 
 
 def check_upcoming_billing(threshold_days=7):
@@ -115,12 +101,15 @@ def deactivate_expired_clients():
     try:
         now = datetime.utcnow()
         rows = s.execute(select(BusinessClient)).scalars().all()
-        count = 0
+        changed = []
         for c in rows:
             if AUTO_DOWNGRADE and c.next_billing_date and c.next_billing_date + timedelta(days=GRACE_PERIOD_DAYS) < now:
                 c.subscription_plan = None
-                count += 1
+                changed.append(c.id)
+        count = len(changed)
         s.commit()
+        if changed:
+            invalidate(changed)
         logging.info("{\"event\":\"expired_clients_deactivated\",\"count\":%d}" % count)
         return count
     except Exception as e:
@@ -156,6 +145,7 @@ def settle_invoice(payment_id):
             return False
         row.payment_status = "paid"
         s.commit()
+        invalidate([row.business_client_id])
         logging.info("{\"event\":\"invoice_settled\",\"payment_id\":%d}" % payment_id)
         return True
     finally:
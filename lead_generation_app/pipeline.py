@@ -0,0 +1,182 @@
+import os
+import time
+import logging
+import threading
+from queue import Queue
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.bulk import upsert_qualified_leads
+from lead_generation_app.processing import validator, qualifier, enricher
+from lead_generation_app.delivery.fanout import fan_out, match_active_clients
+from lead_generation_app.delivery.outbox import outbox_enabled, enqueue_deliveries
+from lead_generation_app.metrics import observe_stage
+from lead_generation_app.jobs import register_handler, call
+from lead_generation_app.analytics import mark_stale
+
+_DONE = object()
+
+
+class Stage:
+    def __init__(self, name, fn):
+        self.name = name
+        self.fn = fn
+
+
+class Pipeline:
+    """
+    A named source followed by batch stages. Each stage takes a list and
+    returns the list handed to the next stage; an empty result ends that
+    batch. With concurrent=True every stage runs on its own thread, so a
+    later stage works on batch N while an earlier one works on batch N+1.
+    """
+
+    def __init__(self, name, source_fn, batch_size=100, concurrent=True):
+        self.name = name
+        self.source_fn = source_fn
+        self.batch_size = max(1, int(batch_size))
+        self.concurrent = bool(concurrent)
+        self.stages = []
+
+    def add_stage(self, name, fn):
+        self.stages.append(Stage(name, fn))
+        return self
+
+    def _timed(self, name, fn, items):
+        t0 = time.perf_counter()
+        res = []
+        try:
+            res = list(fn(items) or [])
+        except Exception as e:
+            logging.error("{\"event\":\"pipeline_stage_error\",\"pipeline\":\"%s\",\"stage\":\"%s\",\"error\":\"%s\"}" % (self.name, name, str(e).replace("\"", "'")))
+        elapsed = time.perf_counter() - t0
+        n = len(items) if items else len(res)
+        observe_stage(self.name, name, elapsed, n)
+        logging.info("{\"event\":\"pipeline_stage\",\"pipeline\":\"%s\",\"stage\":\"%s\",\"items\":%d,\"ms\":%d}" % (self.name, name, n, int(elapsed * 1000)))
+        return res
+
+    def _run_sequential(self, batches):
+        out = []
+        for batch in batches:
+            for st in self.stages:
+                batch = self._timed(st.name, st.fn, batch)
+                if not batch:
+                    break
+            out.extend(batch)
+        return out
+
+    def _run_concurrent(self, batches):
+        queues = [Queue(maxsize=2) for _ in range(len(self.stages) + 1)]
+        out = []
+
+        def run_stage(st, inbox, outbox):
+            while True:
+                batch = inbox.get()
+                if batch is _DONE:
+                    outbox.put(_DONE)
+                    return
+                res = self._timed(st.name, st.fn, batch)
+                if res:
+                    outbox.put(res)
+
+        threads = []
+        for i, st in enumerate(self.stages):
+            t = threading.Thread(target=run_stage, args=(st, queues[i], queues[i + 1]), daemon=True)
+            t.start()
+            threads.append(t)
+
+        def feed():
+            for batch in batches:
+                queues[0].put(batch)
+            queues[0].put(_DONE)
+
+        feeder = threading.Thread(target=feed, daemon=True)
+        feeder.start()
+        while True:
+            res = queues[-1].get()
+            if res is _DONE:
+                break
+            out.extend(res)
+        feeder.join()
+        for t in threads:
+            t.join()
+        return out
+
+    def run(self):
+        t0 = time.perf_counter()
+        items = self._timed("source", lambda _: self.source_fn(), [])
+        batches = [items[i:i + self.batch_size] for i in range(0, len(items), self.batch_size)]
+        if self.concurrent and len(batches) > 1 and len(self.stages) > 1:
+            out = self._run_concurrent(batches)
+        else:
+            out = self._run_sequential(batches)
+        logging.info("{\"event\":\"pipeline_cycle\",\"pipeline\":\"%s\",\"input\":%d,\"output\":%d,\"batches\":%d,\"ms\":%d}" % (self.name, len(items), len(out), len(batches), int((time.perf_counter() - t0) * 1000)))
+        return out
+
+
+_sources = {}
+_sources_lock = threading.Lock()
+
+
+def register_source(name, scrape_fn, interval_seconds=3600, cron=None):
+    """
+    Register a scraper. scrape_fn() must return dicts carrying raw_lead_id.
+    A cron expression, when given, replaces the fixed interval.
+    """
+    with _sources_lock:
+        _sources[name] = {"scrape": scrape_fn, "interval": int(interval_seconds), "cron": cron or None}
+
+
+def sources():
+    with _sources_lock:
+        return dict(_sources)
+
+
+# The CPU-bound stages are registered as job types so JOB_PROCESS_TYPES can
+# move them into the process pool. They take and return plain data.
+register_handler("validator.validate_batch", validator.validate_batch)
+register_handler("qualifier.score_batch", qualifier.score_batch)
+
+
+def _validate(items):
+    return call("validator.validate_batch", [r.get("raw_lead_id") for r in items if r.get("raw_lead_id")])
+
+
+def _qualify(validated):
+    return call("qualifier.score_batch", validated)
+
+
+def _persist(qualified_data):
+    return [q for q in upsert_qualified_leads(qualified_data) if q]
+
+
+def deliver_to_active_clients(q_ids):
+    if not outbox_enabled():
+        fan_out(q_ids)
+        mark_stale()
+        return q_ids
+    s = get_session()
+    try:
+        matches, _ = match_active_clients(s, q_ids)
+    finally:
+        s.close()
+    groups = {}
+    for cid, ids in matches.items():
+        groups.setdefault(tuple(ids), []).append(cid)
+    for ids, client_ids in groups.items():
+        enqueue_deliveries(list(ids), client_ids)
+    # New raw and qualified leads changed the counts even before delivery.
+    mark_stale()
+    return q_ids
+
+
+def build_lead_pipeline(name, scrape_fn, batch_size=None, concurrent=None):
+    if batch_size is None:
+        batch_size = int(os.getenv("PIPELINE_BATCH_SIZE", "100"))
+    if concurrent is None:
+        concurrent = os.getenv("PIPELINE_CONCURRENT", "1").lower() in ("1", "true", "yes")
+    p = Pipeline(name, scrape_fn, batch_size=batch_size, concurrent=concurrent)
+    p.add_stage("validate", _validate)
+    p.add_stage("qualify", _qualify)
+    p.add_stage("enrich", enricher.enrich_leads_batch)
+    p.add_stage("persist", _persist)
+    p.add_stage("deliver", deliver_to_active_clients)
+    return p
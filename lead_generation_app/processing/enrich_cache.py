@@ -0,0 +1,166 @@
+import os
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from urllib.parse import urlparse
+from sqlalchemy import select, update, insert
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import EnrichmentCache
+from lead_generation_app.metrics import inc_cache_hit, inc_cache_miss
+
+_CHUNK = 500
+
+
+def cache_key(url):
+    if not url:
+        return None
+    p = urlparse(url if "://" in url else "http://" + url)
+    host = (p.hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    if not host:
+        return None
+    port = ""
+    if p.port and p.port not in (80, 443):
+        port = ":%d" % p.port
+    return host + port + (p.path or "").rstrip("/")
+
+
+def _upsert_stmt(dialect):
+    if dialect == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert as dialect_insert
+    elif dialect == "sqlite":
+        from sqlalchemy.dialects.sqlite import insert as dialect_insert
+    else:
+        return None
+    stmt = dialect_insert(EnrichmentCache)
+    return stmt.on_conflict_do_update(
+        index_elements=["cache_key"],
+        set_={c: getattr(stmt.excluded, c) for c in ("site_ok", "content_len", "keywords", "fetched_at")},
+    )
+
+
+class EnrichmentCacheStore:
+    """
+    LRU cache of site fetch results with a separate TTL for failures and
+    an optional SQL tier shared across restarts.
+    """
+
+    def __init__(self, ttl=86400, negative_ttl=900, max_size=10000, persist=False):
+        self.ttl = timedelta(seconds=int(ttl))
+        self.negative_ttl = timedelta(seconds=int(negative_ttl))
+        self.max_size = max(1, int(max_size))
+        self.persist = bool(persist)
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+
+    def _fresh(self, result, fetched_at, now):
+        ttl = self.ttl if result[0] else self.negative_ttl
+        return fetched_at is not None and fetched_at + ttl > now
+
+    def _remember(self, key, result, fetched_at):
+        with self.lock:
+            self.entries[key] = (result, fetched_at)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def get_many(self, keys):
+        now = datetime.utcnow()
+        out = {}
+        missing = []
+        with self.lock:
+            for k in set(k for k in keys if k):
+                e = self.entries.get(k)
+                if e and self._fresh(e[0], e[1], now):
+                    self.entries.move_to_end(k)
+                    out[k] = e[0]
+                else:
+                    self.entries.pop(k, None)
+                    missing.append(k)
+        if missing and self.persist:
+            for k, result, fetched_at in self._load(missing):
+                if self._fresh(result, fetched_at, now):
+                    self._remember(k, result, fetched_at)
+                    out[k] = result
+        for k in set(k for k in keys if k):
+            if k in out:
+                inc_cache_hit("enrichment")
+            else:
+                inc_cache_miss("enrichment")
+        return out
+
+    def get(self, key):
+        return self.get_many([key]).get(key)
+
+    def put_many(self, results):
+        now = datetime.utcnow()
+        items = {k: r for k, r in (results or {}).items() if k}
+        for k, r in items.items():
+            self._remember(k, r, now)
+        if items and self.persist:
+            self._store(items, now)
+
+    def put(self, key, result):
+        self.put_many({key: result})
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def _load(self, keys):
+        out = []
+        s = get_session()
+        try:
+            for i in range(0, len(keys), _CHUNK):
+                rows = s.execute(select(EnrichmentCache).where(EnrichmentCache.cache_key.in_(keys[i:i + _CHUNK]))).scalars().all()
+                for r in rows:
+                    out.append((r.cache_key, (bool(r.site_ok), int(r.content_len or 0), list(r.keywords or [])), r.fetched_at))
+        except Exception as e:
+            logging.error("{\"event\":\"enrich_cache_load_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+        finally:
+            s.close()
+        return out
+
+    def _store(self, items, now):
+        s = get_session()
+        try:
+            values = [
+                {"cache_key": k, "site_ok": bool(site_ok), "content_len": int(content_len), "keywords": list(keywords), "fetched_at": now}
+                for k, (site_ok, content_len, keywords) in items.items()
+            ]
+            stmt = _upsert_stmt(s.get_bind().dialect.name)
+            if stmt is not None:
+                for i in range(0, len(values), _CHUNK):
+                    s.execute(stmt, values[i:i + _CHUNK])
+            else:
+                for v in values:
+                    # One savepoint per row, so losing a race with another
+                    # enricher caching the same key costs only that row.
+                    with s.begin_nested():
+                        if s.execute(update(EnrichmentCache).where(EnrichmentCache.cache_key == v["cache_key"]).values(**v)).rowcount == 0:
+                            s.execute(insert(EnrichmentCache), [v])
+            s.commit()
+        except Exception as e:
+            s.rollback()
+            logging.error("{\"event\":\"enrich_cache_store_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+        finally:
+            s.close()
+
+
+_default = None
+_default_lock = threading.Lock()
+
+
+def get_cache():
+    global _default
+    with _default_lock:
+        if _default is None:
+            _default = EnrichmentCacheStore(
+                ttl=int(os.getenv("ENRICH_CACHE_TTL", "86400")),
+                negative_ttl=int(os.getenv("ENRICH_CACHE_NEGATIVE_TTL", "900")),
+                max_size=int(os.getenv("ENRICH_CACHE_SIZE", "10000")),
+                persist=os.getenv("ENRICH_CACHE_PERSIST", "0").lower() in ("1", "true", "yes"),
+            )
+        return _default
@@ -1,6 +1,17 @@
+import os
 import json
+import time
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait
 from urllib.parse import urlparse
 from urllib.request import urlopen
+from lead_generation_app.processing.enrich_cache import cache_key, get_cache
+
+_KEYWORDS = ["contact", "review", "rating", "about"]
+_SCAN_BYTES = 5000
+_FETCH_TIMEOUT = 8
+
 
 def _ensure_scheme(url):
     if not url:
@@ -10,27 +21,32 @@ def _ensure_scheme(url):
         return url
     return "http://" + url
 
-def enrich_leads(lead):
+
+def _content_length(resp, read_len):
+    try:
+        ln = int(resp.headers.get("Content-Length") or 0)
+    except Exception:
+        ln = 0
+    return max(ln, read_len)
+
+
+def _fetch(u, timeout=_FETCH_TIMEOUT):
     """
-    Enrich a single qualified lead and return it.
+    Fetch a site and scan its first bytes for keywords.
+    Returns (site_ok, content_len, keywords).
     """
-    site_ok = False
-    content_len = 0
-    kw_hits = []
-    u = _ensure_scheme(lead.get("website"))
-    if u:
-        try:
-            with urlopen(u, timeout=8) as resp:
-                body = resp.read()
-                content_len = len(body)
-                text = body[:5000].decode("utf-8", errors="ignore").lower()
-                for k in ["contact", "review", "rating", "about"]:
-                    if k in text:
-                        kw_hits.append(k)
-                site_ok = True
-        except Exception:
-            site_ok = False
+    try:
+        with urlopen(u, timeout=timeout) as resp:
+            body = resp.read(_SCAN_BYTES)
+            content_len = _content_length(resp, len(body))
+            text = body.decode("utf-8", errors="ignore").lower()
+            return True, content_len, [k for k in _KEYWORDS if k in text]
+    except Exception:
+        return False, 0, []
+
 
+def _apply(lead, result):
+    site_ok, content_len, kw_hits = result
     summary = "site_ok=" + ("true" if site_ok else "false") + ", content_len=" + str(content_len)
     enriched = {
         "site_ok": site_ok,
@@ -42,3 +58,89 @@ def enrich_leads(lead):
     lead["enriched_data_json"] = json.dumps(enriched)
     lead["verified_status"] = bool(site_ok)
     return lead
+
+
+def enrich_leads(lead):
+    """
+    Enrich a single qualified lead and return it.
+    """
+    u = _ensure_scheme(lead.get("website"))
+    if not u:
+        return _apply(lead, (False, 0, []))
+    key = cache_key(u)
+    cache = get_cache()
+    result = cache.get(key) if key else None
+    if result is None:
+        result = _fetch(u)
+        cache.put(key, result)
+    return _apply(lead, result)
+
+
+class _HostLimiter:
+    def __init__(self, per_host):
+        self.per_host = max(1, int(per_host))
+        self.lock = threading.Lock()
+        self.sems = {}
+
+    def get(self, host):
+        with self.lock:
+            sem = self.sems.get(host)
+            if sem is None:
+                sem = threading.BoundedSemaphore(self.per_host)
+                self.sems[host] = sem
+            return sem
+
+
+def enrich_leads_batch(leads, concurrency=None, per_host=None, deadline_seconds=None):
+    """
+    Enrich many qualified leads concurrently and return them in input order.
+    Leads whose fetch has not finished by the deadline are marked site_ok=false.
+    """
+    leads = list(leads or [])
+    if not leads:
+        return []
+    concurrency = int(concurrency or os.getenv("ENRICH_CONCURRENCY", "16"))
+    per_host = int(per_host or os.getenv("ENRICH_PER_HOST", "4"))
+    deadline_seconds = float(deadline_seconds or os.getenv("ENRICH_DEADLINE_SECONDS", "120"))
+    deadline = time.monotonic() + deadline_seconds
+    limiter = _HostLimiter(per_host)
+
+    def task(u):
+        sem = limiter.get((urlparse(u).netloc or "").lower())
+        with sem:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False, 0, []
+            return _fetch(u, timeout=min(_FETCH_TIMEOUT, remaining))
+
+    urls = [_ensure_scheme(lead.get("website")) for lead in leads]
+    keys = [cache_key(u) if u else None for u in urls]
+    cache = get_cache()
+    by_key = cache.get_many(keys)
+    fetched = {}
+    pool = ThreadPoolExecutor(max_workers=max(1, concurrency))
+    try:
+        futures = {}
+        queued = set(by_key)
+        for u, k in zip(urls, keys):
+            if u and k and k not in queued:
+                queued.add(k)
+                futures[pool.submit(task, u)] = k
+        done, pending = wait(list(futures), timeout=max(0, deadline - time.monotonic()))
+        for f in done:
+            fetched[futures[f]] = f.result()
+        for f in pending:
+            f.cancel()
+        if pending:
+            logging.info("{\"event\":\"enrich_deadline_exceeded\",\"pending\":%d}" % len(pending))
+    finally:
+        pool.shutdown(wait=False, cancel_futures=True)
+    cache.put_many(fetched)
+    by_key.update(fetched)
+    ok = 0
+    for lead, k in zip(leads, keys):
+        result = by_key.get(k, (False, 0, [])) if k else (False, 0, [])
+        _apply(lead, result)
+        ok += 1 if result[0] else 0
+    logging.info("{\"event\":\"enricher_batch_processed\",\"input\":%d,\"site_ok\":%d}" % (len(leads), ok))
+    return leads
@@ -1,8 +1,13 @@
+import os
+import re
 import json
+import time
 import logging
+import threading
 from lead_generation_app.database.database import get_session
-from lead_generation_app.database.models import IndustryRule
-from sqlalchemy import select
+from lead_generation_app.database.models import IndustryRule, QualifiedLead, RawLead
+from lead_generation_app.processing.validator import _is_valid_url
+from sqlalchemy import select, update
 
 
 def _parse_rules(r):
@@ -36,40 +41,149 @@ def _score(lead, rules):
     return score, cat
 
 
-def qualify_leads(validated_leads):
+class _CompiledRules:
+    """
+    Scoring rules for one industry with weights, thresholds and lowercased
+    keywords resolved up front. score() gives the same result as _score().
+    """
+
+    def __init__(self, rules):
+        w = rules.get("weights", {})
+        t = rules.get("thresholds", {})
+        self.email = w.get("email", 30)
+        self.phone = w.get("phone", 25)
+        self.website = w.get("website", 20)
+        self.keyword = w.get("keyword", 5)
+        self.hot = int(t.get("hot", 75))
+        self.warm = int(t.get("warm", 50))
+        self.keywords = [k.lower() for k in (rules.get("keywords", []) or []) if k]
+        self.pattern = re.compile("|".join(re.escape(k) for k in sorted(set(self.keywords)))) if self.keywords else None
+
+    def score(self, lead):
+        score = 0
+        score += (self.email if lead.get("email") else 0)
+        score += (self.phone if lead.get("phone") else 0)
+        score += (self.website if lead.get("website") else 0)
+        if self.pattern is not None:
+            name = ((lead.get("company_name") or "") + " " + (lead.get("name") or "")).lower()
+            if self.pattern.search(name):
+                for k in self.keywords:
+                    if k in name:
+                        score += self.keyword
+        score = max(0, min(100, score))
+        cat = "hot" if score >= self.hot else ("warm" if score >= self.warm else "cold")
+        return score, cat
+
+
+_DEFAULT_RULES = _CompiledRules({})
+_rules_lock = threading.Lock()
+_rules_cache = {"loaded_at": None, "rules": {}}
+
+
+def _load_rules():
     s = get_session()
     try:
-        out = []
-        seen = set()
-        for lead in validated_leads:
-            key = ((lead.get("email") or "").strip().lower(), (lead.get("phone") or "").strip(), (lead.get("company_name") or "").strip().lower())
-            if key in seen:
-                logging.info("{\"event\":\"qualify_dedup_skipped\"}")
-                continue
-            seen.add(key)
-            ind = lead.get("industry")
-            rule = None
-            if ind:
-                ir = s.execute(select(IndustryRule).where(IndustryRule.industry == ind)).scalars().first()
-                rule = _parse_rules(ir.scoring_rules) if ir else {}
-            score, cat = _score(lead, rule or {})
-            out.append(
-                {
-                    "raw_lead_id": lead.get("raw_lead_id"),
-                    "name": lead.get("name"),
-                    "company_name": lead.get("company_name"),
-                    "phone": lead.get("phone"),
-                    "whatsapp": None,
-                    "email": lead.get("email"),
-                    "qualification_score": int(score),
-                    "score_category": cat,
-                    "industry": ind,
-                    "summary": "",
-                    "enriched_data_json": None,
-                    "verified_status": False,
-                }
-            )
-        logging.info("{\"event\":\"qualifier_processed\",\"input\":%d,\"output\":%d}" % (len(validated_leads), len(out)))
+        out = {}
+        for ind, raw in s.execute(select(IndustryRule.industry, IndustryRule.scoring_rules).order_by(IndustryRule.id)).all():
+            if ind and ind not in out:
+                out[ind] = _CompiledRules(_parse_rules(raw))
         return out
     finally:
         s.close()
+
+
+def _compiled_rules():
+    ttl = float(os.getenv("QUALIFIER_RULES_TTL", "300"))
+    with _rules_lock:
+        loaded_at = _rules_cache["loaded_at"]
+        if loaded_at is None or time.monotonic() - loaded_at > ttl:
+            _rules_cache["rules"] = _load_rules()
+            _rules_cache["loaded_at"] = time.monotonic()
+            logging.info("{\"event\":\"qualifier_rules_loaded\",\"industries\":%d}" % len(_rules_cache["rules"]))
+        return _rules_cache["rules"]
+
+
+def rescore_qualified_leads(industry=None, batch_size=5000):
+    """
+    Recompute qualification_score/score_category for stored qualified leads
+    with the current rules, walking the table by id. Returns rows changed.
+    """
+    invalidate_rules_cache()
+    rules = _compiled_rules()
+    last_id = 0
+    changed = 0
+    while True:
+        s = get_session()
+        try:
+            q = (
+                select(QualifiedLead.id, QualifiedLead.email, QualifiedLead.phone, RawLead.website, QualifiedLead.company_name, QualifiedLead.name, QualifiedLead.industry, QualifiedLead.qualification_score, QualifiedLead.score_category)
+                .join(RawLead, RawLead.id == QualifiedLead.raw_lead_id)
+                .where(QualifiedLead.id > last_id)
+                .order_by(QualifiedLead.id)
+                .limit(int(batch_size))
+            )
+            if industry:
+                q = q.where(QualifiedLead.industry == industry)
+            rows = s.execute(q).all()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            updates = []
+            for r in rows:
+                compiled = rules.get(r[6], _DEFAULT_RULES) if r[6] else _DEFAULT_RULES
+                sc, cat = compiled.score({"email": r[1], "phone": r[2], "website": _is_valid_url(r[3]), "company_name": r[4], "name": r[5]})
+                if r[7] != int(sc) or r[8] != cat:
+                    updates.append({"id": r[0], "qualification_score": int(sc), "score_category": cat})
+            if updates:
+                s.execute(update(QualifiedLead), updates)
+                s.commit()
+                changed += len(updates)
+        finally:
+            s.close()
+    logging.info("{\"event\":\"qualified_rescored\",\"changed\":%d}" % changed)
+    return changed
+
+
+def invalidate_rules_cache():
+    with _rules_lock:
+        _rules_cache["loaded_at"] = None
+
+
+def qualify_leads(validated_leads):
+    rules = _compiled_rules()
+    out = []
+    seen = set()
+    for lead in validated_leads:
+        key = ((lead.get("email") or "").strip().lower(), (lead.get("phone") or "").strip(), (lead.get("company_name") or "").strip().lower())
+        if key in seen:
+            logging.info("{\"event\":\"qualify_dedup_skipped\"}")
+            continue
+        seen.add(key)
+        ind = lead.get("industry")
+        score, cat = rules.get(ind, _DEFAULT_RULES).score(lead)
+        out.append(
+            {
+                "raw_lead_id": lead.get("raw_lead_id"),
+                "name": lead.get("name"),
+                "company_name": lead.get("company_name"),
+                "phone": lead.get("phone"),
+                "whatsapp": None,
+                "email": lead.get("email"),
+                "qualification_score": int(score),
+                "score_category": cat,
+                "industry": ind,
+                "summary": "",
+                "enriched_data_json": None,
+                "verified_status": False,
+            }
+        )
+    logging.info("{\"event\":\"qualifier_processed\",\"input\":%d,\"output\":%d}" % (len(validated_leads), len(out)))
+    return out
+
+
+def score_batch(validated_leads):
+    """
+    qualify_leads for one pipeline batch of validated lead dicts. Takes and
+    returns plain data so it can run in a worker process.
+    """
+    return qualify_leads(validated_leads)
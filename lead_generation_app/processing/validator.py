@@ -1,5 +1,8 @@
 import re
 from urllib.parse import urlparse
+from sqlalchemy import select
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import RawLead
 
 
 def _is_valid_email(v):
@@ -43,3 +46,18 @@ def validate_leads(leads):
             }
         )
     return out
+
+
+def validate_batch(raw_ids):
+    """
+    Load raw leads by id and validate them. Takes and returns plain data so
+    it can run in a worker process.
+    """
+    ids = [int(i) for i in raw_ids or [] if i]
+    if not ids:
+        return []
+    s = get_session()
+    try:
+        return validate_leads(s.execute(select(RawLead).where(RawLead.id.in_(ids)).order_by(RawLead.id)).scalars().all())
+    finally:
+        s.close()
@@ -0,0 +1,98 @@
+import os
+import sys
+import logging
+import argparse
+from datetime import datetime
+from sqlalchemy import select
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import RawLead, JobCheckpoint
+from lead_generation_app.database.bulk import upsert_qualified_leads
+from lead_generation_app.processing import validator, qualifier, enricher
+
+CHECKPOINT = "requalify_raw_leads"
+# Without enrichment only these are recomputed; summary, enriched data and
+# the verified flag of stored leads are kept.
+SCORE_COLUMNS = ("name", "company_name", "phone", "email", "qualification_score", "score_category", "industry")
+
+
+def get_checkpoint(name):
+    s = get_session()
+    try:
+        row = s.execute(select(JobCheckpoint).where(JobCheckpoint.name == name)).scalars().first()
+        return int(row.last_id or 0) if row else 0
+    finally:
+        s.close()
+
+
+def save_checkpoint(name, last_id):
+    s = get_session()
+    try:
+        row = s.execute(select(JobCheckpoint).where(JobCheckpoint.name == name)).scalars().first()
+        if not row:
+            row = JobCheckpoint(name=name)
+            s.add(row)
+        row.last_id = int(last_id)
+        row.updated_at = datetime.utcnow()
+        s.commit()
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
+
+
+def _raw_batch(after_id, batch_size):
+    s = get_session()
+    try:
+        return s.execute(
+            select(RawLead.id, RawLead.name, RawLead.company_name, RawLead.email, RawLead.phone, RawLead.website, RawLead.industry)
+            .where(RawLead.id > after_id)
+            .order_by(RawLead.id)
+            .limit(int(batch_size))
+        ).all()
+    finally:
+        s.close()
+
+
+def run_requalify(batch_size=1000, enrich=True, reset=False, checkpoint=CHECKPOINT):
+    """
+    Re-run validation, qualification and enrichment over raw_leads in id
+    order, one batch in memory at a time. Progress is checkpointed after each
+    batch so an interrupted run resumes where it stopped.
+    """
+    last_id = 0 if reset else get_checkpoint(checkpoint)
+    processed = 0
+    written = 0
+    logging.info("{\"event\":\"requalify_start\",\"after_id\":%d,\"batch_size\":%d}" % (last_id, int(batch_size)))
+    while True:
+        raws = _raw_batch(last_id, batch_size)
+        if not raws:
+            break
+        validated = validator.validate_leads(raws)
+        qualified_data = qualifier.qualify_leads(validated)
+        if enrich and qualified_data:
+            qualified_data = enricher.enrich_leads_batch(qualified_data)
+        written += len([q for q in upsert_qualified_leads(qualified_data, update_existing=True, update_columns=None if enrich else SCORE_COLUMNS) if q])
+        last_id = raws[-1].id
+        processed += len(raws)
+        save_checkpoint(checkpoint, last_id)
+        logging.info("{\"event\":\"requalify_batch\",\"last_id\":%d,\"processed\":%d}" % (last_id, processed))
+    save_checkpoint(checkpoint, 0)
+    logging.info("{\"event\":\"requalify_done\",\"processed\":%d,\"written\":%d}" % (processed, written))
+    return {"processed": processed, "written": written}
+
+
+def main(argv=None):
+    logging.basicConfig(level=os.getenv("LOG_LEVEL", "INFO"))
+    parser = argparse.ArgumentParser(prog="requalify")
+    parser.add_argument("--batch-size", type=int, default=int(os.getenv("REQUALIFY_BATCH_SIZE", "1000")))
+    parser.add_argument("--no-enrich", action="store_true")
+    parser.add_argument("--reset", action="store_true", help="ignore the saved checkpoint and start from the first raw lead")
+    args = parser.parse_args(argv if argv is not None else sys.argv[1:])
+    init_db()
+    out = run_requalify(batch_size=args.batch_size, enrich=not args.no_enrich, reset=args.reset)
+    print(f"Re-qualified {out['processed']} raw leads, wrote {out['written']} qualified leads")
+
+
+if __name__ == "__main__":
+    main()
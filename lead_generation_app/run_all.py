@@ -5,8 +5,7 @@ import threading
 import time
 from urllib.parse import urlparse
 from urllib.request import urlopen
-from lead_generation_app.database.database import get_session
-from lead_generation_app.database.models import RawLead, QualifiedLead
+from lead_generation_app.requalify import run_requalify
 
 
 def is_valid_email(v):
@@ -93,45 +92,13 @@ def enrich_leads(lead):
 
 
 def run_all():
-    session = get_session()
-    try:
-        print("Loading raw leads...")
-        raw_leads = session.query(RawLead).all()
-        print(f"Loaded {len(raw_leads)} raw leads")
-        if not raw_leads:
-            print("No leads to process")
-            return
-
-        print("Validating leads...")
-        validated = validate_leads(raw_leads)
-
-        print("Qualifying leads...")
-        qualified = [qualify_leads(l) for l in validated]
-
-        print("Enriching leads...")
-        enriched = [enrich_leads(l) for l in qualified]
-
-        print("Inserting qualified leads...")
-        for l in enriched:
-            ql = QualifiedLead(
-                raw_lead_id=l["raw_lead_id"],
-                name=l["name"],
-                company_name=l["company_name"],
-                phone=l["phone"],
-                whatsapp=l.get("whatsapp"),
-                email=l["email"],
-                qualification_score=l["qualification_score"],
-                score_category=l["score_category"],
-                industry=l["industry"],
-                summary=l["summary"],
-                enriched_data_json=l["enriched_data_json"],
-                verified_status=l["verified_status"]
-            )
-            session.add(ql)
-        session.commit()
-        print(f"Inserted {len(enriched)} qualified leads")
-    finally:
-        session.close()
+    print("Processing raw leads in batches...")
+    out = run_requalify()
+    if not out["processed"]:
+        print("No leads to process")
+        return
+    print(f"Inserted or updated {out['written']} qualified leads")
+
 
 if __name__ == "__main__":
     run_all()
@@ -0,0 +1,279 @@
+import zlib
+import logging
+import threading
+from datetime import datetime, timedelta
+from sqlalchemy import select, update, or_
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import ScheduleState
+from lead_generation_app.jobs import register_handler, submit, handler_for
+
+
+class IntervalTrigger:
+    """
+    Fixed-rate slots every seconds, counted from anchor rather than from
+    when the previous run finished, so slow runs do not shift the period.
+    """
+
+    def __init__(self, seconds, anchor=None):
+        self.seconds = max(1, int(seconds))
+        self.anchor = anchor or datetime(2000, 1, 1)
+
+    def next_after(self, dt):
+        elapsed = (dt - self.anchor).total_seconds()
+        return self.anchor + timedelta(seconds=(int(elapsed // self.seconds) + 1) * self.seconds)
+
+
+def _cron_field(spec, lo, hi):
+    out = set()
+    for part in spec.split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/", 1)
+            step = int(step)
+        if part == "*":
+            a, b = lo, hi
+        elif "-" in part:
+            a, b = (int(x) for x in part.split("-", 1))
+        else:
+            a = b = int(part)
+        if a < lo or b > hi or a > b or step < 1:
+            raise ValueError(f"cron field {spec!r} out of range {lo}-{hi}")
+        out.update(range(a, b + 1, step))
+    return out
+
+
+class CronTrigger:
+    """
+    Five-field cron expression (minute hour day-of-month month day-of-week,
+    Sunday = 0) in UTC, supporting *, lists, ranges and steps. As in cron,
+    when both day fields are restricted a day matching either one fires.
+    """
+
+    def __init__(self, expr):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields: {expr!r}")
+        self.expr = expr
+        self.minutes = _cron_field(fields[0], 0, 59)
+        self.hours = _cron_field(fields[1], 0, 23)
+        self.days = _cron_field(fields[2], 1, 31)
+        self.months = _cron_field(fields[3], 1, 12)
+        self.weekdays = {d % 7 for d in _cron_field(fields[4], 0, 7)}
+        self.any_day = fields[2] == "*"
+        self.any_weekday = fields[4] == "*"
+
+    def _day_ok(self, dt):
+        dom = dt.day in self.days
+        dow = (dt.weekday() + 1) % 7 in self.weekdays
+        if self.any_day or self.any_weekday:
+            return dom and dow
+        return dom or dow
+
+    def next_after(self, dt):
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+        while t < limit:
+            if t.month not in self.months:
+                t = datetime(t.year + t.month // 12, t.month % 12 + 1, 1)
+            elif not self._day_ok(t):
+                t = datetime(t.year, t.month, t.day) + timedelta(days=1)
+            elif t.hour not in self.hours:
+                t = datetime(t.year, t.month, t.day, t.hour) + timedelta(hours=1)
+            elif t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+            else:
+                return t
+        raise ValueError(f"cron expression {self.expr!r} never fires")
+
+
+def make_trigger(interval_seconds=None, cron=None):
+    return CronTrigger(cron) if cron else IntervalTrigger(interval_seconds or 3600)
+
+
+class Schedule:
+    def __init__(self, name, job_type, trigger, overlap="skip", jitter=0, args=None, kwargs=None):
+        if overlap not in ("skip", "coalesce"):
+            raise ValueError(f"unknown overlap policy {overlap}")
+        self.name = name
+        self.job_type = job_type
+        self.trigger = trigger
+        self.overlap = overlap
+        self.args = list(args or [])
+        self.kwargs = dict(kwargs or {})
+        # A stable per-schedule offset spreads sources that share a period.
+        self.offset = timedelta(seconds=(zlib.crc32(name.encode("utf-8")) % 1000) / 1000.0 * float(jitter))
+        self.next_slot = None
+
+    @property
+    def next_run(self):
+        return self.next_slot + self.offset if self.next_slot else None
+
+
+class Scheduler(threading.Thread):
+    """
+    Enqueues each schedule's job when its slot comes due. Every process may
+    run a scheduler: a slot is claimed with a conditional UPDATE on
+    schedule_state, so it is enqueued once, and not at all while the
+    previous run is still queued or running. Under "skip" that slot is
+    dropped; under "coalesce" one catch-up run is queued as soon as the
+    previous run finishes. Slots missed while no scheduler ran collapse
+    into a single run.
+    """
+
+    def __init__(self, stale_after=3600, max_sleep=30.0):
+        super().__init__(daemon=True)
+        self.stale_after = timedelta(seconds=int(stale_after))
+        self.max_sleep = float(max_sleep)
+        self.schedules = {}
+        self.lock = threading.Lock()
+        self.stop_evt = threading.Event()
+
+    def add(self, name, job_type, trigger, overlap="skip", jitter=0, args=None, kwargs=None):
+        sch = Schedule(name, job_type, trigger, overlap=overlap, jitter=jitter, args=args, kwargs=kwargs)
+        register_handler("schedule.%s" % name, lambda *a, **kw: self._run(name, *a, **kw))
+        s = get_session()
+        try:
+            state = s.execute(select(ScheduleState).where(ScheduleState.name == name)).scalars().first()
+            if state is None:
+                s.add(ScheduleState(name=name))
+                s.commit()
+            last = state.last_run_at if state else None
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+        now = datetime.utcnow()
+        sch.next_slot = trigger.next_after(last) if last else trigger.next_after(now)
+        with self.lock:
+            self.schedules[name] = sch
+        self._save_next(sch)
+        return sch
+
+    def next_runs(self):
+        """Return {schedule name: next run time (UTC)} for monitoring."""
+        with self.lock:
+            return {name: sch.next_run for name, sch in self.schedules.items()}
+
+    def _save_next(self, sch):
+        s = get_session()
+        try:
+            s.execute(update(ScheduleState).where(ScheduleState.name == sch.name).values(next_run_at=sch.next_run))
+            s.commit()
+        finally:
+            s.close()
+
+    def _claim(self, sch, slot, now):
+        idle = or_(ScheduleState.inflight_since.is_(None), ScheduleState.inflight_since < now - self.stale_after)
+        fresh = or_(ScheduleState.last_run_at.is_(None), ScheduleState.last_run_at < slot)
+        s = get_session()
+        try:
+            res = s.execute(
+                update(ScheduleState)
+                .where(ScheduleState.name == sch.name)
+                .where(idle)
+                .where(fresh)
+                .values(inflight_since=now, last_run_at=slot, pending=False)
+            )
+            claimed = res.rowcount == 1
+            if not claimed and sch.overlap == "coalesce":
+                s.execute(update(ScheduleState).where(ScheduleState.name == sch.name).where(~idle).where(fresh).values(pending=True))
+            s.commit()
+            return claimed
+        except Exception:
+            s.rollback()
+            raise
+        finally:
+            s.close()
+
+    def _fire(self, sch, slot, now):
+        if not self._claim(sch, slot, now):
+            logging.info("{\"event\":\"schedule_skipped\",\"schedule\":\"%s\",\"slot\":\"%s\"}" % (sch.name, slot.isoformat()))
+            return False
+        # No queue retries: the next slot is the retry.
+        submit("schedule.%s" % sch.name, args=sch.args, kwargs=sch.kwargs, retries=0)
+        logging.info("{\"event\":\"schedule_fired\",\"schedule\":\"%s\",\"slot\":\"%s\"}" % (sch.name, slot.isoformat()))
+        return True
+
+    def _pending(self, now):
+        s = get_session()
+        try:
+            return set(s.execute(
+                select(ScheduleState.name)
+                .where(ScheduleState.pending.is_(True))
+                .where(or_(ScheduleState.inflight_since.is_(None), ScheduleState.inflight_since < now - self.stale_after))
+            ).scalars().all())
+        finally:
+            s.close()
+
+    def tick(self, now=None):
+        """Fire every due schedule once. Returns the names fired."""
+        now = now or datetime.utcnow()
+        fired = []
+        with self.lock:
+            schedules = list(self.schedules.values())
+        pending = self._pending(now) if any(sch.overlap == "coalesce" for sch in schedules) else set()
+        for sch in schedules:
+            if sch.next_run <= now:
+                slot = sch.next_slot
+                sch.next_slot = sch.trigger.next_after(max(slot, now - sch.offset))
+                if self._fire(sch, slot, now):
+                    fired.append(sch.name)
+                self._save_next(sch)
+            elif sch.name in pending and sch.overlap == "coalesce":
+                if self._coalesced(sch, now):
+                    fired.append(sch.name)
+        return fired
+
+    def _coalesced(self, sch, now):
+        s = get_session()
+        try:
+            res = s.execute(
+                update(ScheduleState)
+                .where(ScheduleState.name == sch.name)
+                .where(ScheduleState.pending.is_(True))
+                .where(or_(ScheduleState.inflight_since.is_(None), ScheduleState.inflight_since < now - self.stale_after))
+                .values(inflight_since=now, pending=False)
+            )
+            s.commit()
+            claimed = res.rowcount == 1
+        finally:
+            s.close()
+        if claimed:
+            submit("schedule.%s" % sch.name, args=sch.args, kwargs=sch.kwargs, retries=0)
+            logging.info("{\"event\":\"schedule_coalesced\",\"schedule\":\"%s\"}" % sch.name)
+        return claimed
+
+    def _run(self, name, *args, **kwargs):
+        with self.lock:
+            sch = self.schedules[name]
+        status, error = "ok", None
+        try:
+            return handler_for(sch.job_type)(*args, **kwargs)
+        except Exception as e:
+            status, error = "error", str(e)
+            raise
+        finally:
+            s = get_session()
+            try:
+                s.execute(
+                    update(ScheduleState)
+                    .where(ScheduleState.name == name)
+                    .values(inflight_since=None, last_finished_at=datetime.utcnow(), last_status=status, last_error=error)
+                )
+                s.commit()
+            finally:
+                s.close()
+
+    def run(self):
+        while not self.stop_evt.is_set():
+            try:
+                self.tick()
+            except Exception as e:
+                logging.error("{\"event\":\"scheduler_error\",\"error\":\"%s\"}" % str(e).replace("\"", "'"))
+            runs = [t for t in self.next_runs().values() if t]
+            wait = min([(t - datetime.utcnow()).total_seconds() for t in runs] + [self.max_sleep])
+            self.stop_evt.wait(max(0.05, wait))
+
+    def stop(self):
+        self.stop_evt.set()
@@ -0,0 +1,49 @@
+import os
+import json
+from datetime import datetime
+from lead_generation_app.database.database import get_session
+from lead_generation_app.database.models import LeadSource, RawLead, SourceAttribution
+
+
+def scrape_facebook_pages(query, limit=50, import_json_path=None):
+    if not import_json_path or not os.path.exists(import_json_path):
+        return []
+    with open(import_json_path, "r", encoding="utf-8") as f:
+        items = json.load(f)[: int(limit)]
+    s = get_session()
+    try:
+        ls = s.query(LeadSource).filter(LeadSource.source_name == "facebook", LeadSource.platform_type == "social").first()
+        if not ls:
+            ls = LeadSource(source_name="facebook", industry="", platform_type="social", scrape_url="https://www.facebook.com", active_status=True)
+            s.add(ls)
+            s.commit()
+        results = []
+        for it in items:
+            rl = RawLead(
+                name=it.get("name"),
+                company_name=it.get("name"),
+                email=it.get("email"),
+                phone=it.get("phone"),
+                website=it.get("website"),
+                industry=it.get("industry") or it.get("category"),
+                source_id=ls.id,
+                captured_at=datetime.utcnow(),
+                raw_data_json=json.dumps(it),
+            )
+            s.add(rl)
+            s.flush()
+            s.add(SourceAttribution(
+                raw_lead_id=rl.id,
+                source_platform="facebook",
+                source_reference=it.get("page") or it.get("profile"),
+                campaign=it.get("campaign") or query,
+                collected_at=datetime.utcnow(),
+            ))
+            results.append({"raw_lead_id": rl.id, "qualified_lead_id": None})
+        s.commit()
+        return results
+    except Exception:
+        s.rollback()
+        raise
+    finally:
+        s.close()
@@ -6,7 +6,7 @@ from urllib.request import urlopen, Request
 from datetime import datetime
 
 from lead_generation_app.database.database import get_session
-from lead_generation_app.database.models import RawLead
+from lead_generation_app.database.models import LeadSource, RawLead
 
 
 def _api_get(path, params, retry=3, delay=0.5):
@@ -66,6 +66,7 @@ def scrape_google_maps(search_term=None, location=None, industry=None, source_id
     session = get_session()
     inserted = 0
     try:
+        rows = []
         for lead in results:
             row = RawLead(
                 name=lead["name"],
@@ -79,7 +80,11 @@ def scrape_google_maps(search_term=None, location=None, industry=None, source_id
                 raw_data_json=lead["raw_data_json"],
             )
             session.add(row)
+            rows.append((lead, row))
             inserted += 1
+        session.flush()
+        for lead, row in rows:
+            lead["raw_lead_id"] = row.id
         session.commit()
         print(f"inserted {inserted} leads")
     except Exception as e:
@@ -90,3 +95,17 @@ def scrape_google_maps(search_term=None, location=None, industry=None, source_id
         session.close()
 
     return results
+
+
+def scrape_google_maps_source(search_term=None, location=None, industry=None):
+    s = get_session()
+    try:
+        ls = s.query(LeadSource).filter(LeadSource.source_name == "google_maps", LeadSource.platform_type == "maps").first()
+        if not ls:
+            ls = LeadSource(source_name="google_maps", industry=industry or "", platform_type="maps", scrape_url="https://maps.googleapis.com", active_status=True)
+            s.add(ls)
+            s.commit()
+        source_id = ls.id
+    finally:
+        s.close()
+    return scrape_google_maps(search_term=search_term, location=location, industry=industry, source_id=source_id)
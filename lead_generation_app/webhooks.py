@@ -9,7 +9,10 @@ from http.server import BaseHTTPRequestHandler, HTTPServer
 from urllib.parse import parse_qs
 from lead_generation_app.database.database import get_session
 from lead_generation_app.database.models import DeliveredLead, QualifiedLead, OptOut, Bounce
-from sqlalchemy import select
+from lead_generation_app.delivery.suppression import note_opt_out
+from lead_generation_app.database.usage import add_usage
+from lead_generation_app.analytics import mark_stale
+from sqlalchemy import select, update
 from datetime import datetime
 
 
@@ -27,7 +30,16 @@ def _mark_opened(session, method, target):
     ).scalars().first()
     if not row:
         return False
-    row.opened_status = True
+    # Only the event that flips the flag counts the open, so concurrent
+    # open events for one delivery add it to the rollup once.
+    res = session.execute(
+        update(DeliveredLead)
+        .where(DeliveredLead.id == row.id)
+        .where(DeliveredLead.opened_status.is_not(True))
+        .values(opened_status=True)
+    )
+    if res.rowcount == 1 and row.delivered_at is not None:
+        add_usage(session, [(row.business_client_id, row.delivered_at, ql.industry, 0, 1)])
     session.commit()
     return True
 
@@ -45,9 +57,11 @@ def handle_sendgrid_events(events):
             elif et in ("unsubscribe", "unsubscribed"):
                 s.add(OptOut(method="email", value=email, created_at=datetime.utcnow()))
                 s.commit()
+                note_opt_out("email", email)
             elif et == "bounce":
                 s.add(Bounce(method="email", target=email, reason=str(ev.get("reason") or "bounce"), created_at=datetime.utcnow()))
                 s.commit()
+        mark_stale()
         return True
     finally:
         s.close()
@@ -64,12 +78,15 @@ def handle_twilio_event(params):
             return False
         if status in ("delivered", "read"):
             _mark_opened(s, "whatsapp", to)
+            mark_stale()
         elif status in ("undelivered", "failed"):
             s.add(Bounce(method="whatsapp", target=to, reason=status, created_at=datetime.utcnow()))
             s.commit()
+            mark_stale()
         elif status in ("stopped", "optout"):
             s.add(OptOut(method="whatsapp", value=to, created_at=datetime.utcnow()))
             s.commit()
+            note_opt_out("whatsapp", to)
         return True
     finally:
         s.close()
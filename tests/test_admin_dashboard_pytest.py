@@ -0,0 +1,95 @@
+import pytest
+from datetime import datetime, timedelta
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, DeliveredLead, Bounce
+from lead_generation_app.database.usage import rebuild_usage
+from lead_generation_app import admin_web
+
+
+@pytest.mark.integration
+def test_dashboard_rows_match_per_client_counts():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"dash_{tag}", industry="x", platform_type="maps", scrape_url="", active_status=True)
+        a = BusinessClient(business_name=f"DashA{tag}", subscription_plan="pro")
+        b = BusinessClient(business_name=f"DashB{tag}")
+        s.add_all([ls, a, b])
+        s.flush()
+        now = datetime.utcnow()
+        for i in range(4):
+            rl = RawLead(name=f"D{i}", source_id=ls.id, captured_at=now, raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, score_category="hot", qualification_score=80, summary="", enriched_data_json="{}", verified_status=True)
+            s.add(ql)
+            s.flush()
+            s.add(DeliveredLead(qualified_lead_id=ql.id, business_client_id=a.id, delivered_at=now, delivery_method="email", opened_status=i < 3))
+            s.add(DeliveredLead(qualified_lead_id=ql.id, business_client_id=a.id, delivered_at=now - timedelta(days=400), delivery_method="whatsapp", opened_status=True))
+        s.add(Bounce(method="email", target=f"dash{tag}@example.com", reason="hard", created_at=now))
+        s.commit()
+        a_id, b_id = a.id, b.id
+    finally:
+        s.close()
+    rebuild_usage()
+
+    captured = {}
+    admin_web.app.config["LOGIN_DISABLED"] = True
+    orig = admin_web.render_template
+    admin_web.render_template = lambda name, **ctx: captured.update(ctx) or ""
+    try:
+        with admin_web.app.test_request_context("/admin/"):
+            admin_web.dashboard()
+    finally:
+        admin_web.render_template = orig
+        admin_web.app.config["LOGIN_DISABLED"] = False
+    rows = {r["id"]: r for r in captured["clients"]}
+    s = get_session()
+    try:
+        bounces = s.query(Bounce).count()
+    finally:
+        s.close()
+    assert rows[a_id] == {"id": a_id, "name": f"DashA{tag}", "plan": "pro", "cap_used": 4, "opens": 3, "bounces": bounces}
+    assert (rows[b_id]["cap_used"], rows[b_id]["opens"], rows[b_id]["bounces"]) == (0, 0, bounces)
+
+
+def _render_clients(query):
+    captured = {}
+    admin_web.app.config["LOGIN_DISABLED"] = True
+    orig = admin_web.render_template
+    admin_web.render_template = lambda name, **ctx: captured.update(ctx) or ""
+    try:
+        with admin_web.app.test_request_context("/admin/clients" + query):
+            admin_web.clients()
+    finally:
+        admin_web.render_template = orig
+        admin_web.app.config["LOGIN_DISABLED"] = False
+    return captured
+
+
+@pytest.mark.integration
+def test_clients_page_filters_in_sql_and_pages_by_keyset():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        made = [
+            BusinessClient(business_name=f"Kset{tag} {i}", subscription_plan=("Pro" if i % 2 == 0 else "starter"))
+            for i in range(7)
+        ]
+        made.append(BusinessClient(business_name=f"Kset{tag} gone", subscription_plan="pro", is_deleted=True))
+        s.add_all(made)
+        s.commit()
+        pro_ids = [c.id for c in made[:7] if c.subscription_plan == "Pro"]
+    finally:
+        s.close()
+
+    first = _render_clients(f"?q=kset{tag}&plan=pro&per_page=3")
+    assert first["total_clients"] == 4
+    assert [c["id"] for c in first["clients"]] == pro_ids[:3]
+    assert first["next_after_id"] == pro_ids[2]
+    second = _render_clients(f"?q=kset{tag}&plan=pro&per_page=3&after_id={first['next_after_id']}")
+    assert [c["id"] for c in second["clients"]] == pro_ids[3:]
+    assert second["next_after_id"] is None
+    assert _render_clients(f"?q=kset{tag}%25&per_page=3")["total_clients"] == 0
@@ -0,0 +1,70 @@
+import pytest
+from datetime import datetime
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, DeliveredLead, Bounce
+from lead_generation_app import analytics
+
+
+def _seed(tag):
+    s = get_session()
+    try:
+        pf = f"pf{tag}"
+        ls = LeadSource(source_name=f"an_{tag}", industry="x", platform_type=pf, scrape_url="", active_status=True)
+        bc = BusinessClient(business_name=f"An{tag}")
+        s.add_all([ls, bc])
+        s.flush()
+        qls = []
+        for i in range(3):
+            rl = RawLead(name=f"A{i}", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            if i < 2:
+                ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, email=f"Lead{i}.{tag}@Example.com", phone=f"+1555{tag}{i}", score_category="hot", qualification_score=80, summary="", enriched_data_json="{}", verified_status=True)
+                s.add(ql)
+                s.flush()
+                qls.append(ql)
+        now = datetime.utcnow()
+        s.add(DeliveredLead(qualified_lead_id=qls[0].id, business_client_id=bc.id, delivered_at=now, delivery_method="email", opened_status=True))
+        s.add(DeliveredLead(qualified_lead_id=qls[1].id, business_client_id=bc.id, delivered_at=now, delivery_method="email", opened_status=False))
+        s.add(DeliveredLead(qualified_lead_id=qls[0].id, business_client_id=bc.id, delivered_at=now, delivery_method="whatsapp", opened_status=False))
+        s.add(Bounce(method="email", target=f"lead0.{tag}@example.com", reason="hard", created_at=now))
+        s.add(Bounce(method="email", target=f"LEAD0.{tag}@example.com", reason="hard", created_at=now))
+        s.add(Bounce(method="whatsapp", target=f"+1555{tag}0", reason="failed", created_at=now))
+        s.commit()
+        return pf, bc.id
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_grouped_aggregates_match_expected_counts():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    pf, bc_id = _seed(tag)
+    assert analytics.lead_to_qualified_rate_by_platform()[pf] == {"raw": 3, "qualified": 2, "rate": 2 / 3}
+    assert analytics.qualified_to_delivered_rate_by_client_platform()[bc_id] == {pf: {"qualified": 2, "delivered": 3, "rate": 1.5}}
+    assert analytics.delivered_opened_bounced_rates_by_client_platform()[bc_id] == {pf: {
+        "email": {"delivered": 2, "opened": 1, "bounced": 2, "open_rate": 0.5, "bounce_rate": 1.0},
+        "whatsapp": {"delivered": 1, "opened": 0, "bounced": 1, "open_rate": 0.0, "bounce_rate": 1.0},
+    }}
+
+
+@pytest.mark.integration
+def test_snapshot_is_served_until_events_mark_it_stale(monkeypatch):
+    init_db()
+    monkeypatch.setenv("ANALYTICS_SNAPSHOT", "1")
+    monkeypatch.setenv("ANALYTICS_REFRESH_SECONDS", "0")
+    analytics.refresh_snapshot()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    pf, bc_id = _seed(tag)
+
+    data, computed_at = analytics.get_analytics()
+    assert pf not in data["ltq"] and bc_id not in data["qtd"]
+    assert analytics.refresh_if_stale() is False
+
+    analytics.mark_stale()
+    data, refreshed_at = analytics.get_analytics()
+    assert refreshed_at > computed_at
+    assert data["ltq"][pf]["raw"] == 3
+    assert data["dob"][bc_id][pf]["email"]["bounced"] == 2
+    assert analytics.load_snapshot()[2] is False
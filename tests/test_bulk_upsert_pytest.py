@@ -0,0 +1,88 @@
+import os
+import time
+import pytest
+from datetime import datetime
+from sqlalchemy import select, func
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead
+from lead_generation_app.database.bulk import upsert_qualified_leads
+
+
+def _seed_raw(s, n, industry="bulk"):
+    ls = LeadSource(source_name=f"{industry}_src", industry=industry, platform_type="maps", scrape_url="", active_status=True)
+    s.add(ls)
+    s.commit()
+    rows = [RawLead(name=f"R{i}", company_name=f"{industry} Co {i}", email=f"{i}@{industry}.example.com", phone=f"+1{i:07d}", website=f"https://{industry}{i}.example.com", industry=industry, source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}") for i in range(n)]
+    s.add_all(rows)
+    s.commit()
+    return [r.id for r in rows]
+
+
+def _qualified(raw_ids, industry="bulk"):
+    return [{"raw_lead_id": rid, "name": f"R{rid}", "company_name": "C", "phone": None, "email": None, "qualification_score": 60, "score_category": "warm", "industry": industry, "summary": "s", "enriched_data_json": "{}", "verified_status": True} for rid in raw_ids]
+
+
+def _legacy_loop(qualified_data):
+    s = get_session()
+    q_ids = []
+    try:
+        for qd in qualified_data:
+            rl_id = qd.get("raw_lead_id")
+            exists = s.execute(select(QualifiedLead).where(QualifiedLead.raw_lead_id == rl_id)).scalars().first()
+            if exists:
+                q_ids.append(exists.id)
+            else:
+                ql = QualifiedLead(raw_lead_id=rl_id, name=qd.get("name"), company_name=qd.get("company_name"), phone=qd.get("phone"), whatsapp=None, email=qd.get("email"), qualification_score=int(qd.get("qualification_score", 70)), score_category=qd.get("score_category", "warm"), industry=qd.get("industry"), summary=qd.get("summary") or "", enriched_data_json=qd.get("enriched_data_json") or "{}", verified_status=bool(qd.get("verified_status", True)))
+                s.add(ql)
+                s.flush()
+                q_ids.append(ql.id)
+        s.commit()
+        return q_ids
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_upsert_returns_ids_in_input_order():
+    init_db()
+    s = get_session()
+    try:
+        raw_ids = _seed_raw(s, 6)
+    finally:
+        s.close()
+    first = upsert_qualified_leads(_qualified(raw_ids[:3]))
+    assert len(set(first)) == 3 and all(first)
+    mixed = list(reversed(raw_ids))
+    ids = upsert_qualified_leads(_qualified(mixed) + [{"raw_lead_id": None}])
+    assert ids[-1] is None
+    assert ids[3:6] == list(reversed(first))
+    s = get_session()
+    try:
+        by_raw = dict(s.execute(select(QualifiedLead.raw_lead_id, QualifiedLead.id).where(QualifiedLead.raw_lead_id.in_(raw_ids))).all())
+        count = s.execute(select(func.count(QualifiedLead.id)).where(QualifiedLead.raw_lead_id.in_(raw_ids))).scalar_one()
+    finally:
+        s.close()
+    assert count == 6
+    assert ids[:6] == [by_raw[r] for r in mixed]
+
+
+@pytest.mark.performance
+@pytest.mark.skipif(not os.getenv("RUN_PERF"), reason="set RUN_PERF=1 to run benchmarks")
+def test_benchmark_bulk_vs_loop():
+    n = int(os.getenv("BENCH_LEADS", "10000"))
+    init_db()
+    s = get_session()
+    try:
+        loop_raw = _seed_raw(s, n, "bench_loop")
+        bulk_raw = _seed_raw(s, n, "bench_bulk")
+    finally:
+        s.close()
+    t0 = time.perf_counter()
+    loop_ids = _legacy_loop(_qualified(loop_raw, "bench_loop"))
+    t_loop = time.perf_counter() - t0
+    t0 = time.perf_counter()
+    bulk_ids = upsert_qualified_leads(_qualified(bulk_raw, "bench_bulk"))
+    t_bulk = time.perf_counter() - t0
+    print(f"\nqualified upsert n={n} loop={t_loop:.2f}s bulk={t_bulk:.2f}s speedup={t_loop / max(t_bulk, 1e-9):.1f}x")
+    assert len(loop_ids) == len(bulk_ids) == n
+    assert t_bulk < t_loop
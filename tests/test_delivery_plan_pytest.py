@@ -0,0 +1,67 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import event, select, func
+from lead_generation_app.database.database import init_db, get_session, get_engine
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, DeliveredLead, Payment
+from lead_generation_app.delivery import record_deliveries
+from lead_generation_app.delivery.plan import DeliveryPlan
+
+
+def _seed(s, tag, industry, n):
+    ls = LeadSource(source_name=f"plan_{tag}_{industry}", industry=industry, platform_type="maps", scrape_url="", active_status=True)
+    s.add(ls)
+    s.flush()
+    out = []
+    for i in range(n):
+        rl = RawLead(name=f"P{i}", company_name="Plan Co", email=None, phone=None, website=None, industry=industry, source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+        s.add(rl)
+        s.flush()
+        ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, company_name=rl.company_name, phone=None, whatsapp=None, email=None, qualification_score=80, score_category="hot", industry=industry, summary="", enriched_data_json="{}", verified_status=True)
+        s.add(ql)
+        s.flush()
+        out.append(ql)
+    return out
+
+
+@pytest.mark.integration
+def test_plan_loads_quota_state_from_rollup():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        bc = BusinessClient(business_name=f"Plan{tag}", industry="restaurants", email="plan@example.com")
+        s.add(bc)
+        s.flush()
+        now = datetime.utcnow()
+        s.add(Payment(business_client_id=bc.id, plan_name="trial", amount=49, payment_date=now - timedelta(days=1), payment_status="paid"))
+        restaurants = _seed(s, tag, "restaurants", 4)
+        cleaning = _seed(s, tag, "cleaning", 6)
+        record_deliveries(s, [q.id for q in restaurants[:3]], bc.id, "email", delivered_at=now)
+        record_deliveries(s, [q.id for q in cleaning[:5]], bc.id, "whatsapp", delivered_at=now)
+        s.commit()
+        s.refresh(bc)
+
+        statements = []
+        listener = lambda *args: statements.append(args[2])
+        event.listen(get_engine(), "before_cursor_execute", listener)
+        try:
+            dp = DeliveryPlan(s, bc, "email", now=now)
+        finally:
+            event.remove(get_engine(), "before_cursor_execute", listener)
+        # payments, the usage rollup, and the trial-window count
+        assert len(statements) == 3
+        assert dp.active and dp.trial_active and dp.plan is None
+        assert dp.delivered_month == 8
+        assert dp.trial_used == 8
+
+        # The basic tier count starts from the first industry seen (cleaning: 5).
+        assert dp.decide(cleaning[5]) == (None, 0)
+        assert dp.tier_counts == {"basic": 5}
+        dp.reserve(cleaning[5])
+        dp.record(cleaning[5])
+        dp.record(restaurants[0])
+        assert dp.flush() == 1
+        n = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.business_client_id == bc.id)).scalar_one()
+        assert n == 9
+    finally:
+        s.close()
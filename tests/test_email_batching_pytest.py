@@ -0,0 +1,187 @@
+import json
+import threading
+import pytest
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, Bounce, DeliveredLead
+from lead_generation_app.payments import update_subscription
+from lead_generation_app.delivery import email_sender
+from lead_generation_app.delivery.plan import load_quotas
+
+
+class _SendGrid(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    calls = []
+    code = 202
+
+    def do_POST(self):
+        _SendGrid.calls.append(json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0")))))
+        self.send_response(_SendGrid.code)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def sendgrid(monkeypatch):
+    _SendGrid.calls = []
+    _SendGrid.code = 202
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _SendGrid)
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    monkeypatch.setenv("SENDGRID_API_KEY", "k")
+    monkeypatch.setenv("SENDGRID_API_BASE", "http://127.0.0.1:%d" % srv.server_address[1])
+    monkeypatch.setenv("HTTP_RETRIES", "0")
+    try:
+        yield _SendGrid
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+def _seed(client_email, n):
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        bc = BusinessClient(business_name=f"Batch{tag}", industry="restaurants", email=client_email, phone=f"+9{tag[-9:]}", whatsapp=None)
+        ls = LeadSource(source_name=f"batch_{tag}", industry="restaurants", platform_type="maps", scrape_url="", active_status=True)
+        s.add_all([bc, ls])
+        s.commit()
+        ids = []
+        for i in range(n):
+            rl = RawLead(name=f"B{i}", company_name="Batch Co", email=f"b{tag}_{i}@example.com", phone=None, website=None, industry="restaurants", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, company_name=rl.company_name, phone=None, whatsapp=None, email=rl.email, qualification_score=80, score_category="hot", industry="restaurants", summary=f"lead {i}", enriched_data_json="{}", verified_status=True)
+            s.add(ql)
+            s.flush()
+            ids.append(ql.id)
+        s.commit()
+        bc_id = bc.id
+    finally:
+        s.close()
+    update_subscription(bc_id, plan_name="starter", number_of_users=1, payment_status="paid")
+    return bc_id, ids
+
+
+@pytest.mark.unit
+def test_batch_requests_never_repeat_a_recipient():
+    pending = [{"to": t, "summary": str(i)} for i, t in enumerate(["a", "b", "a", "c", "a"])]
+    reqs = list(email_sender._email_requests(pending, "batch", 2))
+    assert sum(len(items) for items, _ in reqs) == 5
+    for items, pers in reqs:
+        tos = [p["to"][0]["email"] for p in pers]
+        assert len(tos) == len(set(tos)) <= 2
+    same = [{"to": "client@example.com", "summary": str(i)} for i in range(20000)]
+    reqs = list(email_sender._email_requests(same, "batch", 1000))
+    assert len(reqs) == 20000 and all(len(items) == 1 for items, _ in reqs)
+    digest = list(email_sender._email_requests(pending, "digest", 1000))
+    assert len(digest) == 1
+    assert digest[0][1][0]["substitutions"]["-summary-"] == "0\n\n2\n\n4"
+
+
+@pytest.mark.unit
+def test_digest_parts_and_requests_respect_size_caps():
+    pending = [{"to": "a", "summary": "x" * 10} for _ in range(25)] + [{"to": "b", "summary": "y" * 10} for _ in range(3)]
+    reqs = list(email_sender._email_requests(pending, "digest", 1000, max_leads=10))
+    parts = [p for _, pers in reqs for p in pers]
+    assert sorted(len(p["substitutions"]["-summary-"].split("\n\n")) for p in parts) == [3, 5, 10, 10]
+    assert sum(len(items) for items, _ in reqs) == 28
+    for items, pers in reqs:
+        tos = [p["to"][0]["email"] for p in pers]
+        assert len(tos) == len(set(tos))
+    reqs = list(email_sender._email_requests(pending, "digest", 1000, max_bytes=50))
+    assert all(len(p["substitutions"]["-summary-"]) <= 50 for _, pers in reqs for p in pers)
+    assert sum(len(items) for items, _ in reqs) == 28
+    many = [{"to": "c%d" % i, "summary": "z" * 100} for i in range(50)]
+    reqs = list(email_sender._email_requests(many, "digest", 1000, max_request_bytes=1500))
+    assert len(reqs) > 1
+    assert all(len(json.dumps(pers)) <= 1500 for _, pers in reqs)
+    assert sum(len(items) for items, _ in reqs) == 50
+
+
+@pytest.mark.integration
+def test_digest_mode_sends_one_request_per_client(sendgrid, monkeypatch):
+    monkeypatch.setenv("EMAIL_DELIVERY_MODE", "digest")
+    bc_id, ids = _seed("digest@example.com", 12)
+    out = email_sender.send_email_leads(qualified_lead_ids=ids, business_client_id=bc_id)
+    assert [x["status"] for x in out] == ["delivered"] * 12
+    assert len(sendgrid.calls) == 1
+    assert len(sendgrid.calls[0]["personalizations"]) == 1
+
+
+@pytest.mark.integration
+def test_batch_mode_digests_client_addressed_leads(sendgrid, monkeypatch):
+    monkeypatch.setenv("EMAIL_DELIVERY_MODE", "batch")
+    monkeypatch.setenv("EMAIL_DIGEST_MAX_LEADS", "5")
+    bc_id, ids = _seed("owner@example.com", 12)
+    out = email_sender.send_email_leads(qualified_lead_ids=ids, business_client_id=bc_id)
+    assert [x["status"] for x in out] == ["delivered"] * 12
+    assert len(sendgrid.calls) == 3
+    assert all(len(c["personalizations"]) == 1 for c in sendgrid.calls)
+
+
+@pytest.mark.integration
+def test_batch_mode_groups_recipients_and_maps_failures(sendgrid, monkeypatch):
+    monkeypatch.setenv("EMAIL_DELIVERY_MODE", "batch")
+    monkeypatch.setenv("EMAIL_BATCH_SIZE", "5")
+    bc_id, ids = _seed("", 12)
+    out = email_sender.send_email_leads(qualified_lead_ids=ids, business_client_id=bc_id)
+    assert len([x for x in out if x["status"] == "delivered"]) == 12
+    assert [len(c["personalizations"]) for c in sendgrid.calls] == [5, 5, 2]
+    sendgrid.calls = []
+    sendgrid.code = 500
+    bc_id, ids = _seed("", 3)
+    out = email_sender.send_email_leads(qualified_lead_ids=ids, business_client_id=bc_id)
+    assert [x["reason"] for x in out] == ["error:HTTP 500"] * 3
+    s = get_session()
+    try:
+        assert s.query(Bounce).filter(Bounce.reason == "error:HTTP 500").count() >= 3
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_failed_batch_releases_reserved_quota(sendgrid, monkeypatch):
+    monkeypatch.setenv("EMAIL_DELIVERY_MODE", "batch")
+    sendgrid.code = 500
+    bc_id, ids = _seed("", 4)
+    s = get_session()
+    try:
+        quota = load_quotas(s, [bc_id])[bc_id]
+    finally:
+        s.close()
+    before = dict(quota.month_by_industry)
+    out = email_sender.send_email_leads(qualified_lead_ids=ids, business_client_id=bc_id, quota=quota)
+    assert [x["status"] for x in out] == ["failed"] * 4
+    assert quota.month_by_industry == before
+
+
+class _Shutdown(BaseException):
+    pass
+
+
+@pytest.mark.integration
+def test_sent_deliveries_are_recorded_when_a_run_stops_early(monkeypatch):
+    monkeypatch.setenv("EMAIL_DELIVERY_MODE", "single")
+    bc_id, ids = _seed("", 4)
+    sent = []
+
+    def send(to, subject, content):
+        if len(sent) == 2:
+            raise _Shutdown()
+        sent.append(to)
+        return {"status": "202"}
+
+    monkeypatch.setattr(email_sender, "_send_email_via_sendgrid", send)
+    with pytest.raises(_Shutdown):
+        email_sender.send_email_leads(qualified_lead_ids=ids, business_client_id=bc_id)
+    s = get_session()
+    try:
+        recorded = s.query(DeliveredLead).filter(DeliveredLead.business_client_id == bc_id).count()
+    finally:
+        s.close()
+    assert recorded == 2
@@ -0,0 +1,61 @@
+import pytest
+from datetime import datetime, timedelta
+from lead_generation_app.database.database import init_db
+from lead_generation_app.metrics import get_cache_metrics
+from lead_generation_app.processing import enrich_cache
+from lead_generation_app.processing.enrich_cache import EnrichmentCacheStore, cache_key
+
+
+@pytest.mark.unit
+def test_cache_key_normalizes_domain():
+    assert cache_key("https://www.Example1.com/") == "example1.com"
+    assert cache_key("http://example1.com") == "example1.com"
+    assert cache_key("example1.com/about/?x=1") == "example1.com/about"
+    assert cache_key("http://example1.com:8080/a") == "example1.com:8080/a"
+    assert cache_key("") is None
+
+
+@pytest.mark.unit
+def test_lru_eviction_and_negative_ttl():
+    c = EnrichmentCacheStore(ttl=3600, negative_ttl=60, max_size=2)
+    c.put("a", (True, 10, ["contact"]))
+    c.put("b", (False, 0, []))
+    assert c.get("a") == (True, 10, ["contact"])
+    c.put("c", (True, 5, []))
+    assert c.get("b") is None
+    assert c.get("a") is not None
+    res, ts = c.entries["c"]
+    c.entries["c"] = (res, ts - timedelta(seconds=120))
+    assert c.get("c") is not None
+    c.put("d", (False, 0, []))
+    res, ts = c.entries["d"]
+    c.entries["d"] = (res, ts - timedelta(seconds=120))
+    assert c.get("d") is None
+    m = get_cache_metrics()["enrichment"]
+    assert m["hits"] >= 3 and m["misses"] >= 2
+
+
+@pytest.mark.integration
+def test_sql_tier_survives_restart():
+    init_db()
+    key = "persist-%s.example.com" % datetime.utcnow().strftime("%H%M%S%f")
+    EnrichmentCacheStore(persist=True).put(key, (True, 42, ["about"]))
+    fresh = EnrichmentCacheStore(persist=True)
+    assert fresh.get(key) == (True, 42, ["about"])
+    assert key in fresh.entries
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("upsert", [True, False])
+def test_sql_tier_store_overwrites_rows_written_elsewhere(monkeypatch, upsert):
+    init_db()
+    if not upsert:
+        monkeypatch.setattr(enrich_cache, "_upsert_stmt", lambda dialect: None)
+    key = "race-%s.example.com" % datetime.utcnow().strftime("%H%M%S%f")
+    other = "other-" + key
+    # Another enricher cached key after this one last read the table.
+    EnrichmentCacheStore(persist=True).put(key, (False, 0, []))
+    EnrichmentCacheStore(persist=True).put_many({key: (True, 7, ["team"]), other: (True, 1, [])})
+    fresh = EnrichmentCacheStore(persist=True)
+    assert fresh.get(key) == (True, 7, ["team"])
+    assert fresh.get(other) == (True, 1, [])
@@ -0,0 +1,58 @@
+import json
+import time
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lead_generation_app.processing.enricher import enrich_leads, enrich_leads_batch
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path == "/slow":
+            time.sleep(2)
+        body = ("<html>contact us, read a review " + ("x" * 20000) + " about</html>").encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    try:
+        yield "127.0.0.1:%d" % srv.server_address[1]
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+@pytest.mark.unit
+def test_batch_matches_single_and_keeps_order(site):
+    leads = [{"website": site + "/a"}, {"website": None}, {"website": "http://" + site + "/b"}]
+    single = [enrich_leads(dict(l)) for l in leads]
+    batch = enrich_leads_batch([dict(l) for l in leads], concurrency=4, per_host=2)
+    assert [b["website"] for b in batch] == [l["website"] for l in leads]
+    for a, b in zip(single, batch):
+        assert a["summary"] == b["summary"]
+        assert a["enriched_data_json"] == b["enriched_data_json"]
+        assert a["verified_status"] == b["verified_status"]
+    data = json.loads(batch[0]["enriched_data_json"])
+    assert data["site_ok"] is True
+    assert data["keywords"] == ["contact", "review"]
+    assert data["content_len"] > 20000
+    assert batch[1]["verified_status"] is False
+
+
+@pytest.mark.unit
+def test_batch_deadline_marks_unfinished(site):
+    start = time.monotonic()
+    out = enrich_leads_batch([{"website": site + "/slow"}, {"website": site + "/fast"}], concurrency=2, deadline_seconds=0.5)
+    assert time.monotonic() - start < 1.5
+    assert out[0]["verified_status"] is False
+    assert out[1]["verified_status"] is True
@@ -0,0 +1,73 @@
+import time
+import pytest
+from datetime import datetime
+from sqlalchemy import event
+from lead_generation_app.database.database import init_db, get_session, get_engine
+from lead_generation_app.database.models import BusinessClient, Payment
+from lead_generation_app.payments import record_payment, update_subscription, is_client_active
+from lead_generation_app import entitlements
+
+
+def _clients(n):
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        rows = [BusinessClient(business_name=f"Ent{tag}_{i}", industry="fitness") for i in range(n)]
+        s.add_all(rows)
+        s.commit()
+        return [bc.id for bc in rows]
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_bulk_lookup_is_cached_and_invalidated_by_payments():
+    ids = _clients(3)
+    statements = []
+    listener = lambda *args: statements.append(args[2])
+    event.listen(get_engine(), "before_cursor_execute", listener)
+    try:
+        ents = entitlements.get_entitlements(ids)
+        assert len(statements) == 2
+        assert entitlements.get_entitlements(ids) == ents
+        assert len(statements) == 2
+    finally:
+        event.remove(get_engine(), "before_cursor_execute", listener)
+    assert not any(e["active"] for e in ents.values())
+
+    record_payment(ids[0], plan_name="trial", amount=49, payment_status="paid")
+    assert is_client_active(ids[0])
+    ent = entitlements.get_entitlement(ids[0])
+    assert ent["trial_start"] is not None and ent["plan"] is None
+
+    update_subscription(ids[1], plan_name="pro", number_of_users=1, payment_status="paid")
+    ent = entitlements.get_entitlement(ids[1])
+    assert (ent["plan"], ent["lead_cap"], ent["discount"], ent["active"]) == ("pro", 150, 0.6, False)
+
+
+@pytest.mark.integration
+def test_direct_writes_are_seen_after_invalidate():
+    cid = _clients(1)[0]
+    assert not is_client_active(cid)
+    s = get_session()
+    try:
+        s.add(Payment(business_client_id=cid, plan_name="ppl", amount=0, payment_date=datetime.utcnow(), payment_status="paid"))
+        s.commit()
+    finally:
+        s.close()
+    assert not is_client_active(cid)
+    entitlements.invalidate([cid])
+    assert is_client_active(cid)
+
+
+@pytest.mark.integration
+def test_other_processes_see_writes_once_the_ttl_expires():
+    cid = _clients(1)[0]
+    # Stands in for the cache of a process that never saw the invalidate.
+    other = entitlements.EntitlementCache(ttl=0.2)
+    assert not other.get_many([cid])[cid]["active"]
+    record_payment(cid, plan_name="ppl", amount=0, payment_status="paid")
+    assert not other.get_many([cid])[cid]["active"]
+    time.sleep(0.3)
+    assert other.get_many([cid])[cid]["active"]
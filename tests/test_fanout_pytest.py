@@ -0,0 +1,58 @@
+import pytest
+from datetime import datetime
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, Payment
+from lead_generation_app.payments import update_subscription
+from lead_generation_app.delivery.fanout import fan_out, match_leads
+
+
+class _C:
+    def __init__(self, id, industry):
+        self.id = id
+        self.industry = industry
+
+
+@pytest.mark.unit
+def test_match_leads_by_industry():
+    leads = [(1, "fitness"), (2, "restaurants"), (3, "fitness")]
+    clients = [_C(10, "fitness"), _C(11, None), _C(12, "legal")]
+    assert match_leads(leads, clients) == {10: [1, 3], 11: [1, 2, 3]}
+
+
+@pytest.mark.integration
+def test_fan_out_delivers_matching_leads_and_shares_quota():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"fanout_{tag}", industry="mixed", platform_type="maps", scrape_url="", active_status=True)
+        ppl = BusinessClient(business_name=f"FanPPL{tag}", industry=f"fit{tag}", email="f@example.com", whatsapp="+15550001")
+        sub = BusinessClient(business_name=f"FanSub{tag}", industry=f"rest{tag}", email="r@example.com", whatsapp="+15550002")
+        idle = BusinessClient(business_name=f"FanIdle{tag}", industry=f"rest{tag}", email="i@example.com", whatsapp="+15550003")
+        s.add_all([ls, ppl, sub, idle])
+        s.flush()
+        s.add(Payment(business_client_id=ppl.id, plan_name="ppl", amount=0, payment_date=datetime.utcnow(), payment_status="paid"))
+        s.add(Payment(business_client_id=sub.id, plan_name="starter", amount=499, payment_date=datetime.utcnow(), payment_status="paid"))
+        ids = {"fit": [], "rest": []}
+        for kind, n in (("fit", 3), ("rest", 40)):
+            for i in range(n):
+                rl = RawLead(name=f"F{i}", company_name="Fan Co", email=None, phone=None, website=None, industry=f"{kind}{tag}", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+                s.add(rl)
+                s.flush()
+                ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, company_name=rl.company_name, phone=None, whatsapp=None, email=None, qualification_score=80, score_category="hot", industry=rl.industry, summary="", enriched_data_json="{}", verified_status=True)
+                s.add(ql)
+                s.flush()
+                ids[kind].append(ql.id)
+        s.commit()
+        ppl_id, sub_id, idle_id = ppl.id, sub.id, idle.id
+    finally:
+        s.close()
+    update_subscription(sub_id, plan_name="starter", number_of_users=1, payment_status="paid")
+
+    results = fan_out(ids["fit"] + ids["rest"], workers=4)
+    assert idle_id not in results
+    assert sorted(x["lead_id"] for x in results[ppl_id] if x["status"] == "delivered") == sorted(ids["fit"] * 2)
+    delivered = [x for x in results[sub_id] if x["status"] == "delivered"]
+    assert {x["lead_id"] for x in delivered} <= set(ids["rest"])
+    # 40 over WhatsApp leaves 10 of the starter cap of 50 for email.
+    assert len(delivered) == 50
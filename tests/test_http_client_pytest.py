@@ -0,0 +1,104 @@
+import json
+import time
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from lead_generation_app.delivery.http_client import HttpTransport
+from lead_generation_app.delivery import email_sender
+
+
+class _Stub(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    peers = set()
+    fail_next = [0]
+    fail_code = [503]
+    bodies = []
+    keys = []
+
+    def do_POST(self):
+        _Stub.peers.add(self.client_address)
+        body = self.rfile.read(int(self.headers.get("Content-Length", "0")))
+        _Stub.bodies.append((self.path, body))
+        _Stub.keys.append(self.headers.get("Idempotency-Key"))
+        if self.path == "/hang":
+            time.sleep(1)
+        code = 202
+        if _Stub.fail_next[0] > 0:
+            _Stub.fail_next[0] -= 1
+            code = _Stub.fail_code[0]
+        self.send_response(code)
+        self.send_header("Content-Length", "2")
+        self.end_headers()
+        self.wfile.write(b"ok")
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def stub():
+    _Stub.peers = set()
+    _Stub.bodies = []
+    _Stub.fail_next = [0]
+    _Stub.fail_code = [503]
+    _Stub.keys = []
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), _Stub)
+    t = threading.Thread(target=srv.serve_forever, daemon=True)
+    t.start()
+    try:
+        yield "http://127.0.0.1:%d" % srv.server_address[1]
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+
+@pytest.mark.unit
+def test_connections_are_reused(stub):
+    tr = HttpTransport(pool_size=2)
+    for _ in range(5):
+        assert tr.request("POST", stub + "/x", body=b"{}")[0] == 202
+    assert tr.opened == 1
+    assert len(_Stub.peers) == 1
+    tr.close()
+
+
+@pytest.mark.unit
+def test_retries_on_503_with_backoff(stub):
+    _Stub.fail_next = [2]
+    tr = HttpTransport(retries=3, backoff=0.01)
+    assert tr.request("POST", stub + "/x", body=b"{}")[0] == 202
+    assert len(_Stub.bodies) == 3
+    _Stub.fail_next = [5]
+    assert HttpTransport(retries=1, backoff=0.01).request("POST", stub + "/x", body=b"{}")[0] == 503
+
+
+@pytest.mark.unit
+@pytest.mark.parametrize("code", [500, 502, 504])
+def test_post_is_not_retried_on_ambiguous_5xx_without_idempotency_key(stub, code):
+    _Stub.fail_code = [code]
+    _Stub.fail_next = [1]
+    tr = HttpTransport(retries=3, backoff=0.01)
+    assert tr.request("POST", stub + "/x", body=b"{}")[0] == code
+    assert len(_Stub.bodies) == 1
+    _Stub.fail_next = [1]
+    assert tr.request("POST", stub + "/x", body=b"{}", idempotency_key="msg-1")[0] == 202
+    assert len(_Stub.bodies) == 3
+    assert _Stub.keys[1:] == ["msg-1", "msg-1"]
+
+
+@pytest.mark.unit
+def test_read_timeout_is_not_retried(stub):
+    tr = HttpTransport(read_timeout=0.2, retries=3, backoff=0.01)
+    with pytest.raises(Exception):
+        tr.request("POST", stub + "/hang", body=b"{}")
+    assert len(_Stub.bodies) == 1
+
+
+@pytest.mark.unit
+def test_sendgrid_sender_uses_transport(stub, monkeypatch):
+    monkeypatch.setenv("SENDGRID_API_KEY", "k")
+    monkeypatch.setenv("SENDGRID_API_BASE", stub)
+    assert email_sender._send_email_via_sendgrid("a@example.com", "Lead", "hi") == {"status": "202"}
+    path, body = _Stub.bodies[-1]
+    assert path == "/v3/mail/send"
+    assert json.loads(body)["personalizations"][0]["to"][0]["email"] == "a@example.com"
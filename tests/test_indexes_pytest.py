@@ -0,0 +1,48 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import inspect, select, func
+from lead_generation_app.database.database import init_db, get_session, get_engine
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, DeliveredLead
+from lead_generation_app.delivery import record_delivery
+
+
+@pytest.mark.integration
+def test_hot_indexes_exist():
+    init_db()
+    insp = inspect(get_engine())
+    names = {t: {i["name"]: i for i in insp.get_indexes(t)} for t in ("qualified_leads", "delivered_leads", "opt_outs", "payments")}
+    assert names["qualified_leads"]["uq_qualified_leads_raw_lead_id"]["unique"]
+    assert names["delivered_leads"]["uq_delivered_leads_lead_client_method"]["unique"]
+    assert "ix_delivered_leads_client_delivered_at" in names["delivered_leads"]
+    assert "ix_qualified_leads_industry_category" in names["qualified_leads"]
+    assert "ix_opt_outs_method_value" in names["opt_outs"]
+    assert "ix_payments_client_status" in names["payments"]
+
+
+@pytest.mark.integration
+def test_record_delivery_dedup_enforced_by_database():
+    init_db()
+    s = get_session()
+    try:
+        ls = LeadSource(source_name="idx_src", industry="restaurants", platform_type="maps", scrape_url="", active_status=True)
+        bc = BusinessClient(business_name="IdxClient", industry="restaurants")
+        s.add_all([ls, bc])
+        s.commit()
+        rl = RawLead(name="N", company_name="C", industry="restaurants", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+        s.add(rl)
+        s.commit()
+        ql = QualifiedLead(raw_lead_id=rl.id, name="N", industry="restaurants", qualification_score=80, score_category="hot")
+        s.add(ql)
+        s.commit()
+        ql_id, bc_id = ql.id, bc.id
+    finally:
+        s.close()
+    first = record_delivery(ql_id, bc_id, "email")
+    again = record_delivery(ql_id, bc_id, "email")
+    assert first is not None and again == first
+    s = get_session()
+    try:
+        n = s.execute(select(func.count(DeliveredLead.id)).where(DeliveredLead.qualified_lead_id == ql_id)).scalar_one()
+    finally:
+        s.close()
+    assert n == 1
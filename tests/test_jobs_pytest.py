@@ -0,0 +1,369 @@
+import time
+import threading
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import delete, update, select
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import JobRecord, DeadLetterJob
+from lead_generation_app import jobs
+
+
+def _drain(backend, n=10):
+    out = []
+    for _ in range(n):
+        j = backend.claim(timeout=0)
+        if j is None:
+            break
+        out.append(j)
+    return out
+
+
+@pytest.mark.unit
+def test_memory_backend_orders_by_priority_and_deduplicates():
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    try:
+        jobs.submit(print, args=["low"])
+        jobs.submit(print, args=["high"], priority=5)
+        assert jobs.submit(print, args=["keyed"], idempotency_key="k1") is not None
+        assert jobs.submit(print, args=["again"], idempotency_key="k1") is None
+        assert [j.args[0] for j in _drain(b)] == ["high", "low", "keyed"]
+    finally:
+        jobs.set_backend(None)
+
+
+@pytest.mark.unit
+def test_worker_runs_registered_handlers_and_dead_letters_failures():
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    seen = []
+    jobs.register_handler("test.record", seen.append)
+
+    def boom():
+        raise RuntimeError("boom")
+
+    w = jobs.Worker(b)
+    w.start()
+    try:
+        jobs.enqueue("test.record", 1)
+        jobs.submit(boom, retries=1, backoff=0)
+        deadline = time.time() + 5
+        while (not seen or not b.dead_letter()) and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        w.stop()
+        w.join()
+        jobs.set_backend(None)
+    assert seen == [1]
+    dead = b.dead_letter()
+    assert len(dead) == 1 and dead[0]["error"] == "boom" and dead[0]["attempts"] == 2
+
+
+def _sql_backend():
+    init_db()
+    s = get_session()
+    try:
+        s.execute(delete(JobRecord))
+        s.execute(delete(DeadLetterJob))
+        s.commit()
+    finally:
+        s.close()
+    return jobs.SqlBackend(lease_seconds=60, poll_interval=0)
+
+
+@pytest.mark.integration
+def test_sql_backend_leases_priorities_and_idempotency():
+    b = _sql_backend()
+    jobs.register_handler("test.sql", print)
+    for priority, key in [(0, None), (9, "dup"), (9, "dup"), (3, None)]:
+        b.put(jobs.Job(args=[priority], job_type="test.sql", priority=priority, idempotency_key=key))
+    claimed = _drain(b)
+    assert [j.args[0] for j in claimed] == [9, 3, 0]
+    assert all(j.attempts == 1 for j in claimed)
+    assert b.claim(timeout=0) is None
+
+    stale = jobs.Job(job_type="test.sql")
+    stale.id, stale.token = claimed[0].id, "other"
+    assert not b.ack(stale)
+    assert b.ack(claimed[0]) and b.ack(claimed[1])
+    # A keyed job keeps deduplicating after it is done.
+    assert not b.put(jobs.Job(job_type="test.sql", idempotency_key="dup"))
+    assert b.depth() == 1
+
+    with pytest.raises(ValueError):
+        b.put(jobs.Job(fn=lambda: None))
+
+
+@pytest.mark.integration
+def test_sql_backend_reclaims_expired_leases_until_max_attempts():
+    b = _sql_backend()
+    b.put(jobs.Job(args=["x"], job_type="test.sql", retries=1))
+    expire = update(JobRecord).values(lease_until=datetime.utcnow() - timedelta(seconds=1))
+    for attempt in (1, 2):
+        job = b.claim(timeout=0)
+        assert job.attempts == attempt
+        s = get_session()
+        try:
+            s.execute(expire)
+            s.commit()
+        finally:
+            s.close()
+    assert b.claim(timeout=0) is None
+    dead = b.dead_letter()
+    assert [(d["job_type"], d["args"], d["attempts"]) for d in dead] == [("test.sql", ["x"], 3)]
+    s = get_session()
+    try:
+        assert s.execute(select(JobRecord.status)).scalars().all() == ["dead"]
+    finally:
+        s.close()
+
+
+@pytest.mark.unit
+def test_retry_policy_caps_and_jitters_delays():
+    p = jobs.RetryPolicy(max_retries=10, base=1, factor=2, max_delay=5, jitter=0.5)
+    for attempt, full in [(1, 1), (2, 2), (3, 4), (4, 5), (9, 5)]:
+        d = p.delay(attempt)
+        assert full * 0.5 <= d <= full
+    assert jobs.RetryPolicy(base=1, jitter=0).delay(3) == 4
+
+
+@pytest.mark.unit
+def test_failed_job_waits_in_delay_heap_without_blocking_the_worker():
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    calls = []
+
+    def flaky():
+        calls.append(("flaky", time.monotonic()))
+        if len(calls) == 1:
+            raise RuntimeError("first try fails")
+
+    jobs.register_handler("test.flaky", flaky)
+    jobs.set_retry_policy("test.flaky", jobs.RetryPolicy(max_retries=2, base=0.3, jitter=0))
+    w = jobs.Worker(b)
+    w.start()
+    try:
+        started = time.monotonic()
+        jobs.enqueue("test.flaky")
+        time.sleep(0.05)
+        jobs.enqueue(lambda: calls.append(("other", time.monotonic())))
+        deadline = time.time() + 5
+        while len(calls) < 3 and time.time() < deadline:
+            time.sleep(0.01)
+    finally:
+        w.stop()
+        w.join()
+        jobs.set_backend(None)
+    assert [c[0] for c in calls] == ["flaky", "other", "flaky"]
+    assert calls[1][1] - started < 0.25
+    assert calls[2][1] - calls[0][1] >= 0.3
+    assert b.dead_letter() == []
+
+
+@pytest.mark.integration
+def test_sql_retry_is_not_claimable_before_its_delay():
+    b = _sql_backend()
+    b.put(jobs.Job(args=["r"], job_type="test.sql"))
+    job = b.claim(timeout=0)
+    assert b.retry(job, RuntimeError("later"), delay=60)
+    assert b.claim(timeout=0) is None
+    s = get_session()
+    try:
+        s.execute(update(JobRecord).values(run_after=datetime.utcnow() - timedelta(seconds=1)))
+        s.commit()
+    finally:
+        s.close()
+    again = b.claim(timeout=0)
+    assert again.id == job.id and again.attempts == 2
+
+
+@pytest.mark.unit
+def test_descriptors_pickle_module_level_handlers_only():
+    import json
+    import pickle
+    jobs.register_handler("test.parse", json.loads)
+    job = jobs.Job(job_type="test.parse", args=["[1, 2]"])
+    desc = pickle.loads(pickle.dumps(jobs.describe(job)))
+    assert desc.target == "json:loads"
+    assert jobs.run_descriptor(desc) == [1, 2]
+    with pytest.raises(ValueError):
+        jobs.describe(jobs.Job(fn=lambda: None))
+    with pytest.raises(ValueError):
+        jobs.describe(jobs.Job(fn=jobs.MemoryBackend().depth))
+
+
+@pytest.mark.unit
+def test_process_routed_jobs_settle_from_the_pool():
+    import json
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    jobs.register_handler("test.parse", json.loads)
+    jobs.set_retry_policy("test.parse", jobs.RetryPolicy(max_retries=0))
+    jobs.set_process_job_types(["test.parse"])
+    executed = []
+    orig_ack = b.ack
+    b.ack = lambda job: executed.append(job.args[0]) or orig_ack(job)
+    w = jobs.Worker(b)
+    w.start()
+    try:
+        jobs.enqueue("test.parse", "[1]")
+        jobs.enqueue("test.parse", "not json")
+        deadline = time.time() + 30
+        while (not executed or not b.dead_letter()) and time.time() < deadline:
+            time.sleep(0.05)
+    finally:
+        w.stop()
+        w.join()
+        jobs.set_process_job_types(None)
+        jobs.set_backend(None)
+    assert executed == ["[1]"]
+    assert "Expecting value" in b.dead_letter()[0]["error"]
+
+
+@pytest.mark.unit
+def test_autoscaler_decisions_follow_depth_latency_and_idleness():
+    a = jobs.Autoscaler(min_workers=1, max_workers=6, target_latency=5, idle_ticks=2)
+    stats = lambda ready, age, workers, busy: {"ready": ready, "delayed": 0, "oldest_age": age, "workers": workers, "busy": busy}
+    assert a.decide(stats(10, 0, 2, 2)) == 6
+    assert a.decide(stats(3, 0, 2, 0)) == 3
+    assert a.decide(stats(1, 1, 2, 0)) == 2
+    assert a.decide(stats(1, 9, 2, 0)) == 3
+    assert a.decide(stats(0, 0, 3, 0)) == 3
+    assert a.decide(stats(0, 0, 3, 0)) == 2
+    assert a.decide(stats(0, 0, 1, 0)) == 1
+    assert a.decide(stats(0, 0, 0, 0)) == 1
+
+
+@pytest.mark.unit
+def test_queue_stats_and_graceful_shrink():
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    release = __import__("threading").Event()
+    finished = []
+
+    def slow():
+        release.wait(5)
+        finished.append(1)
+
+    try:
+        jobs.enqueue(slow)
+        time.sleep(0.05)
+        stats = jobs.queue_stats()
+        assert stats["ready"] == 1 and stats["oldest_age"] >= 0.05 and stats["workers"] == 0
+        a = jobs.Autoscaler(min_workers=0, max_workers=2, target_latency=0, idle_ticks=1, drain_timeout=5)
+        assert a.tick() == 1 and jobs.worker_count() == 1
+        deadline = time.time() + 5
+        while not jobs.queue_stats()["busy"] and time.time() < deadline:
+            time.sleep(0.01)
+        # The only worker is busy, so nothing is drained mid-job.
+        assert a.tick() == 1 and jobs.worker_count() == 1
+        release.set()
+        while jobs.queue_stats()["busy"] and time.time() < deadline:
+            time.sleep(0.01)
+        assert a.tick() == 0 and jobs.worker_count() == 0
+        assert finished == [1]
+    finally:
+        release.set()
+        assert jobs.stop_workers(timeout=5)
+        jobs.set_backend(None)
+
+
+@pytest.mark.integration
+def test_sql_queue_stats_report_ready_delayed_and_age():
+    b = _sql_backend()
+    b.put(jobs.Job(job_type="test.sql"))
+    b.put(jobs.Job(job_type="test.sql"))
+    b.retry(b.claim(timeout=0), RuntimeError("x"), delay=60)
+    s = get_session()
+    try:
+        s.execute(update(JobRecord).where(JobRecord.status == "pending").where(JobRecord.run_after <= datetime.utcnow()).values(run_after=datetime.utcnow() - timedelta(seconds=30)))
+        s.commit()
+    finally:
+        s.close()
+    stats = b.stats()
+    assert (stats["ready"], stats["delayed"]) == (1, 1)
+    assert 29 <= stats["oldest_age"] < 60
+
+
+@pytest.mark.integration
+def test_sql_lease_is_renewed_while_a_long_job_runs():
+    b = _sql_backend()
+    b.lease_seconds, b.heartbeat_interval = 1, 0.2
+    runs = []
+    started = threading.Event()
+
+    def slow():
+        runs.append(1)
+        started.set()
+        time.sleep(2.5)
+
+    jobs.register_handler("test.slow", slow)
+    b.put(jobs.Job(job_type="test.slow", retries=0))
+    w = jobs.Worker(b)
+    w.start()
+    try:
+        assert started.wait(10)
+        # Well past the one-second lease, the running job is still held.
+        time.sleep(1.5)
+        assert b.claim(timeout=0) is None
+    finally:
+        w.stop()
+        w.join()
+    assert runs == [1]
+    assert b.dead_letter() == []
+    assert b.depth() == 0
+
+
+@pytest.mark.integration
+def test_claims_can_skip_job_types():
+    for b in (jobs.MemoryBackend(), _sql_backend()):
+        jobs.register_handler("test.cpu", print)
+        b.put(jobs.Job(args=["cpu"], job_type="test.cpu", priority=5))
+        b.put(jobs.Job(args=["io"], job_type="test.sql"))
+        assert b.claim(timeout=0, skip_types={"test.cpu"}).args == ["io"]
+        assert b.claim(timeout=0, skip_types={"test.cpu"}) is None
+        assert b.claim(timeout=0).args == ["cpu"]
+
+
+@pytest.mark.unit
+def test_worker_leaves_process_jobs_queued_while_the_pool_is_full():
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    ran = []
+    jobs.register_handler("test.io", ran.append)
+    jobs.register_handler("test.cpu", print)
+    jobs.set_process_job_types(["test.cpu"])
+    ex = jobs.get_process_executor()
+    held = 0
+    while ex.reserve():
+        held += 1
+    w = jobs.Worker(b)
+    try:
+        jobs.enqueue("test.cpu", "x")
+        jobs.enqueue("test.io", "y")
+        w.start()
+        deadline = time.time() + 5
+        while not ran and time.time() < deadline:
+            time.sleep(0.01)
+        time.sleep(0.2)
+        assert ran == ["y"]
+        assert b.stats()["ready"] == 1
+    finally:
+        w.stop()
+        w.join()
+        for _ in range(held):
+            ex.release()
+        jobs.set_process_job_types(None)
+        jobs.set_backend(None)
+
+
+@pytest.mark.unit
+def test_call_runs_inline_or_in_the_pool():
+    import json
+    jobs.register_handler("test.parse", json.loads)
+    assert jobs.call("test.parse", "[1, 2]") == [1, 2]
+    jobs.set_process_job_types(["test.parse"])
+    try:
+        assert jobs.call("test.parse", "[3]") == [3]
+    finally:
+        jobs.set_process_job_types(None)
@@ -0,0 +1,59 @@
+import csv
+import io
+import json
+import pytest
+from datetime import datetime
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead
+from lead_generation_app import admin_web
+
+
+def _get(query):
+    with admin_web.app.test_request_context("/admin/api/leads" + query):
+        resp = admin_web.api_leads_list()
+        return resp.status_code, resp.headers.get("Content-Type"), resp.get_data(as_text=True)
+
+
+@pytest.mark.integration
+def test_lead_export_streams_every_format_with_keyset_cursor(monkeypatch):
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    industry = f"export_{tag}"
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"export_{tag}", industry="x", platform_type="maps", scrape_url="", active_status=True)
+        s.add(ls)
+        s.flush()
+        ids = []
+        for i in range(5):
+            rl = RawLead(name=f"E{i}", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            ql = QualifiedLead(raw_lead_id=rl.id, name=f"E{i}, \"quoted\"", industry=industry, score_category="hot", qualification_score=70 + i, summary=None, enriched_data_json="{}", verified_status=i % 2 == 0)
+            s.add(ql)
+            s.flush()
+            ids.append(ql.id)
+        s.commit()
+    finally:
+        s.close()
+    monkeypatch.setenv("LEADS_API_CHUNK", "2")
+    monkeypatch.setenv("LEADS_API_DEFAULT_LIMIT", "3")
+
+    status, ctype, body = _get(f"?industry={industry}")
+    rows = json.loads(body)
+    assert (status, ctype) == (200, "application/json")
+    assert [r["id"] for r in rows] == ids[:3]
+    assert rows[0]["summary"] == "" and rows[0]["verified_status"] is True
+
+    _, ctype, body = _get(f"?industry={industry}&format=ndjson&after_id={rows[-1]['id']}&limit=10")
+    assert ctype == "application/x-ndjson"
+    assert [json.loads(line)["id"] for line in body.splitlines()] == ids[3:]
+
+    _, ctype, body = _get(f"?industry={industry}&format=csv&limit=10&min_score=72")
+    parsed = list(csv.DictReader(io.StringIO(body)))
+    assert ctype == "text/csv"
+    assert [int(r["id"]) for r in parsed] == ids[2:]
+    assert parsed[0]["name"] == "E2, \"quoted\""
+
+    assert json.loads(_get(f"?industry={industry}&after_id={ids[-1]}")[2]) == []
+    assert _get("?format=xml")[0] == 400
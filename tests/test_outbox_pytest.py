@@ -0,0 +1,175 @@
+import time
+import threading
+import pytest
+from datetime import datetime
+from sqlalchemy import delete, select, func
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, Payment, DeliveryOutbox, DeliveredLead
+from lead_generation_app.payments import update_subscription
+from lead_generation_app.delivery import outbox
+from lead_generation_app.delivery.fanout import fan_out
+
+
+@pytest.fixture
+def bc_id():
+    init_db()
+    s = get_session()
+    try:
+        bc = BusinessClient(business_name="Outbox" + datetime.utcnow().strftime("%H%M%S%f"), industry="restaurants", email="o@example.com")
+        s.add(bc)
+        s.commit()
+        client_id = bc.id
+    finally:
+        s.close()
+    yield client_id
+    s = get_session()
+    try:
+        s.execute(delete(DeliveryOutbox).where(DeliveryOutbox.business_client_id == client_id))
+        s.commit()
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_claims_are_exclusive_and_leased(bc_id):
+    assert outbox.enqueue_deliveries([1, 2, 3], [bc_id, bc_id]) == 1
+    assert outbox.enqueue_deliveries([4], [bc_id]) == 1
+    first = outbox.claim_batch(limit=1)
+    second = outbox.claim_batch(limit=10)
+    assert len(first) == 1 and len(second) == 1
+    assert first[0]["id"] != second[0]["id"]
+    assert first[0]["lead_ids"] == [1, 2, 3]
+    assert first[0]["method"] == "whatsapp,email"
+    assert outbox.claim_batch(limit=10) == []
+    assert outbox.complete(first[0])
+    stale = dict(second[0], token="other")
+    assert not outbox.complete(stale)
+    assert outbox.complete(second[0], error="boom", max_attempts=1)
+    s = get_session()
+    try:
+        rows = dict(s.execute(select(DeliveryOutbox.id, DeliveryOutbox.status).where(DeliveryOutbox.business_client_id == bc_id)).all())
+    finally:
+        s.close()
+    assert rows == {first[0]["id"]: "done", second[0]["id"]: "failed"}
+
+
+@pytest.mark.integration
+def test_dispatcher_sends_and_retries(monkeypatch, bc_id):
+    sent = []
+    running = []
+    overlap = []
+    lock = threading.Lock()
+
+    def fake_dispatch(item):
+        with lock:
+            running.append(item["business_client_id"])
+            overlap.append(running.count(item["business_client_id"]) > 1)
+        time.sleep(0.05)
+        with lock:
+            running.remove(item["business_client_id"])
+        sent.append(item["lead_ids"][0])
+        if item["lead_ids"] == [8] and sent.count(8) == 1:
+            raise RuntimeError("provider down")
+
+    monkeypatch.setattr(outbox, "dispatch", fake_dispatch)
+    outbox.enqueue_deliveries([7], [bc_id])
+    outbox.enqueue_deliveries([8], [bc_id])
+    d = outbox.OutboxDispatcher(workers=2, retry_seconds=0)
+    try:
+        assert d.run_once() == 2
+        assert d.run_once() == 1
+        assert d.run_once() == 0
+    finally:
+        d.pool.shutdown()
+    assert sorted(sent) == [7, 8, 8]
+    # Rows of one client never run at the same time.
+    assert not any(overlap)
+
+
+@pytest.mark.integration
+def test_failed_sends_are_retried_and_delivered_ones_skipped(monkeypatch, bc_id):
+    calls = []
+    delivered = set()
+
+    def fake_send(qualified_lead_ids=None, business_client_id=None, quota=None):
+        calls.append(list(qualified_lead_ids))
+        out = []
+        for i in qualified_lead_ids:
+            ok = len(calls) > 1 or i == 11
+            if ok:
+                delivered.add(i)
+            out.append({"lead_id": i, "status": "delivered" if ok else "failed", "reason": None if ok else "error:HTTP 503"})
+        return out
+
+    monkeypatch.setattr(outbox, "send_email_leads", fake_send)
+    # Stands in for the delivered_leads rows the real senders write.
+    monkeypatch.setattr(outbox, "_undelivered", lambda item, method: [i for i in item["lead_ids"] if i not in delivered])
+    outbox.enqueue_deliveries([11, 12], [bc_id], methods=("email",))
+    d = outbox.OutboxDispatcher(workers=1, retry_seconds=0)
+    try:
+        assert d.run_once() == 1
+        s = get_session()
+        try:
+            row = s.execute(select(DeliveryOutbox).where(DeliveryOutbox.business_client_id == bc_id)).scalars().one()
+            assert row.status == "pending" and "1 of 2 sends failed" in row.last_error
+        finally:
+            s.close()
+        assert d.run_once() == 1
+        assert d.run_once() == 0
+    finally:
+        d.pool.shutdown()
+    assert calls == [[11, 12], [12]]
+
+
+def _starter_client(tag, kind, n):
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"outbox_{kind}{tag}", industry=f"{kind}{tag}", platform_type="maps", scrape_url="", active_status=True)
+        bc = BusinessClient(business_name=f"Outbox{kind}{tag}", industry=f"{kind}{tag}", email=f"{kind}@example.com", whatsapp="+15550009")
+        s.add_all([ls, bc])
+        s.flush()
+        s.add(Payment(business_client_id=bc.id, plan_name="starter", amount=499, payment_date=datetime.utcnow(), payment_status="paid"))
+        ids = []
+        for i in range(n):
+            rl = RawLead(name=f"O{i}", company_name="Outbox Co", industry=f"{kind}{tag}", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, company_name=rl.company_name, qualification_score=80, score_category="hot", industry=rl.industry, summary="", enriched_data_json="{}", verified_status=True)
+            s.add(ql)
+            s.flush()
+            ids.append(ql.id)
+        s.commit()
+        bc_id = bc.id
+    finally:
+        s.close()
+    update_subscription(bc_id, plan_name="starter", number_of_users=1, payment_status="paid")
+    return bc_id, ids
+
+
+@pytest.mark.integration
+def test_outbox_and_fan_out_deliver_the_same_under_a_cap():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    direct_id, direct_leads = _starter_client(tag, "direct", 40)
+    queued_id, queued_leads = _starter_client(tag, "queued", 40)
+    fan_out(direct_leads, workers=2)
+    outbox.enqueue_deliveries(queued_leads, [queued_id])
+    d = outbox.OutboxDispatcher(workers=2, retry_seconds=0)
+    try:
+        while d.run_once():
+            pass
+    finally:
+        d.pool.shutdown()
+    s = get_session()
+    try:
+        counts = dict(s.execute(
+            select(DeliveredLead.business_client_id, func.count())
+            .where(DeliveredLead.business_client_id.in_([direct_id, queued_id]))
+            .group_by(DeliveredLead.business_client_id)
+        ).all())
+        s.execute(delete(DeliveryOutbox).where(DeliveryOutbox.business_client_id == queued_id))
+        s.commit()
+    finally:
+        s.close()
+    # 40 over WhatsApp leaves 10 of the starter cap of 50 for email.
+    assert counts == {direct_id: 50, queued_id: 50}
@@ -0,0 +1,81 @@
+import time
+import threading
+import pytest
+from datetime import datetime
+from lead_generation_app import jobs, pipeline
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead
+from lead_generation_app.pipeline import Pipeline
+from lead_generation_app.metrics import get_stage_metrics
+
+
+@pytest.mark.unit
+def test_pipeline_runs_stages_in_order_and_records_timings():
+    p = Pipeline("unit_seq", lambda: list(range(10)), batch_size=4, concurrent=False)
+    p.add_stage("double", lambda b: [x * 2 for x in b])
+    p.add_stage("drop_zero", lambda b: [x for x in b if x])
+    assert p.run() == [x * 2 for x in range(1, 10)]
+    m = get_stage_metrics()["unit_seq"]
+    assert m["source"]["items"] == 10
+    assert m["double"]["calls"] == 3 and m["double"]["items"] == 10
+
+
+@pytest.mark.unit
+def test_pipeline_overlaps_stages_across_batches():
+    active = {"enrich": 0, "deliver": 0}
+    overlap = []
+    lock = threading.Lock()
+
+    def stage(name):
+        def fn(batch):
+            with lock:
+                active[name] += 1
+                if all(active.values()):
+                    overlap.append(True)
+            time.sleep(0.05)
+            with lock:
+                active[name] -= 1
+            return batch
+        return fn
+
+    p = Pipeline("unit_conc", lambda: list(range(8)), batch_size=2, concurrent=True)
+    p.add_stage("enrich", stage("enrich"))
+    p.add_stage("deliver", stage("deliver"))
+    assert sorted(p.run()) == list(range(8))
+    assert overlap
+
+
+@pytest.mark.unit
+def test_pipeline_stage_error_drops_batch_only():
+    def flaky(batch):
+        if 0 in batch:
+            raise RuntimeError("boom")
+        return batch
+
+    p = Pipeline("unit_err", lambda: list(range(6)), batch_size=3, concurrent=True)
+    p.add_stage("flaky", flaky)
+    p.add_stage("noop", lambda b: b)
+    assert sorted(p.run()) == [3, 4, 5]
+
+
+@pytest.mark.integration
+def test_validate_and_qualify_stages_run_in_the_process_pool():
+    init_db()
+    s = get_session()
+    try:
+        ls = LeadSource(source_name="pool_src", industry="pool_ind", platform_type="maps", scrape_url="", active_status=True)
+        s.add(ls)
+        s.flush()
+        rows = [RawLead(name=f"P{i}", company_name=f"Pool Co {i}", email=(f"p{i}@example.com" if i % 2 else "bad"), phone="+15550100", website=None, industry="pool_ind", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}") for i in range(4)]
+        s.add_all(rows)
+        s.commit()
+        items = [{"raw_lead_id": r.id} for r in rows]
+    finally:
+        s.close()
+    inline = pipeline._qualify(pipeline._validate(items))
+    assert [q["email"] for q in inline] == [None, "p1@example.com", None, "p3@example.com"]
+    jobs.set_process_job_types(["validator.validate_batch", "qualifier.score_batch"])
+    try:
+        assert pipeline._qualify(pipeline._validate(items)) == inline
+    finally:
+        jobs.set_process_job_types(None)
@@ -0,0 +1,112 @@
+import json
+import random
+import pytest
+from sqlalchemy import event
+from lead_generation_app.database.database import init_db, get_session, get_engine
+from lead_generation_app.database.models import IndustryRule
+from lead_generation_app.processing import qualifier
+
+
+RULES = [
+    {},
+    {"weights": {"email": 40, "keyword": 10}, "thresholds": {"hot": 60, "warm": 30}, "keywords": ["Pizza", "pizzeria", "", "cafe", "pizza"]},
+    {"weights": {"phone": 50, "website": 60}, "keywords": ["a.b", "(x)"]},
+]
+
+
+def _leads(n, seed=7):
+    rnd = random.Random(seed)
+    words = ["Pizzeria", "Cafe", "Gym", "a.b", "(x)", "Best", "PIZZA"]
+    out = []
+    for i in range(n):
+        out.append({
+            "email": "e@x.com" if rnd.random() < 0.5 else None,
+            "phone": "+1555" if rnd.random() < 0.5 else None,
+            "website": "x.com" if rnd.random() < 0.5 else None,
+            "company_name": " ".join(rnd.sample(words, rnd.randint(0, 3))) or None,
+            "name": rnd.choice([None, "cafe owner", "Joe"]),
+        })
+    return out
+
+
+@pytest.mark.unit
+def test_compiled_rules_match_reference_score():
+    for rules in RULES:
+        compiled = qualifier._CompiledRules(rules)
+        for lead in _leads(300):
+            assert compiled.score(lead) == qualifier._score(lead, rules)
+
+
+@pytest.mark.integration
+def test_qualify_leads_uses_cached_rules_without_queries():
+    init_db()
+    s = get_session()
+    try:
+        s.add(IndustryRule(industry="qualifier_test_ind", scoring_rules=json.dumps(RULES[1])))
+        s.commit()
+    finally:
+        s.close()
+    qualifier.invalidate_rules_cache()
+    leads = [dict(l, industry="qualifier_test_ind", raw_lead_id=i) for i, l in enumerate(_leads(50))]
+    qualifier.qualify_leads(leads[:1])
+    statements = []
+
+    def count(*args, **kwargs):
+        statements.append(1)
+
+    eng = get_engine()
+    event.listen(eng, "before_cursor_execute", count)
+    try:
+        out = qualifier.qualify_leads(leads)
+    finally:
+        event.remove(eng, "before_cursor_execute", count)
+    assert statements == []
+    ref = {}
+    for l in leads:
+        key = ((l.get("email") or "").strip().lower(), (l.get("phone") or "").strip(), (l.get("company_name") or "").strip().lower())
+        ref.setdefault(key, qualifier._score(l, RULES[1]))
+    assert [(o["qualification_score"], o["score_category"]) for o in out] == list(ref.values())
+
+
+@pytest.mark.unit
+def test_compiled_rules_match_reference_score_with_random_fractional_weights():
+    rnd = random.Random(5)
+    words = ["pizza", "cafe", "gym", "a.b", "(x)", "bar"]
+    for seed in range(50):
+        rules = {
+            "weights": {k: rnd.choice([0, 1, 0.1, 0.3, 1 / 3, 12.5, 33.35, rnd.uniform(0, 40)]) for k in ("email", "phone", "website", "keyword")},
+            "thresholds": {"hot": rnd.randint(20, 90), "warm": rnd.randint(0, 40)},
+            "keywords": rnd.sample(words, rnd.randint(0, len(words))),
+        }
+        compiled = qualifier._CompiledRules(rules)
+        for lead in _leads(200, seed=seed):
+            assert compiled.score(lead) == qualifier._score(lead, rules)
+
+
+@pytest.mark.integration
+def test_rescore_qualified_leads_applies_current_rules():
+    from datetime import datetime
+    from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead
+    init_db()
+    s = get_session()
+    try:
+        s.add(IndustryRule(industry="rescore_ind", scoring_rules=json.dumps({"weights": {"email": 80}, "keywords": ["cafe"]})))
+        ls = LeadSource(source_name="rescore_src", industry="rescore_ind", platform_type="maps", scrape_url="", active_status=True)
+        s.add(ls)
+        s.flush()
+        rl = RawLead(name="Ann", company_name="Cafe Ann", email="a@x.com", phone=None, website="cafe.example.com", industry="rescore_ind", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+        s.add(rl)
+        s.flush()
+        ql = QualifiedLead(raw_lead_id=rl.id, name="Ann", company_name="Cafe Ann", email="a@x.com", phone=None, qualification_score=10, score_category="cold", industry="rescore_ind", summary="", enriched_data_json="{}", verified_status=True)
+        s.add(ql)
+        s.commit()
+        ql_id = ql.id
+    finally:
+        s.close()
+    assert qualifier.rescore_qualified_leads(industry="rescore_ind", batch_size=1) == 1
+    s = get_session()
+    try:
+        row = s.get(QualifiedLead, ql_id)
+        assert (row.qualification_score, row.score_category) == (100, "hot")
+    finally:
+        s.close()
@@ -0,0 +1,81 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import select, func
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead
+from lead_generation_app import requalify
+
+
+@pytest.mark.integration
+def test_requalify_streams_batches_and_resumes(monkeypatch):
+    init_db()
+    s = get_session()
+    try:
+        ls = LeadSource(source_name="requalify_src", industry="requalify_ind", platform_type="maps", scrape_url="", active_status=True)
+        s.add(ls)
+        s.commit()
+        rows = [RawLead(name=f"RQ{i}", company_name=f"RQ Co {i}", email=f"rq{i}@example.com", phone=f"+1{i:07d}", website=None, industry="requalify_ind", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}") for i in range(7)]
+        s.add_all(rows)
+        s.commit()
+        ids = [r.id for r in rows]
+        s.add(QualifiedLead(raw_lead_id=ids[0], name="stale", qualification_score=1, score_category="cold", industry="requalify_ind", summary="", enriched_data_json="{}", verified_status=True))
+        s.commit()
+    finally:
+        s.close()
+    requalify.save_checkpoint("requalify_test", ids[0] - 1)
+    seen = []
+    real_batch = requalify._raw_batch
+
+    def spy(after_id, batch_size):
+        out = real_batch(after_id, batch_size)
+        seen.append(len(out))
+        if len(seen) == 2:
+            raise RuntimeError("interrupted")
+        return out
+
+    monkeypatch.setattr(requalify, "_raw_batch", spy)
+    with pytest.raises(RuntimeError):
+        requalify.run_requalify(batch_size=3, enrich=False, checkpoint="requalify_test")
+    assert requalify.get_checkpoint("requalify_test") == ids[2]
+    monkeypatch.setattr(requalify, "_raw_batch", real_batch)
+    out = requalify.run_requalify(batch_size=3, enrich=False, checkpoint="requalify_test")
+    assert out["processed"] >= 4
+    assert requalify.get_checkpoint("requalify_test") == 0
+    s = get_session()
+    try:
+        count = s.execute(select(func.count(QualifiedLead.id)).where(QualifiedLead.raw_lead_id.in_(ids))).scalar_one()
+        first = s.execute(select(QualifiedLead).where(QualifiedLead.raw_lead_id == ids[0])).scalars().first()
+    finally:
+        s.close()
+    assert count == 7
+    assert first.name == "RQ0"
+    assert first.qualification_score == 55
+
+
+@pytest.mark.integration
+def test_no_enrich_keeps_stored_enrichment():
+    init_db()
+    s = get_session()
+    try:
+        ls = LeadSource(source_name="requalify_keep_src", industry="requalify_ind", platform_type="maps", scrape_url="", active_status=True)
+        s.add(ls)
+        s.commit()
+        raw = RawLead(name="RQK", company_name="RQK Co", email="rqk@example.com", phone="+19990000", website=None, industry="requalify_ind", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+        s.add(raw)
+        s.commit()
+        s.add(QualifiedLead(raw_lead_id=raw.id, name="old", qualification_score=1, score_category="cold", industry="requalify_ind", summary="Family bakery", enriched_data_json='{"site_ok": true}', verified_status=True))
+        s.commit()
+        raw_id = raw.id
+    finally:
+        s.close()
+    requalify.save_checkpoint("requalify_keep_test", raw_id - 1)
+    requalify.run_requalify(batch_size=10, enrich=False, checkpoint="requalify_keep_test")
+    s = get_session()
+    try:
+        row = s.execute(select(QualifiedLead).where(QualifiedLead.raw_lead_id == raw_id)).scalars().first()
+    finally:
+        s.close()
+    assert row.name == "RQK" and row.qualification_score == 55
+    assert row.summary == "Family bakery"
+    assert row.enriched_data_json == '{"site_ok": true}'
+    assert row.verified_status is True
@@ -0,0 +1,124 @@
+import uuid
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import delete, select
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import ScheduleState
+from lead_generation_app import jobs
+from lead_generation_app.scheduler import Scheduler, IntervalTrigger, CronTrigger, make_trigger
+
+
+def _run_queued(backend):
+    out = []
+    while True:
+        j = backend.claim(timeout=0)
+        if j is None:
+            return out
+        out.append(jobs._resolve(j)(*j.args, **j.kwargs))
+        backend.ack(j)
+
+
+def _state(name):
+    s = get_session()
+    try:
+        return s.execute(select(ScheduleState).where(ScheduleState.name == name)).scalars().first()
+    finally:
+        s.close()
+
+
+@pytest.fixture
+def sched_env():
+    init_db()
+    b = jobs.MemoryBackend()
+    jobs.set_backend(b)
+    name = "test.%s" % uuid.uuid4().hex[:8]
+    calls = []
+    jobs.register_handler(name, lambda: calls.append(1) or len(calls))
+    yield b, name, calls
+    jobs.set_backend(None)
+    s = get_session()
+    try:
+        s.execute(delete(ScheduleState).where(ScheduleState.name == name))
+        s.commit()
+    finally:
+        s.close()
+
+
+@pytest.mark.unit
+def test_interval_trigger_is_fixed_rate():
+    t = IntervalTrigger(600, anchor=datetime(2026, 1, 1))
+    assert t.next_after(datetime(2026, 1, 1, 0, 0, 0)) == datetime(2026, 1, 1, 0, 10)
+    # A run that finished late does not push the next slot back.
+    assert t.next_after(datetime(2026, 1, 1, 0, 17, 42)) == datetime(2026, 1, 1, 0, 20)
+
+
+@pytest.mark.unit
+def test_cron_trigger_steps_lists_and_weekdays():
+    assert CronTrigger("*/15 * * * *").next_after(datetime(2026, 3, 2, 10, 7, 30)) == datetime(2026, 3, 2, 10, 15)
+    # 2026-03-02 is a Monday; next Monday 03:00 is a week later.
+    assert CronTrigger("0 3 * * 1").next_after(datetime(2026, 3, 2, 3, 0)) == datetime(2026, 3, 9, 3, 0)
+    assert CronTrigger("30 9,17 1 * *").next_after(datetime(2026, 12, 1, 18, 0)) == datetime(2027, 1, 1, 9, 30)
+    with pytest.raises(ValueError):
+        CronTrigger("61 * * * *")
+    assert isinstance(make_trigger(3600, None), IntervalTrigger)
+    assert isinstance(make_trigger(3600, "0 * * * *"), CronTrigger)
+
+
+@pytest.mark.integration
+def test_slot_fires_once_across_schedulers_and_skips_while_running(sched_env):
+    b, name, calls = sched_env
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    trigger = IntervalTrigger(60, anchor=t0)
+    a, other = Scheduler(), Scheduler()
+    a.add(name, name, trigger)
+    other.add(name, name, trigger)
+    a.schedules[name].next_slot = other.schedules[name].next_slot = t0
+    assert a.tick(now=t0 + timedelta(seconds=1)) == [name]
+    assert other.tick(now=t0 + timedelta(seconds=2)) == []
+    assert a.schedules[name].next_slot == t0 + timedelta(seconds=60)
+    # The first run is still queued when the next slot comes due: skipped.
+    assert a.tick(now=t0 + timedelta(seconds=61)) == []
+    assert _run_queued(b) == [1]
+    st = _state(name)
+    assert st.inflight_since is None and st.last_status == "ok" and st.last_run_at == t0
+    assert a.tick(now=t0 + timedelta(seconds=121)) == [name]
+    assert _run_queued(b) == [2]
+    assert a.next_runs()[name] == t0 + timedelta(seconds=180)
+    assert _state(name).next_run_at == t0 + timedelta(seconds=180)
+
+
+@pytest.mark.integration
+def test_coalesce_queues_one_catch_up_run(sched_env):
+    b, name, calls = sched_env
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    sch = Scheduler()
+    sch.add(name, name, IntervalTrigger(60, anchor=t0), overlap="coalesce")
+    sch.schedules[name].next_slot = t0
+    assert sch.tick(now=t0) == [name]
+    assert sch.tick(now=t0 + timedelta(seconds=60)) == []
+    assert sch.tick(now=t0 + timedelta(seconds=120)) == []
+    assert _state(name).pending is True
+    assert _run_queued(b) == [1]
+    assert sch.tick(now=t0 + timedelta(seconds=125)) == [name]
+    assert sch.tick(now=t0 + timedelta(seconds=130)) == []
+    assert _run_queued(b) == [2]
+    assert _state(name).pending is False
+
+
+@pytest.mark.integration
+def test_restart_resumes_from_last_slot_and_collapses_missed_ones(sched_env):
+    b, name, calls = sched_env
+    t0 = datetime(2026, 1, 1, 12, 0, 0)
+    trigger = IntervalTrigger(60, anchor=t0)
+    first = Scheduler()
+    first.add(name, name, trigger)
+    first.schedules[name].next_slot = t0
+    first.tick(now=t0)
+    _run_queued(b)
+    restarted = Scheduler()
+    restarted.add(name, name, trigger)
+    assert restarted.schedules[name].next_slot == t0 + timedelta(seconds=60)
+    # Ten slots were missed while nothing ran: one run, then back on the grid.
+    assert restarted.tick(now=t0 + timedelta(seconds=630)) == [name]
+    assert restarted.schedules[name].next_slot == t0 + timedelta(seconds=660)
+    assert _run_queued(b) == [2]
@@ -0,0 +1,67 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import delete
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import OptOut
+from lead_generation_app.delivery import suppression
+from lead_generation_app.delivery.suppression import BloomFilter, load_suppressed
+
+
+@pytest.mark.unit
+def test_bloom_filter_has_no_false_negatives():
+    bf = BloomFilter(1000)
+    values = [f"+1{i:07d}" for i in range(1000)]
+    for v in values:
+        bf.add(v)
+    assert all(v in bf for v in values)
+    fp = sum(1 for i in range(1000, 11000) if f"+1{i:07d}" in bf)
+    assert fp < 300
+
+
+@pytest.mark.integration
+@pytest.mark.parametrize("bloom", ["0", "1"])
+def test_load_suppressed_returns_opted_out_subset(monkeypatch, bloom):
+    monkeypatch.setenv("SUPPRESSION_BLOOM", bloom)
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f") + bloom
+    s = get_session()
+    try:
+        opted = [f"sup{tag}_{i}@example.com" for i in range(3)]
+        s.add_all([OptOut(method="email", value=v, created_at=datetime.utcnow()) for v in opted])
+        s.commit()
+        candidates = opted + [f"keep{tag}_{i}@example.com" for i in range(1200)] + [None, ""]
+        assert load_suppressed(s, "email", candidates) == set(opted)
+        assert load_suppressed(s, "whatsapp", candidates) == set()
+        late = f"late{tag}@example.com"
+        s.add(OptOut(method="email", value=late, created_at=datetime.utcnow()))
+        s.commit()
+        assert late in load_suppressed(s, "email", [late])
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_bloom_picks_up_opt_outs_committed_out_of_id_order(monkeypatch):
+    monkeypatch.setenv("SUPPRESSION_BLOOM", "1")
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    method = "ooo" + tag
+    s = get_session()
+    try:
+        placeholder = OptOut(method=method, value="placeholder", created_at=datetime.utcnow())
+        s.add(placeholder)
+        s.commit()
+        low_id = placeholder.id
+        s.add(OptOut(method=method, value="first" + tag, created_at=datetime.utcnow()))
+        s.flush()
+        s.execute(delete(OptOut).where(OptOut.id == low_id))
+        s.commit()
+        assert load_suppressed(s, method, ["first" + tag]) == {"first" + tag}
+        assert suppression._index_for(method).last_id > low_id
+        # A transaction that took its id earlier commits only now.
+        late = "late" + tag
+        s.add(OptOut(id=low_id, method=method, value=late, created_at=datetime.utcnow()))
+        s.commit()
+        assert load_suppressed(s, method, [late]) == {late}
+    finally:
+        s.close()
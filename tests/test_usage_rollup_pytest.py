@@ -0,0 +1,151 @@
+import pytest
+from datetime import datetime
+from sqlalchemy import select
+from lead_generation_app.database import usage
+from lead_generation_app.database.database import init_db, get_session
+from lead_generation_app.database.models import LeadSource, RawLead, QualifiedLead, BusinessClient, DeliveredLead
+from lead_generation_app.database.usage import month_usage, month_usage_by_industry, rebuild_usage
+from lead_generation_app.delivery import record_delivery, record_deliveries
+from lead_generation_app.webhooks import handle_sendgrid_events, _mark_opened
+
+
+@pytest.mark.integration
+def test_rollup_tracks_deliveries_and_opens_and_matches_rebuild():
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"usage_{tag}", industry="x", platform_type="maps", scrape_url="", active_status=True)
+        bc = BusinessClient(business_name=f"Usage{tag}")
+        s.add_all([ls, bc])
+        s.flush()
+        ids = []
+        for i, industry in enumerate(["fitness", "fitness", "legal", None]):
+            rl = RawLead(name=f"U{i}", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, email=f"u{tag}_{i}@example.com", industry=industry, score_category="hot", qualification_score=80, summary="", enriched_data_json="{}", verified_status=True)
+            s.add(ql)
+            s.flush()
+            ids.append(ql.id)
+        s.commit()
+        bc_id = bc.id
+    finally:
+        s.close()
+
+    record_delivery(ids[0], bc_id, "email")
+    record_delivery(ids[0], bc_id, "email")
+    s = get_session()
+    try:
+        assert record_deliveries(s, ids, bc_id, "email") == 3
+        s.commit()
+    finally:
+        s.close()
+    handle_sendgrid_events([{"email": f"u{tag}_1@example.com", "event": "open"}, {"email": f"u{tag}_1@example.com", "event": "delivered"}])
+
+    s = get_session()
+    try:
+        incremental = (month_usage(s, [bc_id]), month_usage_by_industry(s, [bc_id]))
+        assert incremental == ({bc_id: (4, 1)}, {bc_id: {"fitness": 2, "legal": 1, None: 1}})
+    finally:
+        s.close()
+    rebuild_usage(month=datetime.utcnow())
+    s = get_session()
+    try:
+        assert (month_usage(s, [bc_id]), month_usage_by_industry(s, [bc_id])) == incremental
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_record_deliveries_without_returning_counts_only_new_rows(monkeypatch):
+    init_db()
+    tag = datetime.utcnow().strftime("%H%M%S%f")
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"usage_{tag}", industry="x", platform_type="maps", scrape_url="", active_status=True)
+        bc = BusinessClient(business_name=f"Usage{tag}")
+        s.add_all([ls, bc])
+        s.flush()
+        ids = []
+        for i in range(3):
+            rl = RawLead(name=f"U{i}", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+            s.add(rl)
+            s.flush()
+            ql = QualifiedLead(raw_lead_id=rl.id, name=rl.name, email=f"r{tag}_{i}@example.com", industry="fitness", score_category="hot", qualification_score=80, summary="", enriched_data_json="{}", verified_status=True)
+            s.add(ql)
+            s.flush()
+            ids.append(ql.id)
+        s.commit()
+        bc_id = bc.id
+    finally:
+        s.close()
+    record_delivery(ids[0], bc_id, "email")
+    s = get_session()
+    try:
+        monkeypatch.setattr(s.get_bind().dialect, "insert_executemany_returning", False)
+        assert record_deliveries(s, ids, bc_id, "email") == 2
+        assert record_deliveries(s, ids, bc_id, "email") == 0
+        s.commit()
+        assert month_usage(s, [bc_id]) == {bc_id: (3, 0)}
+    finally:
+        s.close()
+
+
+def _seed_delivery(tag):
+    init_db()
+    s = get_session()
+    try:
+        ls = LeadSource(source_name=f"usage_{tag}", industry="x", platform_type="maps", scrape_url="", active_status=True)
+        bc = BusinessClient(business_name=f"Usage{tag}")
+        s.add_all([ls, bc])
+        s.flush()
+        rl = RawLead(name="U", source_id=ls.id, captured_at=datetime.utcnow(), raw_data_json="{}")
+        s.add(rl)
+        s.flush()
+        ql = QualifiedLead(raw_lead_id=rl.id, name="U", email=f"u{tag}@example.com", industry="fitness", score_category="hot", qualification_score=80, summary="", enriched_data_json="{}", verified_status=True)
+        s.add(ql)
+        s.commit()
+        ql_id, bc_id = ql.id, bc.id
+    finally:
+        s.close()
+    record_delivery(ql_id, bc_id, "email")
+    return bc_id
+
+
+@pytest.mark.integration
+def test_portable_fallback_without_on_conflict(monkeypatch):
+    tag = "p" + datetime.utcnow().strftime("%H%M%S%f")
+    bc_id = _seed_delivery(tag)
+    monkeypatch.setattr(usage, "_upsert_stmt", lambda dialect: None)
+    s = get_session()
+    try:
+        now = datetime.utcnow()
+        usage.add_usage(s, [(bc_id, now, "fitness", 2, 1), (bc_id, now, "legal", 1, 0)])
+        s.commit()
+        assert month_usage_by_industry(s, [bc_id]) == {bc_id: {"fitness": 3, "legal": 1}}
+        assert month_usage(s, [bc_id]) == {bc_id: (4, 1)}
+    finally:
+        s.close()
+
+
+@pytest.mark.integration
+def test_concurrent_open_events_count_once():
+    tag = "o" + datetime.utcnow().strftime("%H%M%S%f")
+    bc_id = _seed_delivery(tag)
+    email = f"u{tag}@example.com"
+    other = get_session()
+    try:
+        # A second handler has already read the delivery as unopened.
+        ql = other.execute(select(QualifiedLead).where(QualifiedLead.email == email)).scalars().first()
+        stale = other.execute(select(DeliveredLead).where(DeliveredLead.qualified_lead_id == ql.id)).scalars().first()
+        assert not stale.opened_status
+        handle_sendgrid_events([{"email": email, "event": "open"}])
+        assert _mark_opened(other, "email", email)
+    finally:
+        other.close()
+    s = get_session()
+    try:
+        assert month_usage(s, [bc_id]) == {bc_id: (1, 1)}
+    finally:
+        s.close()